@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""
+Throughput and memory benchmark of checkrs_linkto.bot.bot() crawling synthetic sites
+served from a local HTTP server.
+Every site is crawled with each of the worker counts, the serial crawl with one worker
+is the baseline the speedup of the concurrent crawls is measured against.
+Every crawl runs in a fresh process, so its peak RSS isn't mixed up with the server or earlier crawls.
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+from synthetic_site import TOPOLOGIES, SyntheticSite, SyntheticSiteServer
+
+
+def peak_rss_bytes(who):
+    import resource
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def crawl(url, bot_options, results):
+    """
+    Crawl a site, this runs in its own process
+    :return: None, the measurements are put in the results queue
+    """
+
+    import resource
+    from checkrs_linkto.bot import bot
+
+    start = time.perf_counter()
+    history = bot(url, **bot_options)
+    elapsed = time.perf_counter() - start
+
+    status_errors = sum(1 for url in history if (history[url]["response_code"] or 0) >= 400)
+    results.put(dict(
+        seconds=elapsed,
+        urls=len(history),
+        status_errors=status_errors,
+        peak_rss_bytes=peak_rss_bytes(resource.RUSAGE_SELF),
+        parse_workers_peak_rss_bytes=peak_rss_bytes(resource.RUSAGE_CHILDREN)
+    ))
+
+
+def run_crawl(site, latency, bot_options):
+    """
+    Serve a site and crawl it in a new process
+    :return: dictionary with the measurements
+    """
+
+    server = SyntheticSiteServer(site, latency).start()
+    try:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        p = context.Process(target=crawl, args=(server.url, bot_options, results))
+        p.start()
+        result = results.get()
+        p.join()
+    finally:
+        server.stop()
+
+    result["requests"] = server.requests
+    result["pages_per_second"] = result["urls"] / result["seconds"]
+    result["requests_per_second"] = server.requests / result["seconds"]
+    return result
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--pages",
+        help="comma separated list of the number of pages on each synthetic site",
+        action="store",
+        dest="pages",
+        default="2000",
+        type=str)
+
+    command_parser.add_argument(
+        "--topologies",
+        help=f"comma separated list of site topologies, out of {TOPOLOGIES}",
+        action="store",
+        dest="topologies",
+        default=",".join(TOPOLOGIES),
+        type=str)
+
+    command_parser.add_argument(
+        "--branching",
+        help="number of children of every page of a tree site",
+        action="store",
+        dest="branching",
+        default=4,
+        type=int)
+
+    command_parser.add_argument(
+        "--links-per-page",
+        help="number of links on every page of a nav site",
+        action="store",
+        dest="links_per_page",
+        default=40,
+        type=int)
+
+    command_parser.add_argument(
+        "--nav-links",
+        help="number of links in the navigation bar shared by every page of a nav site",
+        action="store",
+        dest="nav_links",
+        default=30,
+        type=int)
+
+    command_parser.add_argument(
+        "--fragment-ratio",
+        help="fraction of the links that point to a section of a page",
+        action="store",
+        dest="fragment_ratio",
+        default=0.2,
+        type=float)
+
+    command_parser.add_argument(
+        "--broken-ratio",
+        help="fraction of the links that point to pages that don't exist",
+        action="store",
+        dest="broken_ratio",
+        default=0.01,
+        type=float)
+
+    command_parser.add_argument(
+        "--slow-ratio",
+        help="fraction of the pages that take slow-latency seconds longer to answer",
+        action="store",
+        dest="slow_ratio",
+        default=0.0,
+        type=float)
+
+    command_parser.add_argument(
+        "--slow-latency",
+        help="extra seconds slow pages take to answer",
+        action="store",
+        dest="slow_latency",
+        default=0.5,
+        type=float)
+
+    command_parser.add_argument(
+        "--latency",
+        help="seconds the server waits before answering every request",
+        action="store",
+        dest="latency",
+        default=0.005,
+        type=float)
+
+    command_parser.add_argument(
+        "--workers",
+        help="comma separated list of the number of urls the bot visits at the same time,"
+             " the first one is the baseline for the speedup of the others",
+        action="store",
+        dest="workers",
+        default="1,8",
+        type=str)
+
+    command_parser.add_argument(
+        "--parse-workers",
+        help="number of processes the bot parses pages in",
+        action="store",
+        dest="parse_workers",
+        default=0,
+        type=int)
+
+    command_parser.add_argument(
+        "--fetch-mode",
+        help="how the bot requests urls",
+        action="store",
+        dest="fetch_mode",
+        choices=["head", "get"],
+        default="get",
+        type=str)
+
+    command_parser.add_argument(
+        "--seed",
+        help="seed for the random links",
+        action="store",
+        dest="seed",
+        default=0,
+        type=int)
+
+    command_parser.add_argument(
+        "--json",
+        help="print the results as json",
+        action="store_true",
+        dest="json")
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    worker_counts = [int(x) for x in options.workers.split(",")]
+
+    results = list()
+    for topology in options.topologies.split(","):
+        for pages in [int(x) for x in options.pages.split(",")]:
+            site = SyntheticSite(
+                pages=pages,
+                topology=topology,
+                branching=options.branching,
+                nav_links=options.nav_links,
+                links_per_page=options.links_per_page,
+                fragment_ratio=options.fragment_ratio,
+                broken_ratio=options.broken_ratio,
+                slow_ratio=options.slow_ratio,
+                slow_latency=options.slow_latency,
+                seed=options.seed
+            )
+
+            baseline = None
+            for workers in worker_counts:
+                bot_options = dict(
+                    crawl_delay=0,
+                    workers=workers,
+                    parse_workers=options.parse_workers,
+                    fetch_mode=options.fetch_mode
+                )
+
+                result = dict(topology=topology, pages=pages, latency=options.latency)
+                result.update(bot_options)
+                result.update(run_crawl(site, options.latency, bot_options))
+
+                if baseline is None:
+                    baseline = result
+                result["baseline_workers"] = baseline["workers"]
+                result["speedup"] = result["pages_per_second"] / baseline["pages_per_second"]
+                results.append(result)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                f"topology: {r['topology']:<5} pages: {r['pages']:>7}  workers: {r['workers']:>3}  "
+                f"urls: {r['urls']:>8}  time: {r['seconds']:.1f}s  urls/sec: {r['pages_per_second']:8.1f}  "
+                f"speedup: {r['speedup']:5.2f}x  "
+                f"requests/sec: {r['requests_per_second']:7.1f}  "
+                f"peak rss: {r['peak_rss_bytes'] / 2**20:6.1f} MiB"
+            )
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark of link extraction on large reference pages,
+comparing checkrs_linkto.extract.extract_links against the BeautifulSoup
+find_all('a') and soup.find(id=...) approach the bot used before.
+"""
+
+import argparse
+import json
+import time
+
+import bs4 as bs
+
+from checkrs_linkto.extract import extract_links
+
+
+def make_page(anchors, fragment_ratio):
+    """
+    Build a reference style page with a section for every anchor
+    and links that point to fragments on the page or to other pages
+    :return: html string
+    """
+
+    parts = ["<html><head><title>reference</title></head><body><nav>"]
+    for i in range(anchors):
+        if i % int(1 / fragment_ratio) == 0:
+            parts.append(f'<a href="#section-{i}">section {i}</a>')
+        else:
+            parts.append(f'<a href="page-{i}.html">page {i}</a>')
+    parts.append("</nav><main>")
+    for i in range(anchors):
+        parts.append(f'<h2 id="section-{i}">section {i}</h2><p>text <code>code</code> more text</p>')
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+def beautifulsoup_links(html):
+    """
+    The link extraction the bot did before extract_links():
+    build a full tree, walk the anchor tags and search the tree for every fragment
+    :return: tuple with the list of hrefs and the list of fragments that were found
+    """
+
+    soup = bs.BeautifulSoup(html, 'lxml')
+    hrefs = list()
+    found = list()
+    for atag in soup.find_all('a'):
+        href = atag.get('href')
+        if href is None:
+            continue
+        href = href.strip()
+        if href.startswith("mailto:"):
+            continue
+        hrefs.append(href)
+        if href.startswith("#") and soup.find(id=href[1:]) is not None:
+            found.append(href)
+    return hrefs, found
+
+
+def streaming_links(html):
+    """
+    The link extraction the bot does now:
+    one pass over the html, fragments are checked against the set of ids
+    :return: tuple with the list of hrefs and the list of fragments that were found
+    """
+
+    hrefs, ids = extract_links(html)
+    found = [href for href in hrefs if href.startswith("#") and href[1:] in ids]
+    return hrefs, found
+
+
+def best_time(func, html, repeat):
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--anchors",
+        help="comma separated list of the number of anchor tags on each sample page",
+        action="store",
+        dest="anchors",
+        default="100,1000,2000",
+        type=str)
+
+    command_parser.add_argument(
+        "--fragment-ratio",
+        help="fraction of the anchor tags that link to a fragment on the same page",
+        action="store",
+        dest="fragment_ratio",
+        default=0.5,
+        type=float)
+
+    command_parser.add_argument(
+        "--repeat",
+        help="number of times each page is parsed, the best time is reported",
+        action="store",
+        dest="repeat",
+        default=3,
+        type=int)
+
+    command_parser.add_argument(
+        "--json",
+        help="print the results as json",
+        action="store_true",
+        dest="json")
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    results = list()
+    for anchors in [int(x) for x in options.anchors.split(",")]:
+        html = make_page(anchors, options.fragment_ratio)
+
+        # both approaches have to find the same links
+        assert beautifulsoup_links(html) == streaming_links(html)
+
+        bs_time = best_time(beautifulsoup_links, html, options.repeat)
+        streaming_time = best_time(streaming_links, html, options.repeat)
+
+        results.append(dict(
+            anchors=anchors,
+            page_bytes=len(html),
+            beautifulsoup_seconds=bs_time,
+            streaming_seconds=streaming_time,
+            speedup=bs_time / streaming_time
+        ))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                f"anchors: {r['anchors']:>6}  bytes: {r['page_bytes']:>9}  "
+                f"beautifulsoup: {r['beautifulsoup_seconds']:.4f}s  "
+                f"streaming: {r['streaming_seconds']:.4f}s  "
+                f"speedup: {r['speedup']:.1f}x"
+            )
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+Memory benchmark of the crawl history on a synthetic, heavily cross linked site,
+comparing checkrs_linkto.history.HistoryStore against the dictionary of dictionaries
+with a visited_from list per url the bot used before.
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from checkrs_linkto.history import HistoryStore
+
+
+def make_links(pages, edges, nav_links, seed):
+    """
+    Build the links of a site where every page has the same navigation bar and footer
+    and the rest of its links point to random pages
+    :return: list of urls and a list with the list of linked url indexes for every page
+    """
+
+    rng = random.Random(seed)
+    urls = [f"https://docs.example.com/section-{i % 100}/page-{i}.html" for i in range(pages)]
+
+    links_per_page = edges // pages
+    nav = list(range(min(nav_links, links_per_page)))
+    links = list()
+    for _ in range(pages):
+        page_links = nav + [rng.randrange(pages) for _ in range(links_per_page - len(nav))]
+        links.append(page_links)
+
+    return urls, links
+
+
+def build_dicts(urls, links, copy_strings):
+    """
+    The history the bot kept before HistoryStore.
+    While crawling, the links from a page share its url string,
+    a history read back from a json file has a separate string for every link.
+    :return: history dictionary
+    """
+
+    history = dict()
+    history[urls[0]] = dict(response_code=200, visited_from=[None], error_text=None, depth=0)
+    for i, page_links in enumerate(links):
+        for j in page_links:
+            source = urls[i]
+            if copy_strings:
+                source = source[:1] + source[1:]
+            if urls[j] not in history:
+                history[urls[j]] = dict(response_code=200, visited_from=[source], error_text=None, depth=1)
+            else:
+                history[urls[j]]["visited_from"].append(source)
+    return history
+
+
+def build_store(urls, links):
+    history = HistoryStore()
+    history.add(urls[0], response_code=200, visited_from=[None], depth=0)
+    for i, page_links in enumerate(links):
+        for j in page_links:
+            if urls[j] not in history:
+                history.add(urls[j], response_code=200, visited_from=[urls[i]], depth=1)
+            else:
+                history.add_edge(urls[j], urls[i])
+    return history
+
+
+def measure(func, *args):
+    """
+    Run func with tracemalloc on
+    :return: tuple with the result, bytes still allocated by the result, peak bytes and seconds
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--pages",
+        help="number of pages on the synthetic site",
+        action="store",
+        dest="pages",
+        default=50000,
+        type=int)
+
+    command_parser.add_argument(
+        "--edges",
+        help="total number of links on the synthetic site",
+        action="store",
+        dest="edges",
+        default=5000000,
+        type=int)
+
+    command_parser.add_argument(
+        "--nav-links",
+        help="number of links in the navigation bar and footer shared by every page",
+        action="store",
+        dest="nav_links",
+        default=60,
+        type=int)
+
+    command_parser.add_argument(
+        "--seed",
+        help="seed for the random links",
+        action="store",
+        dest="seed",
+        default=0,
+        type=int)
+
+    command_parser.add_argument(
+        "--json",
+        help="print the results as json",
+        action="store_true",
+        dest="json")
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    urls, links = make_links(options.pages, options.edges, options.nav_links, options.seed)
+
+    results = list()
+    expected = None
+    for name, func, args in [
+        ("dict, crawled", build_dicts, (urls, links, False)),
+        ("dict, loaded from file", build_dicts, (urls, links, True)),
+        ("HistoryStore", build_store, (urls, links)),
+    ]:
+        history, current, peak, elapsed = measure(func, *args)
+
+        # the store has to export the same history
+        export_start = time.perf_counter()
+        exported = dict(history.items())
+        export_time = time.perf_counter() - export_start
+        if expected is None:
+            expected = exported
+        else:
+            assert exported == expected
+        del exported, history
+
+        results.append(dict(
+            representation=name,
+            pages=options.pages,
+            edges=sum(len(page_links) for page_links in links),
+            bytes=current,
+            peak_bytes=peak,
+            build_seconds=elapsed,
+            export_seconds=export_time
+        ))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                f"{r['representation']:<24} pages: {r['pages']:>7}  edges: {r['edges']:>8}  "
+                f"memory: {r['bytes'] / 2**20:8.1f} MiB  peak: {r['peak_bytes'] / 2**20:8.1f} MiB  "
+                f"build: {r['build_seconds']:.1f}s  export: {r['export_seconds']:.1f}s"
+            )
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Throughput benchmark of the parse stage on large reference pages,
+parsing the same pages in the main process and in process pools of increasing size
+the way checkrs_linkto.bot.bot() does with parse_workers.
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from checkrs_linkto.extract import parse_page
+
+
+def make_page(anchors, seed):
+    """
+    Build a reference style page with a section for every anchor
+    and links that point to fragments on the page or to other pages
+    :return: utf-8 encoded html
+    """
+
+    parts = [f"<html><head><title>reference {seed}</title></head><body><nav>"]
+    for i in range(anchors):
+        if i % 2 == 0:
+            parts.append(f'<a href="#section-{i}">section {i}</a>')
+        else:
+            parts.append(f'<a href="../page-{seed}-{i}.html">page {i}</a>')
+    parts.append("</nav><main>")
+    for i in range(anchors):
+        parts.append(f'<h2 id="section-{i}">section {i}</h2><p>text <code>code</code> more text</p>')
+    parts.append("</main></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def parse_inline(pages):
+    return [parse_page(content, "utf-8", url) for url, content in pages]
+
+
+def parse_pool(pages, parse_workers):
+    """
+    Parse the pages in a process pool, the startup of the pool is not timed
+    :return: tuple with the results and seconds
+    """
+
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # start the processes before timing
+        list(pool.map(parse_page, [b""] * parse_workers, [None] * parse_workers, ["x"] * parse_workers))
+
+        start = time.perf_counter()
+        futures = [pool.submit(parse_page, content, "utf-8", url) for url, content in pages]
+        results = [f.result() for f in futures]
+        return results, time.perf_counter() - start
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--pages",
+        help="number of pages to parse",
+        action="store",
+        dest="pages",
+        default=200,
+        type=int)
+
+    command_parser.add_argument(
+        "--anchors",
+        help="number of anchor tags on each page",
+        action="store",
+        dest="anchors",
+        default=2000,
+        type=int)
+
+    command_parser.add_argument(
+        "--parse-workers",
+        help="comma separated list of process pool sizes",
+        action="store",
+        dest="parse_workers",
+        default=f"1,2,4,{multiprocessing.cpu_count()}",
+        type=str)
+
+    command_parser.add_argument(
+        "--json",
+        help="print the results as json",
+        action="store_true",
+        dest="json")
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    pages = [
+        (f"https://docs.example.com/reference/page-{i}.html", make_page(options.anchors, i))
+        for i in range(options.pages)
+    ]
+
+    start = time.perf_counter()
+    expected = parse_inline(pages)
+    inline_time = time.perf_counter() - start
+
+    results = [dict(
+        parse_workers=0,
+        pages=options.pages,
+        seconds=inline_time,
+        pages_per_second=options.pages / inline_time,
+        speedup=1.0
+    )]
+    for parse_workers in sorted(set(int(x) for x in options.parse_workers.split(","))):
+        actual, elapsed = parse_pool(pages, parse_workers)
+
+        # every pool has to find the same links
+        assert actual == expected
+
+        results.append(dict(
+            parse_workers=parse_workers,
+            pages=options.pages,
+            seconds=elapsed,
+            pages_per_second=options.pages / elapsed,
+            speedup=inline_time / elapsed
+        ))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                f"parse workers: {r['parse_workers']:>3}  pages: {r['pages']:>6}  "
+                f"time: {r['seconds']:.2f}s  pages/sec: {r['pages_per_second']:8.1f}  "
+                f"speedup: {r['speedup']:.1f}x"
+            )
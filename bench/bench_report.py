@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the history comparison reports on synthetic, heavily cross linked sites,
+comparing checkrs_linkto.report.LinkToReport against the list.remove() based
+link diff and per-url regular expressions the report used before.
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+from urllib.parse import urljoin, urlparse, urlunparse
+
+from checkrs_linkto.history import write_history
+from checkrs_linkto.report import LinkToReport
+
+
+def make_history(start_url, pages, links_per_page, nav_links, changed_ratio, seed, shuffle=False):
+    """
+    Build the history of a site where every page has the same navigation bar
+    and the rest of its links point to random pages.
+    changed_ratio of the pages link to a different random page than in the golden history.
+    shuffle puts the visited_from lists in a random order, like a crawl with more than one worker.
+    :return: history dictionary
+    """
+
+    rng = random.Random(seed)
+    changed = random.Random(seed + 1)
+    o = urlparse(start_url)
+    base = urlunparse([o.scheme, o.netloc, '', '', '', ''])
+    urls = [f"{base}/section-{i % 100}/page-{i}.html" for i in range(pages)]
+    urls[0] = start_url
+
+    history = {start_url: dict(response_code=200, visited_from=[None], error_text=None, depth=0)}
+    nav = list(range(min(nav_links, links_per_page)))
+    for i in range(pages):
+        page_links = nav + [rng.randrange(pages) for _ in range(links_per_page - len(nav))]
+        if changed.random() < changed_ratio:
+            page_links[-1] = changed.randrange(pages)
+        for j in page_links:
+            if urls[j] not in history:
+                history[urls[j]] = dict(response_code=200, visited_from=[urls[i]], error_text=None, depth=1)
+            else:
+                history[urls[j]]["visited_from"].append(urls[i])
+
+    if shuffle:
+        for record in history.values():
+            rng.shuffle(record["visited_from"])
+    return history
+
+
+def reference_list_diff(l1, l2):
+    l1 = copy.deepcopy(l1)
+    for i in l2:
+        if i in l1:
+            l1.remove(i)
+    return l1
+
+
+def reference_normalize_url(params):
+    (start_url, url) = params
+    if url is None:
+        return url
+    return re.sub(start_url, "", url)
+
+
+def reference_report(lcr):
+    """
+    The report_url_visit_differences() and report_link_differences() the report used before
+    :return: tuple with the report text and counts
+    """
+
+    report = ""
+    counts = {}
+
+    o = urlparse(lcr.history_golden_start_url)
+    s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
+    history_golden_keys = set(map(reference_normalize_url, [(s, x) for x in lcr.history_golden.keys()]))
+    o = urlparse(lcr.history_new_start_url)
+    s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
+    history_new_keys = set(map(reference_normalize_url, [(s, x) for x in lcr.history_new.keys()]))
+
+    new_urls_visited = history_new_keys.difference(history_golden_keys)
+    urls_not_visited = history_golden_keys.difference(history_new_keys)
+
+    report += "URL VISIT DIFFERENCES:\n\n"
+    counts['url_visit_differences_old'] = len(urls_not_visited)
+    counts['url_visit_differences_new'] = len(new_urls_visited)
+    if len(new_urls_visited) == 0 and len(urls_not_visited) == 0:
+        report += '\n\n'
+    else:
+        report += "These are url's in the golden file that were not visited:\n"
+        report += '\n'.join('{}: {}'.format(*k) for k in enumerate(sorted(urls_not_visited)))
+        report += '\n\n'
+        report += "These are new url's that were visited:\n"
+        report += '\n'.join('{}: {}'.format(*k) for k in enumerate(sorted(new_urls_visited)))
+        report += '\n\n'
+
+    report += "LINK DIFFERENCES:\n\n"
+    counts['link_differences_not_in_old'] = 0
+    counts['link_differences_not_in_new'] = 0
+
+    for k, v_new in lcr.history_new.items():
+        norm_k = reference_normalize_url((lcr.history_new_start_url, k))
+        if norm_k != k:
+            k = urljoin(lcr.history_golden_start_url, norm_k)
+        if k not in lcr.history_golden:
+            continue
+        v_golden = dict(visited_from=lcr.history_golden[k])
+
+        o = urlparse(lcr.history_golden_start_url)
+        s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
+        history_golden_visited_from = list(map(reference_normalize_url, [(s, x) for x in v_golden["visited_from"]]))
+        o = urlparse(lcr.history_new_start_url)
+        s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
+        history_new_visited_from = list(map(reference_normalize_url, [(s, x) for x in v_new["visited_from"]]))
+
+        links_not_in_new = reference_list_diff(history_golden_visited_from, history_new_visited_from)
+        links_not_in_golden = reference_list_diff(history_new_visited_from, history_golden_visited_from)
+        if len(links_not_in_new) == 0 and len(links_not_in_golden) == 0:
+            continue
+
+        report += f"page: {k}\n"
+        report += f"\n\tlinks that are not in new:\n\t"
+        report += '\n\t'.join('{}: {}'.format(*k) for k in enumerate(links_not_in_new))
+        report += '\n'
+        report += f"\n\tlinks that are not in golden:\n\t"
+        report += '\n\t'.join('{}: {}'.format(*k) for k in enumerate(links_not_in_golden))
+        report += '\n'
+        counts['link_differences_not_in_old'] += len(links_not_in_golden)
+        counts['link_differences_not_in_new'] += len(links_not_in_new)
+
+    report += '\n\n'
+    return report, counts
+
+
+def indexed_report(lcr):
+    lcr.report_url_visit_differences()
+    lcr.report_link_differences()
+    return lcr.report, lcr.counts
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--pages",
+        help="comma separated list of the number of pages on each synthetic site",
+        action="store",
+        dest="pages",
+        default="1000,5000",
+        type=str)
+
+    command_parser.add_argument(
+        "--links-per-page",
+        help="number of links on every page",
+        action="store",
+        dest="links_per_page",
+        default=40,
+        type=int)
+
+    command_parser.add_argument(
+        "--nav-links",
+        help="number of links in the navigation bar shared by every page",
+        action="store",
+        dest="nav_links",
+        default=20,
+        type=int)
+
+    command_parser.add_argument(
+        "--changed-ratio",
+        help="fraction of the pages whose links changed between the golden and new history",
+        action="store",
+        dest="changed_ratio",
+        default=0.01,
+        type=float)
+
+    command_parser.add_argument(
+        "--skip-reference",
+        help="only time LinkToReport, for histories too large for the reference report",
+        action="store_true",
+        dest="skip_reference")
+
+    command_parser.add_argument(
+        "--json",
+        help="print the results as json",
+        action="store_true",
+        dest="json")
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for pages in [int(x) for x in options.pages.split(",")]:
+            golden_fn = os.path.join(tmpdir, "history_golden.json")
+            new_fn = os.path.join(tmpdir, "history_new.json")
+
+            golden_start_url = "https://docs.example.com/index.html"
+            new_start_url = "https://docs.example.com/index.html"
+            write_history(golden_fn, golden_start_url, make_history(
+                golden_start_url, pages, options.links_per_page, options.nav_links, 0, 0))
+            write_history(new_fn, new_start_url, make_history(
+                new_start_url, pages, options.links_per_page, options.nav_links, options.changed_ratio, 0, shuffle=True))
+
+            lcr = LinkToReport(golden_fn, new_fn)
+            start = time.perf_counter()
+            actual = indexed_report(lcr)
+            indexed_time = time.perf_counter() - start
+
+            reference_time = None
+            if not options.skip_reference:
+                lcr = LinkToReport(golden_fn, new_fn)
+                start = time.perf_counter()
+                expected = reference_report(lcr)
+                reference_time = time.perf_counter() - start
+
+                # both approaches have to write the same report
+                assert actual == expected
+
+            results.append(dict(
+                pages=pages,
+                edges=pages * options.links_per_page,
+                reference_seconds=reference_time,
+                indexed_seconds=indexed_time,
+                speedup=reference_time / indexed_time if reference_time is not None else None
+            ))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if r['reference_seconds'] is None:
+                print(f"pages: {r['pages']:>7}  edges: {r['edges']:>9}  indexed: {r['indexed_seconds']:.3f}s")
+                continue
+            print(
+                f"pages: {r['pages']:>7}  edges: {r['edges']:>9}  "
+                f"reference: {r['reference_seconds']:.3f}s  "
+                f"indexed: {r['indexed_seconds']:.3f}s  "
+                f"speedup: {r['speedup']:.1f}x"
+            )
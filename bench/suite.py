@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+Run all the benchmarks and save their results in one json document,
+with the commit, python version and machine they ran on, for tracking regressions between runs.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (script, arguments, arguments for --quick)
+BENCHMARKS = {
+    "crawl": (
+        "bench_crawl.py",
+        ["--pages", "2000", "--topologies", "tree,nav"],
+        ["--pages", "300", "--topologies", "tree,nav"]
+    ),
+    "crawl_slow_and_broken": (
+        "bench_crawl.py",
+        ["--pages", "500", "--topologies", "nav", "--slow-ratio", "0.05", "--slow-latency", "0.2", "--broken-ratio", "0.05"],
+        ["--pages", "100", "--topologies", "nav", "--slow-ratio", "0.05", "--slow-latency", "0.2", "--broken-ratio", "0.05"]
+    ),
+    "report": (
+        "bench_report.py",
+        ["--pages", "1000,5000"],
+        ["--pages", "1000"]
+    ),
+    "report_large": (
+        "bench_report.py",
+        ["--pages", "50000", "--skip-reference"],
+        ["--pages", "10000", "--skip-reference"]
+    ),
+    "history": (
+        "bench_history.py",
+        ["--pages", "20000", "--edges", "1000000"],
+        ["--pages", "5000", "--edges", "100000"]
+    ),
+    "extract": (
+        "bench_extract.py",
+        [],
+        ["--anchors", "100,1000"]
+    ),
+    "parse": (
+        "bench_parse.py",
+        ["--pages", "200"],
+        ["--pages", "20", "--parse-workers", "1,2"]
+    ),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(script, arguments):
+    """
+    Run a benchmark script with --json
+    :return: tuple with the parsed results and seconds
+    """
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.join(BENCH_DIR, script), "--json"] + arguments,
+        capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+
+    if completed.returncode != 0:
+        raise RuntimeError(f"{script} failed:\n{completed.stderr}")
+
+    return json.loads(completed.stdout), elapsed
+
+
+def parse_options():
+    command_parser = argparse.ArgumentParser()
+    command_parser.add_argument(
+        "--only",
+        help=f"comma separated list of the benchmarks to run, out of {list(BENCHMARKS)}",
+        action="store",
+        dest="only",
+        default=",".join(BENCHMARKS),
+        type=str)
+
+    command_parser.add_argument(
+        "--quick",
+        help="run the benchmarks on smaller inputs",
+        action="store_true",
+        dest="quick")
+
+    command_parser.add_argument(
+        "--output",
+        help="name of the json file the results are written to",
+        action="store",
+        dest="output",
+        default="bench-results.json",
+        type=str)
+
+    return command_parser.parse_args()
+
+
+if __name__ == "__main__":
+
+    options = parse_options()
+
+    names = options.only.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f"unknown benchmark '{name}', expected one of {list(BENCHMARKS)}")
+
+    document = dict(
+        started=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        commit=git_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        quick=options.quick,
+        benchmarks=dict()
+    )
+
+    for name in names:
+        script, arguments, quick_arguments = BENCHMARKS[name]
+        if options.quick:
+            arguments = quick_arguments
+
+        print(f"running {name}: {script} {' '.join(arguments)}", flush=True)
+        results, elapsed = run_benchmark(script, arguments)
+        document["benchmarks"][name] = dict(script=script, arguments=arguments, seconds=elapsed, results=results)
+
+    with open(options.output, "w") as f:
+        json.dump(document, f, indent=2)
+
+    print(f"results written to {options.output}")
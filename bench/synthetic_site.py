@@ -0,0 +1,187 @@
+"""
+Synthetic sites for the crawl benchmarks.
+Pages are generated from a seed when they are requested, so sites of any size cost no disk space
+and every run of a benchmark crawls the same site.
+"""
+
+import http.server
+import random
+import threading
+import time
+
+TOPOLOGIES = ["tree", "nav"]
+
+# element ids on every page, links with fragments point to these or to a missing one
+SECTIONS = 5
+
+
+class SyntheticSite:
+    """
+    Link topology and content of a synthetic site.
+    tree - every page links to its children, its parent and the root, branching children per page,
+           a branching of 1 gives a chain as deep as the site has pages
+    nav - every page links to the same nav_links pages, the next page and random pages,
+          up to links_per_page links
+    fragment_ratio of the links point to a section of the page, broken_ratio of the links point
+    to pages that don't exist and slow_ratio of the pages take slow_latency seconds longer to answer.
+    """
+
+    def __init__(self, pages=1000, topology="nav", branching=4, nav_links=30, links_per_page=40,
+                 fragment_ratio=0.2, broken_ratio=0.01, slow_ratio=0.0, slow_latency=0.5, seed=0):
+
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"unknown topology '{topology}', expected one of {TOPOLOGIES}")
+
+        self.pages = pages
+        self.topology = topology
+        self.branching = branching
+        self.nav_links = nav_links
+        self.links_per_page = links_per_page
+        self.fragment_ratio = fragment_ratio
+        self.broken_ratio = broken_ratio
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.seed = seed
+
+    def _rng(self, i):
+        return random.Random(self.seed * 1000003 + i)
+
+    def links(self, i):
+        """
+        Build the links of a page
+        :return: list of hrefs
+        """
+
+        rng = self._rng(i)
+
+        if self.topology == "tree":
+            first_child = i * self.branching + 1
+            targets = [c for c in range(first_child, first_child + self.branching) if c < self.pages]
+            targets += [(i - 1) // self.branching if i > 0 else 0, 0]
+        else:
+            targets = list(range(min(self.nav_links, self.pages)))
+            targets.append((i + 1) % self.pages)
+            while len(targets) < self.links_per_page:
+                targets.append(rng.randrange(self.pages))
+
+        hrefs = list()
+        for j, target in enumerate(targets):
+            if rng.random() < self.broken_ratio:
+                hrefs.append(f"/missing-{i}-{j}.html")
+                continue
+
+            href = f"/page-{target}.html"
+            if rng.random() < self.fragment_ratio:
+                # one in ten fragments points to an element that doesn't exist
+                section = rng.randrange(SECTIONS + 1) if rng.random() < 0.1 else rng.randrange(SECTIONS)
+                href += f"#sec-{section}"
+                if target == i:
+                    href = href[href.index("#"):]
+            hrefs.append(href)
+
+        return hrefs
+
+    def is_slow(self, i):
+        return self.slow_ratio > 0 and self._rng(-1 - i).random() < self.slow_ratio
+
+    def page(self, i):
+        """
+        Build the html of a page
+        :return: utf-8 encoded html
+        """
+
+        parts = [f"<html><head><title>page {i}</title></head><body><nav>"]
+        parts.extend(f'<a href="{href}">link {j}</a>' for j, href in enumerate(self.links(i)))
+        parts.append("</nav><main>")
+        for section in range(SECTIONS):
+            parts.append(f'<h2 id="sec-{section}">section {section}</h2><p>text <code>code</code> more text</p>')
+        parts.append("</main></body></html>")
+        return "".join(parts).encode("utf-8")
+
+
+class SyntheticSiteServer:
+    """
+    Local HTTP server for a synthetic site.
+    Every request waits latency seconds, plus the site's slow_latency for slow pages.
+    Counts the requests for pages, so benchmarks can tell how many the crawl made.
+    """
+
+    def __init__(self, site, latency=0.0):
+
+        self.site = site
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            # headers and body are written separately, don't let Nagle's algorithm hold back the body
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(body=False)
+
+            def do_GET(self):
+                self.respond(body=True)
+
+            def respond(self, body):
+                status, content = server.handle(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8" if status == 200 else "text/plain")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                if body is True:
+                    self.wfile.write(content)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}/page-0.html"
+
+    def handle(self, path):
+        """
+        Answer a request
+        :return: tuple with the status code and the body
+        """
+
+        if path == "/robots.txt":
+            return 200, b"User-agent: *\nAllow: /\n"
+
+        with self.lock:
+            self.requests += 1
+
+        delay = self.latency
+        i = None
+        if path.startswith("/page-") and path.endswith(".html"):
+            try:
+                i = int(path[len("/page-"):-len(".html")])
+            except ValueError:
+                i = None
+
+        if i is None or i < 0 or i >= self.site.pages:
+            time.sleep(delay)
+            return 404, b"not found"
+
+        if self.site.is_slow(i):
+            delay += self.site.slow_latency
+        time.sleep(delay)
+        return 200, self.site.page(i)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
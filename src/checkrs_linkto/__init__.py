@@ -1,2 +1,10 @@
 from checkrs_linkto.bot import *
 from checkrs_linkto.report import *
+
+
+def __getattr__(name):
+    # the requests adapter is imported with requests when a crawl starts, like in checkrs_linkto.bot
+    if name == "TimeoutHTTPAdapter":
+        from checkrs_linkto.adapters import TimeoutHTTPAdapter
+        return TimeoutHTTPAdapter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,54 @@
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from checkrs_linkto.bot import DEFAULT_TIMEOUT
+from checkrs_linkto.metrics import time_connect
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        time_connect(super().connect)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        time_connect(super().connect)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+# for PoolManager.pool_classes_by_scheme
+TIMED_POOL_CLASSES = {
+    "http": TimedHTTPConnectionPool,
+    "https": TimedHTTPSConnectionPool,
+}
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    https://findwork.dev/blog/advanced-usage-python-requests-timeouts-retries-hooks/
+    """
+    def __init__(self, *args, **kwargs):
+        self.timeout = DEFAULT_TIMEOUT
+        if "timeout" in kwargs:
+            self.timeout = kwargs["timeout"]
+            del kwargs["timeout"]
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # time how long opening connections takes
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+
+    def send(self, request, **kwargs):
+        timeout = kwargs.get("timeout")
+        if timeout is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
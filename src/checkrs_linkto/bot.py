@@ -1,39 +1,444 @@
-import bs4 as bs
+import hashlib
 import logging
-import re
-import requests
+import multiprocessing
 import time
 
-from collections import deque
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from urllib.parse import urljoin, urlparse, urlunparse
-from urllib.robotparser import RobotFileParser
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from checkrs_linkto.cache import DuplicatePages
+from checkrs_linkto.history import HistoryStore
+from checkrs_linkto.hosts import HostHealth, RobotsCache
+from checkrs_linkto.metrics import CrawlMetrics, RequestTimer
+from checkrs_linkto.scheduler import RETRY_STATUS_CODES, CrawlBudget, HostScheduler, RetryPolicy
+from checkrs_linkto.sitemaps import SitemapReader
+from checkrs_linkto.urls import UrlFilter, VisitTargets
 
 # create logger
 logger = logging.getLogger('linkto_bot')
 
 DEFAULT_TIMEOUT = 60 # seconds
 
-class TimeoutHTTPAdapter(HTTPAdapter):
+# servers that don't support HEAD requests answer with these status codes
+HEAD_NOT_ALLOWED_STATUS_CODES = (405, 501)
+
+# unread response bodies up to this size are read so their connection can be reused
+DRAIN_MAX_BYTES = 64 * 1024
+
+# fetched pages allowed to wait for each parse worker before we stop handing out urls
+PARSE_BACKLOG = 4
+
+# seconds between checks for urls from the sitemaps when there is nothing else to do
+SITEMAP_POLL_INTERVAL = 0.1
+
+def __getattr__(name):
+    # the requests adapter is imported with requests when a crawl starts
+    if name == "TimeoutHTTPAdapter":
+        from checkrs_linkto.adapters import TimeoutHTTPAdapter
+        return TimeoutHTTPAdapter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def visit(s, url, robots, follow_links=True, fetch_mode="head", cache=None):
+    """
+    Make the network requests for a single url.
+    This runs on a worker thread, so it only talks to the network
+    and leaves the history dictionary alone.
+    fetch_mode "head" makes a HEAD request and a second GET request for pages we parse,
+    fetch_mode "get" makes one streamed GET request and only reads the body of pages we parse.
+    When a validator cache is given, pages we parse are requested conditionally
+    and unchanged pages reuse the links from the cache.
+    :return: dictionary with the response_code and error_text for the url,
+        and the final url, raw body and declared encoding when the page should be parsed for links,
+        or the final url, hrefs and ids from the cache when the page has not been modified,
+        and the timings of the requests, see RequestTimer
+    """
+
+    result = dict(
+        response_code=None,
+        error_text=None,
+        url=url,
+        content=None,
+        encoding=None,
+        hrefs=None,
+        ids=None,
+        etag=None,
+        last_modified=None,
+        content_hash=None,
+        duplicate_of=None,
+        retry_after=None,
+        timings=None
+    )
+
+    # ask the server to skip the body if the page hasn't changed since we cached its links
+    headers = dict()
+    if cache is not None and follow_links is True:
+        headers = cache.conditional_headers(url)
+
+    # retrieve and parse the robot.txt for the site, unless we already tried
+    robots_txt = robots.fetch(s, url)
+    if robots_txt["parser"] is None:
+        # site probably doesnt exist
+        # save the exception details
+        # move on to the next url
+        result["error_text"] = robots_txt["error_text"]
+        result["response_code"] = 0
+        return result
+
+    # check if our robot is allowed to visit this url
+    can_fetch = robots_txt["parser"].can_fetch(s.headers['User-Agent'], url)
+    if can_fetch is False:
+        # we are not allowed to crawl this url
+        # due to a rule in robots.txt
+        msg = "Matched robots.txt exclude rule."
+        result["error_text"] = msg
+        result["response_code"] = -1
+        logger.debug(msg)
+        return result
+
+    # time the requests for the url, without the robots.txt request
+    timer = RequestTimer()
+    try:
+        return fetch(s, url, result, timer, headers, follow_links, fetch_mode, cache)
+    finally:
+        result["timings"] = timer.stop()
+
+
+def fetch(s, url, result, timer, headers, follow_links=True, fetch_mode="head", cache=None):
+    """
+    Make the requests for a url that robots.txt allows us to visit, see visit(),
+    the requests are timed with timer
+    :return: the result dictionary, updated with the response
+    """
+
+    try:
+        logger.info(f"visiting: '{url}'")
+        if fetch_mode == "get":
+            # Make a single streamed GET request, the body is only
+            # downloaded if we decide to look for links in it
+            response = timer.request(s.get, url, stream=True, headers=headers)
+        else:
+            # Make a HEAD request to fetch the resource's headers
+            # we'll use this later to check if the resource is HTML
+            response = timer.request(s.head, url, allow_redirects=True, headers=headers)
+
+            if response.status_code in HEAD_NOT_ALLOWED_STATUS_CODES:
+                # the server doesn't answer HEAD requests,
+                # make a streamed GET request instead
+                logger.debug(f"HEAD request returned {response.status_code}, retrying with GET: {url}")
+                response = timer.request(s.get, url, stream=True, headers=headers)
+
+    except Exception as err:
+        # making the request failed
+        # the failed request won't have a status code
+        # save connection error details continue to the next url
+        result["error_text"] = str(err)
+        result["response_code"] = 0
+        logger.error(f"while connecting: {err}")
+        return result
+
+    if response.status_code == 304 and cache is not None and cache.get(url) is not None:
+        # the page hasn't changed since the last run,
+        # use the status code and links we saved for it
+        logger.debug(f"not modified, using cached links for: {url}")
+        entry = cache.get(url)
+        result["response_code"] = entry["response_code"]
+        result["url"] = entry["url"]
+        result["hrefs"] = entry["hrefs"]
+        result["ids"] = set(entry["ids"])
+        result["content_hash"] = entry["content_hash"]
+        if response.request.method == "GET":
+            release_response(response)
+        return result
+
+    # Update the result with the response's status code
+    result["response_code"] = response.status_code
+
+    if response.status_code in RETRY_STATUS_CODES:
+        # the server might tell us when to try again
+        result["retry_after"] = response.headers.get('Retry-After')
+
+    parse = should_parse(response, url, follow_links)
+
+    if response.request.method == "GET":
+        # we already have a streamed response,
+        # read the body only if we are going to look for links in it
+        try:
+            if parse is True:
+                result["url"] = response.url
+                result["content"] = timer.content(response)
+                result["encoding"] = response.encoding
+                result["etag"] = response.headers.get('ETag')
+                result["last_modified"] = response.headers.get('Last-Modified')
+                result["content_hash"] = hashlib.sha256(result["content"]).hexdigest()
+        except Exception as err:
+            result["error_text"] = f"While retrieving HTML content for {url}: {str(err)}"
+            logger.error(f"while connecting: {err}")
+        finally:
+            release_response(response)
+        return result
+
+    if parse is False:
+        return result
+
+    # Make a GET request to fetch the raw HTML content
+    try:
+        response = timer.request(s.get, url, stream=True)
+        content = timer.content(response)
+    except Exception as err:
+        # very unexpected to get an error here because
+        # our previous HEAD request should have been successful.
+        # log the error and continue to the next url
+        result["error_text"] = f"While retrieving HTML content for {url}: {str(err)}"
+        logger.error(f"while connecting: {err}")
+        return result
+
+    result["url"] = response.url
+    result["content"] = content
+    result["encoding"] = response.encoding
+    result["etag"] = response.headers.get('ETag')
+    result["last_modified"] = response.headers.get('Last-Modified')
+    result["content_hash"] = hashlib.sha256(content).hexdigest()
+
+    return result
+
+
+def should_parse(response, url, follow_links=True):
+    """
+    Use a response's status code and headers to determine
+    if we should look for more links on this resource.
+    :return: True if the response body should be parsed for links
+    """
+
+    # Filter out resources that have no Content-Type header
+    # we can't tell if they are HTML content
+    if 'Content-Type' not in response.headers:
+        logger.debug(f"filtered out content with missing Content-Type header: {response.headers}")
+        return False
+
+    # Filter out resources that are not HTML text
+    if 'text/html' not in response.headers['Content-Type'].lower():
+        logger.debug(f"filtered out non-HTML content: {response.headers['Content-Type']}")
+        return False
+
+    # Filter out urls with status_code greater than 400
+    if int(response.status_code) >= 400:
+        logger.debug(f"filtered out error status code: {response.status_code}")
+        return False
+
+    # Filter out external urls and urls that are too deep,
+    # the caller tells us which pages to look for links on
+    if follow_links is False:
+        logger.debug(f"not following links on: {url}")
+        return False
+
+    return True
+
+
+def release_response(response):
+    """
+    Finish with a streamed response.
+    Small unread bodies are read so the connection can be reused,
+    larger ones are dropped along with their connection instead of being downloaded.
+    :return: None
+    """
+
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) <= DRAIN_MAX_BYTES:
+        try:
+            response.content
+        except Exception:
+            # the connection will be dropped by close() below
+            pass
+
+    response.close()
+
+
+def record_links(history, to_be_visited, targets, url_filter, url, page_url, hrefs, ids, full_hrefs=None, shard=None):
+    """
+    Record the links found on a visited url in the history.
+    New urls are appended to to_be_visited, unless url_filter says they should be skipped,
+    targets says they point to a resource that is already being visited
+    or they belong to another shard, then they are handed off to it.
+    full_hrefs are the hrefs already resolved against page_url, if the parse stage did that.
+    :return: list of the urls whose history was updated
+    """
+
+    # links are recorded as coming from the page without its fragment,
+    # so they don't depend on which link to the page we followed first
+    source = urldefrag(url).url
+
+    recorded = list()
+
+    if full_hrefs is None:
+        full_hrefs = [urljoin(page_url, href) for href in hrefs]
+
+    for href, full_href in zip(hrefs, full_hrefs):
+
+        # full_href is the link converted to a full url
+        recorded.append(full_href)
+
+        # if href starts with # look through the HTML for an element with the same id
+        # if we find the element then add an entry to the history dictionary saying that we visited the page
+        # if we don't find the element add an entry to the history dictionary with error text that the element did not exist
+        if href.startswith("#"):
+            id_text = href[1:]
+            if id_text in ids:
+                logger.debug(f"adding URL fragment to history as exists: {href}")
+
+                error_text = None
+            else:
+                logger.debug(f"adding URL fragment to history as does not exist: {href}")
+
+                # note that the element does not exist in the error_text
+                error_text = f"Element with id '{id_text}' not found in HTML DOM"
+
+            # handle cases where full_href does and does not exist in history dictionary
+            if full_href not in history:
+
+                # add url, visited_from and error_text to the history
+                # we are using the same status code and depth as the parent page
+                history.add(
+                    full_href,
+                    response_code=history[url]["response_code"],
+                    visited_from=[source],
+                    error_text=error_text,
+                    depth=history[url]["depth"]
+                )
+            else:
+                # add visited_from with the url
+                history.add_edge(full_href, source)
+                history[full_href]["error_text"] = error_text
+                recorded.extend(lower_depth(history, to_be_visited, targets, full_href, history[url]["depth"]))
+
+            continue
+
+        # check if link exists in history dictionary
+        if full_href not in history:
+
+            skip = url_filter.skip(full_href)
+            if skip is not None:
+                # record the url with the reason we skip it, it never goes into to_be_visited
+                logger.debug(f"adding URL to history, it won't be visited: {full_href}")
+                history.add(
+                    full_href,
+                    response_code=skip[0],
+                    visited_from=[source],
+                    error_text=skip[1],
+                    depth=link_depth(history[url]["depth"])
+                )
+                continue
+
+            # add url, visited_from and error_text to the history
+            history.add(
+                full_href,
+                response_code=None,
+                visited_from=[source],
+                error_text=None,
+                depth=link_depth(history[url]["depth"])
+            )
+
+            if shard is not None and not shard.owns(full_href):
+                # another shard visits the url, its history has the result
+                logger.debug(f"adding URL to history, it belongs to another shard: {full_href}")
+                shard.hand_off(full_href, history[full_href]["depth"])
+
+            elif targets.add(full_href) is True:
+                logger.debug(f"adding URL to history and to_be_visited: {full_href}")
+
+                # append url to to_be_visited list
+                to_be_visited.append(full_href, depth=history[full_href]["depth"])
+            else:
+                # another url for the same resource is already being visited,
+                # like a different fragment on the same page
+                logger.debug(f"adding URL to history, its resource is already visited: {full_href}")
+                targets.attach(history, full_href)
+
+                # the resource is as many clicks away as the closest of its urls
+                recorded.extend(lower_depth(
+                    history, to_be_visited, targets, targets.get(full_href)["url"], history[full_href]["depth"]
+                ))
+
+        else:
+
+            logger.debug(f"marking '{full_href}' as visited from '{source}'")
+
+            # add visited_from with the url
+            history.add_edge(full_href, source)
+
+            # this page might be a shorter path to the url than the one we found first
+            recorded.extend(lower_depth(history, to_be_visited, targets, full_href, link_depth(history[url]["depth"])))
+
+    return recorded
+
+
+def link_depth(depth):
     """
-    https://findwork.dev/blog/advanced-usage-python-requests-timeouts-retries-hooks/
+    The click depth of the links on a page at depth,
+    the links on a page without a click depth, like one only a sitemap lists, don't have one either
+    :return: depth or None
     """
-    def __init__(self, *args, **kwargs):
-        self.timeout = DEFAULT_TIMEOUT
-        if "timeout" in kwargs:
-            self.timeout = kwargs["timeout"]
-            del kwargs["timeout"]
-        super().__init__(*args, **kwargs)
 
-    def send(self, request, **kwargs):
-        timeout = kwargs.get("timeout")
-        if timeout is None:
-            kwargs["timeout"] = self.timeout
-        return super().send(request, **kwargs)
+    if depth is None:
+        return None
+    return depth + 1
 
 
-def bot(start_url, depth=None, crawl_delay=1, exclude_external_urls=True, exclude_url_patterns=[], request_timeout=60):
+def lower_depth(history, to_be_visited, targets, url, depth):
+    """
+    Record a shorter path to a url that is already in the history.
+    A url that is waiting to be visited moves up to_be_visited,
+    and the shorter depth is passed on to the links found on the url's page, if they were recorded.
+    Any click depth is shorter than none, a depth of None doesn't change anything.
+    :return: list of the urls whose depth changed
+    """
+
+    changed = list()
+    if depth is None:
+        return changed
+
+    pending = [(url, depth)]
+    while len(pending) > 0:
+        url, depth = pending.pop()
+        current = history[url]["depth"]
+        if current is not None and current <= depth:
+            continue
+
+        history[url]["depth"] = depth
+        changed.append(url)
+        to_be_visited.update_depth(url, depth)
+
+        # the url visited for the resource, like the page of a fragment, is as close as this url
+        target = targets.find(url)
+        if target is not None and target["url"] != url:
+            pending.append((target["url"], depth))
+
+        page = urldefrag(url).url
+        for link in history.links_from(page):
+            # links to the page's own fragments have the page's depth
+            pending.append((link, depth if urldefrag(link).url == page else depth + 1))
+
+    return changed
+
+
+def bot(start_url, depth=None, crawl_delay=1, exclude_external_urls=True, exclude_url_patterns=[], request_timeout=60,
+        workers=1, fetch_mode="head", cache=None, previous=None, strip_query_params=[], checkpoint=None, resume=False,
+        robots=None, hosts=None, retries=None, parse_workers=0, shard=None, metrics=None,
+        sitemaps=False, sitemap_urls=[], budget=None, duplicates=None, fail_fast=None, history_writer=None):
+    """
+    Crawl a site from start_url and record every url we found, with its result and the pages that link to it.
+    The history is a checkrs_linkto.history.HistoryStore, not a dictionary like in earlier versions:
+    history[url][field] reads and writes the fields of a url like before, but visited_from lists are read-only,
+    links are added with add_edge(). dict(history.items()) gives the history dictionary earlier versions returned.
+    :return: HistoryStore
+    """
+
+    # requests and lxml are only imported once a crawl starts
+    import requests
+
+    from checkrs_linkto.adapters import TimeoutHTTPAdapter
+    from checkrs_linkto.extract import timed_parse_page
 
     # setup a requests session with a user agent
     s = requests.Session()
@@ -41,246 +446,583 @@ def bot(start_url, depth=None, crawl_delay=1, exclude_external_urls=True, exclud
         'User-Agent': 'checkrs_linkto (+https://github.com/rstudio/checkRS-linkto)'
     })
 
-    # setup the request timeouts and retries
-    retry_strategy = Retry(total=2, backoff_factor=1)
-    timeout_adapter = TimeoutHTTPAdapter(timeout=request_timeout, max_retries=retry_strategy)
+    # setup the request timeouts
+    # retries are scheduled by the crawl instead of sleeping in the adapter
+    # size the connection pool so every worker can hold a connection
+    timeout_adapter = TimeoutHTTPAdapter(
+        timeout=request_timeout,
+        max_retries=0,
+        pool_maxsize=max(workers, 10)
+    )
     s.mount("https://", timeout_adapter)
     s.mount("http://", timeout_adapter)
 
-    to_be_visited = deque()
-    history = dict()
-    robots_txts = dict()
-    compiled_exclude_url_patterns = list()
+    # urls waiting to be visited, spaced out by crawl_delay per netloc
+    to_be_visited = HostScheduler(crawl_delay)
+    history = HistoryStore()
 
-    # compile all of the exclude_url_patterns
-    for p in exclude_url_patterns:
-        compiled_exclude_url_patterns.append(re.compile(p))
+    # robots.txt results, including failures, and the health of the hosts we visit
+    if robots is None:
+        robots = RobotsCache()
+    if hosts is None:
+        hosts = HostHealth()
 
-    start_url_p = urlparse(start_url)
+    # failed visits that are worth trying again later
+    if retries is None:
+        retries = RetryPolicy()
 
-    logger.debug(f"adding start URL to history and to_be_visited: {start_url}")
+    # timings of the visits and counters of the crawl
+    if metrics is None:
+        metrics = CrawlMetrics()
 
-    history[start_url] = dict(
-        response_code=None,
-        visited_from=[None],
-        error_text=None,
-        depth=0
-    )
+    # limits on the pages, time and bytes the crawl may use
+    if budget is None:
+        budget = CrawlBudget()
 
-    # adding beginning url to the to_be_visited
-    to_be_visited.append(start_url)
+    # the content of the pages we fetched, so copies of a page aren't parsed again
+    if duplicates is None:
+        duplicates = DuplicatePages()
 
-    while len(to_be_visited) > 0:
+    # urls whose links we didn't follow because they were too deep,
+    # they are visited again if a shorter path to them is found
+    depth_limited = set()
 
-        # get the URL(next item in the queue) of the top item in the to_be_visited
-        url = to_be_visited.popleft()
-        logger.info(f"processing: '{url}'")
-        logger.debug(f"url's left to be processed: {len(to_be_visited)}")
+    # urls that are being visited by a worker, and when they were handed out
+    in_progress = dict()
+    started = dict()
 
-        url_p = urlparse(url)
+    # pages being parsed for links by the parse process pool, with their visit results.
+    # without parse workers pages are parsed on this thread as soon as they are fetched
+    parsing = dict()
+    parse_backlog = max(parse_workers, 1) * PARSE_BACKLOG
 
-        # check if this url has an external netloc
-        if url_p.netloc != start_url_p.netloc:
-            if exclude_external_urls is True:
-                msg = "Matched URL exclude external netloc"
-                logger.debug(msg)
-                history[url]["error_text"] = msg
-                history[url]["response_code"] = -1
-                continue
+    # content hash of a page being parsed -> list of (url, result) of the copies of the page fetched in the meantime,
+    # they are finished with the page's links and ids once its parse is done
+    waiting_for_parse = dict()
 
-        # check if the user asked to skip visiting this url
-        skip_for_matching_pattern = False
-        for exclude_url_pattern in compiled_exclude_url_patterns:
-            if exclude_url_pattern.search(url) is not None:
-                # the user has asked us not to crawl this url
-                # log that we are skipping the url
-                # move on to the next url
-                msg = f"Matched URL exclude pattern '{exclude_url_pattern.pattern}'"
-                logger.debug(msg)
-                history[url]["error_text"] = msg
-                history[url]["response_code"] = -1
-                skip_for_matching_pattern = True
-                break
-
-        # check if we found a matching exclude pattern
-        if skip_for_matching_pattern is True:
-            continue
+    # urls that point to the same resource share a single visit
+    targets = VisitTargets(strip_query_params)
+
+    # urls we don't visit are filtered out when they are found
+    url_filter = UrlFilter(start_url, exclude_external_urls, exclude_url_patterns)
+
+    start_url_p = urlparse(start_url)
+
+    # a connection error on the site we check is worth reporting for every url, not a reason to stop
+    hosts.exempt.add(start_url_p.netloc)
+
+    # urls listed in the site's sitemaps are added to the crawl as they are read,
+    # with their lastmod times when a previous history can tell us which pages haven't changed since
+    sitemap_reader = None
+    lastmods = dict()
+    if sitemaps is True or len(sitemap_urls) > 0:
+        # the Sitemap entries of robots.txt are only read when sitemaps is True
+        sitemap_reader = SitemapReader(s, start_url, sitemap_urls, robots if sitemaps is True else None)
 
-        # retrieve and parse the robot.txt for the site
-        if url_p.netloc not in robots_txts:
-            robots_txt_url = urlunparse((url_p.scheme, url_p.netloc,"robots.txt",None,None,None))
-            robots_txts[url_p.netloc] = RobotFileParser()
-            # robots_txts[url_p.netloc].set_url(robots_txt_url)
-            try:
-                r = s.get(robots_txt_url)
-                robots_txts[url_p.netloc].parse(r.text.splitlines())
-            except Exception as err:
-                # site probably doesnt exist
-                # remove the robot file parser
-                # save the exception details
-                # move on to the next url
-                logger.error(f"while connecting: {err}")
-                del robots_txts[url_p.netloc]
-                history[url]["error_text"] = str(err)
-                history[url]["response_code"] = 0
+    if resume is True:
+        history, finished = checkpoint.load()
+        if len(history) == 0:
+            # the crawl was stopped before anything was saved
+            logger.error(f"no urls found in checkpoint {checkpoint.filename}, starting a new crawl")
+            history = HistoryStore()
+            resume = False
+
+    if resume is True:
+        # pick up where the checkpointed crawl left off,
+        # urls without a result are visited again
+        for url in history:
+            record = history[url]
+            if url_filter.skip(url) is not None:
+                # already recorded as skipped
+                continue
+            if shard is not None and not shard.owns(url):
+                # hand it off again in case the crawl stopped before it was written to the spool
+                shard.hand_off(url, record["depth"])
                 continue
+            if targets.add(url) is True:
+                if url in finished:
+                    target = finished[url]
+                    targets.restore(
+                        url, target["response_code"], target["error_text"], target["ids"],
+                        target.get("content_hash"), target.get("duplicate_of")
+                    )
+                elif record["response_code"] is None:
+                    to_be_visited.append(url, depth=record["depth"])
+                else:
+                    targets.finish(history, url)
+            elif record["response_code"] is None:
+                targets.attach(history, url)
 
-        # check if our robot is allowed to visit this url
-        can_fetch = robots_txts[url_p.netloc].can_fetch(s.headers['User-Agent'], url)
-        if can_fetch is False:
-            # we are not allowed to crawl this url
-            # due to a rule in robots.txt
-            msg = "Matched robots.txt exclude rule."
-            history[url]["error_text"] = msg
-            history[url]["response_code"] = -1
-            logger.debug(msg)
-            continue
+        logger.info(f"resuming crawl with {len(to_be_visited)} urls left to be processed")
 
-        # crude, temporary implementation of crawl delay
-        time.sleep(crawl_delay)
+    elif shard is not None and not shard.owns(start_url):
+        # the start url belongs to another shard, this shard visits the urls handed off to it
+        logger.info(f"waiting for urls from other shards, the start url belongs to shard {shard.partition.owner(start_url)}")
 
-        try:
-            # Make a HEAD request to fetch the resource's headers
-            # we'll use this later to check if the resource is HTML
-            logger.info(f"visiting: '{url}'")
-            response = s.head(url, allow_redirects=True)
+        if checkpoint is not None:
+            checkpoint.reset(history)
 
-        except Exception as err:
-            # making the HEAD request failed
-            # the failed request won't have a status code
-            # save connection error details continue to the next url
-            history[url]["error_text"] = str(err)
-            history[url]["response_code"] = 0
-            logger.error(f"while connecting: {err}")
-            continue
+    else:
+        logger.debug(f"adding start URL to history and to_be_visited: {start_url}")
 
-        # Update history with the response's status code
-        history[url]["response_code"] = response.status_code
+        history.add(
+            start_url,
+            response_code=None,
+            visited_from=[None],
+            error_text=None,
+            depth=0
+        )
 
-        # Determine if we should look for more links on this resource.
+        # adding beginning url to the to_be_visited
+        skip = url_filter.skip(start_url)
+        if skip is not None:
+            history[start_url]["response_code"], history[start_url]["error_text"] = skip
+        else:
+            targets.add(start_url)
+            to_be_visited.append(start_url, depth=0)
 
-        # Filter out resources that have no Content-Type header
-        # we can't tell if they are HTML content
-        if 'Content-Type' not in response.headers:
-            logger.debug(f"filtered out content with missing Content-Type header: {response.headers}")
-            continue
+        if checkpoint is not None:
+            checkpoint.reset(history)
 
-        # Filter out resources that are not HTML text
-        if 'text/html' not in response.headers['Content-Type'].lower():
-            logger.debug(f"filtered out non-HTML content: {response.headers['Content-Type']}")
-            continue
+    if shard is not None:
+        shard.start(resume)
 
-        # Filter out urls with status_code greater than 400
-        if int(response.status_code) >= 400:
-            logger.debug(f"filtered out error status code: {response.status_code}")
-            continue
+    if sitemap_reader is not None:
+        sitemap_reader.start()
 
-        # Filter out if the url netloc value is not same as start url netloc
-        if url_p.netloc != start_url_p.netloc:
-            logger.debug(f"filtered out external url: {url_p.netloc}")
-            continue
+    start_time = time.monotonic()
+    visited_count = 0
+
+    def touch(urls):
+        """
+        Mark history records as changed, for the checkpoint and the history file written during the crawl
+        :return: None
+        """
+
+        if checkpoint is not None:
+            checkpoint.touch(urls)
+        if history_writer is not None:
+            history_writer.touch(urls)
+
+    def finish_page(url, result, hrefs=None, ids=None, full_hrefs=None, skipped=False):
+        """
+        Record the result of visiting a url, and the links on it, in the history.
+        skipped is True for pages we didn't visit because they haven't changed since the previous run.
+        :return: None
+        """
+
+        if skipped is True:
+            metrics.skipped()
+        else:
+            metrics.visited(url, result["response_code"], result["timings"], not_modified=result["hrefs"] is not None)
+
+        # Update history with the response's status code and errors
+        if result["response_code"] is not None:
+            history[url]["response_code"] = result["response_code"]
+        if result["error_text"] is not None:
+            history[url]["error_text"] = result["error_text"]
+
+        if fail_fast is not None:
+            # stop the crawl once enough errors were found to fail the report
+            stop = fail_fast.check(url, result["response_code"], result["error_text"])
+            if stop is not None:
+                budget.stop(stop)
 
-        # Don't traverse any urls that are more than # of depth clicks away from the start page
-        # With the way we are calculating depth there may be a way
-        # to get to the page in fewer clicks and we don't take that into account currently
-        # it would involve updating the history dictionary
-        if depth is not None and depth <= history[url]["depth"]:
-            logger.debug(
-                f"ignoring links for url with depth {history[url]['depth']}: {url}"
+        if cache is not None and result["content"] is not None:
+            # save the links for the next run
+            cache.store(
+                url, result["response_code"], result["url"],
+                result["etag"], result["last_modified"], result["content_hash"], hrefs, ids
             )
-            continue
+        elif cache is not None and result["hrefs"] is not None:
+            cache.touch(url)
 
-        # Make a GET request to fetch the raw HTML content
-        try:
-            response = s.get(url)
-        except Exception as err:
-            # very unexpected to get an error here because
-            # our previous HEAD request should have been successful.
-            # log the error and continue to the next url
-            history[url]["error_text"] = f"While retrieving HTML content for {url}: {str(err)}"
-            logger.error(f"while connecting: {err}")
-            continue
+        updated = list()
+        if hrefs is not None:
+            updated = record_links(
+                history, to_be_visited, targets, url_filter, url, result["url"], hrefs, ids, full_hrefs, shard
+            )
+        # a hash of the page so later runs can tell if it changed,
+        # it is saved with the urls of the page that don't have a fragment
+        updated.extend(targets.finish(history, url, ids, result["content_hash"], result.get("duplicate_of")))
 
-        # Parse the html content
-        soup = bs.BeautifulSoup(response.text, 'lxml')
+        if len(depth_limited) > 0 and budget.exhausted is None:
+            # visit pages again whose links we can follow now that we found a shorter path to them
+            for u in updated:
+                if u in depth_limited and history[u]["depth"] is not None and depth > history[u]["depth"]:
+                    logger.debug(f"found a shorter path, following the links on: {u}")
+                    depth_limited.discard(u)
+                    to_be_visited.append(u, depth=history[u]["depth"])
 
-        # grab all the “<a>" tags on the page
-        atags = soup.find_all('a')
-        for atag in atags:
-            href = atag.get('href')
+        touch(updated)
+        if checkpoint is not None:
+            checkpoint.save_target(url, targets.get(url))
 
-            logger.debug(f"found url: {href}")
+    def skip_url(url, skip):
+        """
+        Record the response_code and error_text for a url we don't visit
+        :return: None
+        """
 
-            # filter out anchor tags without an href attribute
-            if href is None:
-                continue
+        metrics.skipped()
+        history[url]["response_code"], history[url]["error_text"] = skip
+        if fail_fast is not None:
+            stop = fail_fast.check(url, *skip)
+            if stop is not None:
+                budget.stop(stop)
+        updated = targets.finish(history, url)
+        touch(updated)
+        if checkpoint is not None:
+            checkpoint.save_target(url, targets.get(url))
 
-            # remove leading and trailing spaces from the href
-            # https://www.w3.org/TR/2014/REC-html5-20141028/infrastructure.html#valid-non-empty-url-potentially-surrounded-by-spaces
-            href = href.strip()
+    def finish_duplicate(url, result, original, hrefs, ids):
+        """
+        Record the result of a page with the same content as a page that was parsed before,
+        using the links and ids found on that page
+        :return: None
+        """
 
-            # filter out repeating url with # and email
-            if href.startswith("mailto:"):
-                continue
+        if not duplicates.follow_links(url):
+            # the links on copies of this family of urls only lead to more copies,
+            # the ids still tell if links to its fragments are broken
+            logger.debug(f"same content as {original}, not following its links: {url}")
+            result["content"] = None
+            finish_page(url, result, ids=ids)
+        else:
+            # relative links are resolved against this page's url
+            logger.debug(f"same content as {original}, using its links: {url}")
+            finish_page(url, result, hrefs, ids)
 
-            # convert to full link
-            full_href = urljoin(response.url, href)
+    # parse processes are started fresh instead of forked from this process and its worker threads
+    parse_pool = nullcontext()
+    if parse_workers > 0:
+        parse_pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn"))
 
-            # if href starts with # look through the HTML for an element with the same id
-            # if we find the element then add an entry to the history dictionary saying that we visited the page
-            # if we don't find the element add an entry to the history dictionary with error text that the element did not exist
-            if href.startswith("#"):
-                id_text = href[1:]
-                element = soup.find(id=id_text)
-                if element is not None:
-                    logger.debug(f"adding URL fragment to history as exists: {href}")
+    with ThreadPoolExecutor(max_workers=workers) as executor, parse_pool as parser:
 
-                    error_text = None
-                else:
-                    logger.debug(f"adding URL fragment to history as does not exist: {href}")
+        while (len(to_be_visited) > 0 or len(in_progress) > 0 or len(parsing) > 0
+               or (shard is not None and not shard.done) or (sitemap_reader is not None and not sitemap_reader.done)):
+
+            if sitemap_reader is not None:
+                # add the urls read from the sitemaps since the last time around
+                for url, lastmod, sitemap_url in sitemap_reader.poll():
+                    if url in history:
+                        # the sitemap isn't a page that links to the url, it's kept apart from visited_from
+                        if history[url].get("sitemap") is None:
+                            history[url]["sitemap"] = sitemap_url
+                            touch([url])
+                        # a url found through a link that is still waiting to be visited can be skipped by its lastmod
+                        if (previous is not None and lastmod is not None and history[url]["response_code"] is None
+                                and url not in in_progress):
+                            lastmods[url] = lastmod
+                        continue
+                    if url_filter.skip(url) is not None or (shard is not None and not shard.owns(url)):
+                        # only urls this crawl would visit if it found a link to them
+                        continue
+
+                    if previous is not None and lastmod is not None:
+                        lastmods[url] = lastmod
+
+                    # no link leads to the url yet, so it has no click depth, saved as None,
+                    # and with a depth limit its links aren't followed. a link to it that turns up later gives it one
+                    history.add(url, response_code=None, visited_from=[], error_text=None, depth=None, sitemap=sitemap_url)
+                    if targets.add(url) is True:
+                        to_be_visited.append(url, depth=None)
+                    else:
+                        targets.attach(history, url)
 
-                    # note that the element does not exist in the error_text
-                    error_text = f"Element with id '{id_text}' not found in HTML DOM"
+                    touch([url])
 
-                # handle cases where full_href does and does not exist in history dictionary
-                if full_href not in history:
+            if shard is not None:
+                # hand off the urls we found for other shards and pick up the ones they found for us
+                # a sitemap that is still being read can add urls whose links lead to other shards
+                idle = (len(to_be_visited) == 0 and len(in_progress) == 0 and len(parsing) == 0
+                        and (sitemap_reader is None or sitemap_reader.done))
+                for url, url_depth in shard.poll(idle):
+                    if url in history:
+                        # we found a link to it ourselves, maybe through a longer path
+                        updated = lower_depth(history, to_be_visited, targets, url, url_depth)
+                        touch(updated)
+                        continue
 
-                    # add url, visited_from and error_text to the history
-                    # we are using the same status code and depth as the parent page
-                    history[full_href] = dict(
-                        response_code=response.status_code,
-                        visited_from=[url],
-                        error_text=error_text,
-                        depth=history[url]["depth"]
+                    history.add(url, response_code=None, visited_from=[], error_text=None, depth=url_depth)
+                    updated = [url]
+                    if targets.add(url) is True:
+                        to_be_visited.append(url, depth=url_depth)
+                    else:
+                        targets.attach(history, url)
+                        updated.extend(lower_depth(history, to_be_visited, targets, targets.get(url)["url"], url_depth))
+
+                    touch(updated)
+
+            metrics.frontier(len(to_be_visited))
+
+            budget_exhausted = budget.check()
+            if budget_exhausted is not None:
+                # don't start new visits, the urls left are recorded as skipped so the history is complete
+                for url in to_be_visited.drain():
+                    skip_url(url, (-1, budget_exhausted))
+                if sitemap_reader is not None:
+                    sitemap_reader.stop()
+
+            # hand out urls until every worker is busy
+            # or we have to wait for a netloc's crawl delay,
+            # stop while the parse workers are behind so fetched pages don't pile up
+            while len(in_progress) < workers and len(parsing) < parse_backlog and budget.check() is None:
+
+                # get the oldest URL in to_be_visited whose netloc is ready for another request
+                url = to_be_visited.pop_ready()
+                if url is None:
+                    break
+
+                logger.info(f"processing: '{url}'")
+                logger.debug(f"url's left to be processed: {len(to_be_visited)}")
+
+                url_p = urlparse(url)
+
+                # Filter out if the url netloc value is not same as start url netloc
+                # Don't traverse any urls that are more than # of depth clicks away from the start page,
+                # urls are handed out shortest path first and if a shorter path to a page
+                # turns up later, the page is visited again to follow its links
+                follow_links = True
+                if url_p.netloc != start_url_p.netloc:
+                    follow_links = False
+                elif depth is not None and (history[url]["depth"] is None or depth <= history[url]["depth"]):
+                    follow_links = False
+                    depth_limited.add(url)
+
+                # pages whose sitemap lastmod is older than the previous run haven't changed,
+                # use the result from then, and the links and ids the validator cache or the previous history
+                # has for the page
+                unchanged = None
+                if url in lastmods:
+                    unchanged = previous.unchanged_page(url, lastmods.pop(url))
+                entry = None
+                links = None
+                if unchanged is not None and follow_links is True:
+                    if cache is not None:
+                        entry = cache.get(url)
+                    if entry is None or entry["content_hash"] is None or entry["content_hash"] != unchanged.get("content_hash"):
+                        entry = None
+                        links = previous.links(url, unchanged.get("content_hash"))
+                        if links is None:
+                            # without the page's ids, links to its fragments can't be checked
+                            unchanged = None
+                if unchanged is not None:
+                    logger.debug(f"unchanged since the previous run according to its sitemap: {url}")
+                    result = dict(
+                        response_code=unchanged["response_code"],
+                        error_text=unchanged["error_text"],
+                        url=url,
+                        content=None,
+                        hrefs=None,
+                        content_hash=unchanged.get("content_hash"),
+                        timings=None
                     )
-                else:
-                    # add visited_from with the url
-                    history[full_href]["visited_from"].append(url)
-                    history[full_href]["error_text"] = error_text
+                    if entry is not None:
+                        # the entry is still in use, keep it from being evicted
+                        cache.touch(url)
+                        result["url"] = entry["url"]
+                        finish_page(url, result, entry["hrefs"], set(entry["ids"]), skipped=True)
+                    elif links is not None:
+                        finish_page(url, result, *links, skipped=True)
+                    else:
+                        finish_page(url, result, skipped=True)
+                    continue
 
-                continue
+                # the response_code and error_text for urls we don't need to visit,
+                # urls matching the exclude rules never make it into to_be_visited
+                skip = None
 
-            # check if link exists in history dictionary
-            if full_href not in history:
+                # fail fast on hosts that are down or too slow
+                if skip is None and hosts.is_down(url_p.netloc):
+                    msg = hosts.message(url_p.netloc)
+                    logger.debug(msg)
+                    skip = (0, msg)
 
-                logger.debug(f"adding URL to history and to_be_visited: {full_href}")
+                # check if our robot is allowed to visit this url
+                # before we spend any of the netloc's crawl delay on it
+                robots_txt = robots.get(url_p.netloc)
+                if skip is None and robots_txt is not None and robots_txt["parser"] is None:
+                    # we couldn't retrieve the robots.txt, the host is probably down
+                    msg = f"Skipped, could not retrieve robots.txt for host {url_p.netloc}: {robots_txt['error_text']}"
+                    logger.debug(msg)
+                    skip = (0, msg)
 
-                # add url, visited_from and error_text to the history
-                history[full_href] = dict(
-                    response_code=None,
-                    visited_from=[url],
-                    error_text=None,
-                    depth=history[url]["depth"]+1
+                if skip is None and robots_txt is not None:
+                    can_fetch = robots_txt["parser"].can_fetch(s.headers['User-Agent'], url)
+                    if can_fetch is False:
+                        # we are not allowed to crawl this url
+                        # due to a rule in robots.txt
+                        msg = "Matched robots.txt exclude rule."
+                        logger.debug(msg)
+                        skip = (-1, msg)
+
+                if skip is not None:
+                    skip_url(url, skip)
+                    continue
+
+                if robots_txt is None:
+                    # the worker will retrieve the robots.txt for this netloc,
+                    # wait for it before handing out more urls from the netloc
+                    to_be_visited.hold(url_p.netloc)
+
+                to_be_visited.reserve(url_p.netloc)
+                budget.visit()
+                future = executor.submit(
+                    visit, s, url, robots,
+                    follow_links=follow_links,
+                    fetch_mode=fetch_mode,
+                    cache=cache
                 )
+                in_progress[future] = url
+                started[future] = time.monotonic()
 
-                # append url to to_be_visited list
-                to_be_visited.append(full_href)
+            if len(in_progress) == 0 and len(parsing) == 0:
+                # every waiting url is on a netloc that is still in its crawl delay,
+                # or there are none and we are waiting for urls from the sitemaps or other shards
+                ready_in = to_be_visited.next_ready_in()
+                wait_time = ready_in
+                if sitemap_reader is not None and not sitemap_reader.done:
+                    wait_time = min(ready_in or SITEMAP_POLL_INTERVAL, SITEMAP_POLL_INTERVAL)
+                if ready_in is not None:
+                    metrics.waited(wait_time)
+                elif wait_time is None and shard is not None and not shard.done:
+                    wait_time = shard.poll_interval
+                if wait_time is not None:
+                    time.sleep(wait_time)
+                continue
 
-            else:
+            # wait for a worker to finish visiting or parsing a url
+            # or, if a worker is free, for the next netloc to come out of its crawl delay
+            wait_time = None
+            if len(in_progress) < workers and len(parsing) < parse_backlog:
+                wait_time = to_be_visited.next_ready_in()
+            if sitemap_reader is not None and not sitemap_reader.done:
+                wait_time = min(wait_time or SITEMAP_POLL_INTERVAL, SITEMAP_POLL_INTERVAL)
+            done, _ = wait(list(in_progress) + list(parsing), timeout=wait_time, return_when=FIRST_COMPLETED)
 
-                logger.debug(f"marking '{full_href}' as visited from '{url}'")
+            for future in done:
 
-                # add visited_from with the url
-                history[full_href]["visited_from"].append(url)
+                if future in parsing:
+                    # the parse stage found the links on a page
+                    url, result = parsing.pop(future)
+                    (hrefs, ids, full_hrefs), result["timings"]["parse"] = future.result()
+                    duplicates.store(result["content_hash"], hrefs, ids)
+                    finish_page(url, result, hrefs, ids, full_hrefs)
+                    for copy_url, copy_result in waiting_for_parse.pop(result["content_hash"], []):
+                        finish_duplicate(copy_url, copy_result, url, hrefs, ids)
+                    continue
+
+                url = in_progress.pop(future)
+                elapsed = time.monotonic() - started.pop(future)
+                result = future.result()
+                visited_count += 1
+
+                netloc = urlparse(url).netloc
+                hosts.record(netloc, url, result["response_code"], result["error_text"], elapsed)
+
+                if result["timings"] is not None:
+                    budget.downloaded(result["timings"]["bytes"])
+
+                if to_be_visited.is_held(netloc):
+                    # the robots.txt for the netloc has been handled,
+                    # use its Crawl-delay rule if it has one
+                    to_be_visited.release(netloc)
+                    robots_txt = robots.get(netloc)
+                    if robots_txt is not None and robots_txt["parser"] is not None:
+                        robots_crawl_delay = robots_txt["parser"].crawl_delay(s.headers['User-Agent'])
+                        if robots_crawl_delay is not None:
+                            to_be_visited.set_crawl_delay(netloc, float(robots_crawl_delay))
+
+                # visit the url again later if it failed in a way that might not last,
+                # other urls are visited in the meantime
+                wait_time = None
+                # a failed robots.txt is kept for the rest of the crawl, so the urls that failed on it aren't retried
+                robots_txt = robots.get(netloc)
+                robots_failed = robots_txt is not None and robots_txt["parser"] is None
+                if budget.exhausted is None and robots_failed is False:
+                    wait_time = retries.retry_in(url, result["response_code"], result["retry_after"])
+                if wait_time is not None:
+                    metrics.retried()
+                    logger.info(f"retrying in {wait_time:.1f} seconds: '{url}'")
+                    retry_at = time.monotonic() + wait_time
+                    if result["response_code"] != 0:
+                        # the server is busy, give the whole netloc a break
+                        to_be_visited.delay(netloc, retry_at)
+                    to_be_visited.append(url, not_before=retry_at, depth=history[url]["depth"])
+                    continue
+
+                if result["content"] is not None:
+                    entry = None
+                    if cache is not None:
+                        entry = cache.get(url)
+
+                    # pages served under several urls are only parsed once
+                    original = duplicates.original(url, result["content_hash"])
+                    copy = None
+                    if original is not None:
+                        result["duplicate_of"] = urldefrag(original).url
+                        copy = duplicates.get(result["content_hash"])
+
+                    # the links and ids the previous history recorded for the page, if its content is the same
+                    carried = None
+                    if previous is not None:
+                        carried = previous.links(url, result["content_hash"])
+
+                    if entry is not None and entry["content_hash"] == result["content_hash"]:
+                        # the page is the same as in the last run, use the links we found then
+                        logger.debug(f"unchanged content, using cached links: {url}")
+                        finish_page(url, result, entry["hrefs"], set(entry["ids"]))
+                    elif carried is not None:
+                        # the page is the same as in the previous run, carry its links and ids forward
+                        logger.debug(f"unchanged content, using links from previous history: {url}")
+                        finish_page(url, result, *carried)
+                    elif original is not None and result["content_hash"] in waiting_for_parse:
+                        # the same content is being parsed for another url, wait for its links
+                        logger.debug(f"same content as {original}, waiting for its links: {url}")
+                        waiting_for_parse[result["content_hash"]].append((url, result))
+                    elif original is not None and not duplicates.follow_links(url):
+                        ids = copy[1] if copy is not None else targets.find(original)["ids"]
+                        finish_duplicate(url, result, original, None, ids)
+                    elif copy is not None:
+                        # the same content was parsed for another url, use the links we found there
+                        finish_duplicate(url, result, original, copy[0], copy[1])
+                    elif parser is not None:
+                        # look for links in the page's html in a parse worker,
+                        # the page is finished when they come back
+                        parse_future = parser.submit(timed_parse_page, result["content"], result["encoding"], result["url"])
+                        parsing[parse_future] = (url, result)
+                        if result["content_hash"] is not None:
+                            waiting_for_parse.setdefault(result["content_hash"], list())
+                    else:
+                        # look for links in the page's html
+                        links, result["timings"]["parse"] = timed_parse_page(
+                            result["content"], result["encoding"], result["url"]
+                        )
+                        duplicates.store(result["content_hash"], links[0], links[1])
+                        finish_page(url, result, *links)
+                elif result["hrefs"] is not None:
+                    # the page hasn't changed, use the links from the cache
+                    finish_page(url, result, result["hrefs"], result["ids"])
+                else:
+                    finish_page(url, result)
+
+            # save the changes to the history since the last checkpoint
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.write(history)
+            if history_writer is not None and history_writer.due():
+                history_writer.write(history)
+
+    if sitemap_reader is not None:
+        sitemap_reader.stop()
+
+    metrics.finish()
+
+    elapsed = time.monotonic() - start_time
+    logger.info(
+        f"visited {visited_count} urls with {workers} worker(s) in {elapsed:.1f} seconds"
+        f" ({visited_count / max(elapsed, 1e-9):.2f} pages/sec)"
+    )
 
     return history
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+
+from collections import OrderedDict
+
+from checkrs_linkto.ignore import FirstMatch
+from checkrs_linkto.urls import canonicalize
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_MAX_PARSED_PAGES = 1000
+
+
+class ValidatorCache:
+    """
+    On-disk cache of the HTTP validators (ETag and Last-Modified headers),
+    content hash and links found on each page we parsed.
+    Pages that haven't changed since the last run answer a conditional request with 304 Not Modified,
+    so we can reuse their links without downloading or parsing them again.
+    Pages without validators reuse their links when the downloaded content has the same hash.
+    """
+
+    def __init__(self, filename, max_entries=DEFAULT_MAX_ENTRIES):
+
+        self.filename = filename
+        self.max_entries = max_entries
+
+        # canonical url -> dictionary with the validators, status code and links of the page
+        self.entries = dict()
+
+        # number of the current run, used to evict entries that haven't been used recently
+        self.run = 1
+
+    def load(self):
+        """
+        Read the cache file if it exists
+        :return: self
+        """
+
+        if not os.path.isfile(self.filename):
+            logger.debug(f"no validator cache found at {self.filename}")
+            return self
+
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except Exception as err:
+            # a broken cache only costs us a full crawl
+            logger.error(f"while reading validator cache {self.filename}: {err}")
+            return self
+
+        self.run = data["run"] + 1
+        self.entries = data["entries"]
+
+        logger.debug(f"loaded {len(self.entries)} validator cache entries from {self.filename}")
+
+        return self
+
+    def save(self):
+        """
+        Evict the least recently used entries and write the cache file
+        :return: self
+        """
+
+        self.evict()
+
+        data = {
+            "run": self.run,
+            "entries": self.entries
+        }
+
+        # write to a temporary file first so an interrupted run doesn't leave a broken cache
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_filename, self.filename)
+
+        logger.debug(f"saved {len(self.entries)} validator cache entries to {self.filename}")
+
+        return self
+
+    def evict(self):
+        """
+        Remove entries until the cache holds at most max_entries,
+        entries that were used in the fewest recent runs are removed first
+        :return: number of removed entries
+        """
+
+        extra = len(self.entries) - self.max_entries
+        if extra <= 0:
+            return 0
+
+        oldest = sorted(self.entries.keys(), key=lambda url: self.entries[url]["last_used"])
+        for url in oldest[:extra]:
+            del self.entries[url]
+
+        logger.debug(f"evicted {extra} validator cache entries")
+
+        return extra
+
+    def get(self, url):
+        return self.entries.get(canonicalize(url))
+
+    def conditional_headers(self, url):
+        """
+        Build the headers for a conditional request of a url
+        :return: dictionary with If-None-Match and If-Modified-Since headers,
+            empty if we don't have validators for the url
+        """
+
+        headers = dict()
+
+        entry = self.get(url)
+        if entry is None:
+            return headers
+
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def touch(self, url):
+        """
+        Mark an entry as used in this run
+        :return: None
+        """
+
+        entry = self.get(url)
+        if entry is not None:
+            entry["last_used"] = self.run
+
+    def store(self, url, response_code, page_url, etag, last_modified, content_hash, hrefs, ids):
+        """
+        Save the validators, content hash and links of a page
+        :return: None
+        """
+
+        self.entries[canonicalize(url)] = dict(
+            etag=etag,
+            last_modified=last_modified,
+            response_code=response_code,
+            url=page_url,
+            content_hash=content_hash,
+            hrefs=hrefs,
+            ids=sorted(ids),
+            last_used=self.run
+        )
+
+
+class DuplicatePages:
+    """
+    Pages fetched in this run, by the hash of their content, so pages served under several urls
+    are parsed once. The first url a content was fetched from is kept for every content,
+    the links and ids parsed from the max_entries most recently used contents are kept for the copies.
+    Links on copies whose url matches one of the no_follow_patterns are not followed at all,
+    for families of urls, like versioned mirrors, whose copies only link to more copies.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_PARSED_PAGES, no_follow_patterns=[]):
+
+        self.max_entries = max_entries
+        self.no_follow = FirstMatch(no_follow_patterns)
+
+        # content hash -> first url with that content
+        self.originals = dict()
+
+        # content hash -> (hrefs, ids), least recently used first
+        self.parsed = OrderedDict()
+
+    def original(self, url, content_hash):
+        """
+        Register the content of a page
+        :return: the first url with the same content, or None if this is the first one
+        """
+
+        if content_hash is None:
+            return None
+
+        original = self.originals.setdefault(content_hash, url)
+        if original == url:
+            return None
+        return original
+
+    def follow_links(self, url):
+        return self.no_follow.search(url) is None
+
+    def get(self, content_hash):
+        """
+        Look up the links parsed from a content
+        :return: tuple with the list of hrefs and the set of ids, or None
+        """
+
+        links = self.parsed.get(content_hash)
+        if links is not None:
+            self.parsed.move_to_end(content_hash)
+        return links
+
+    def store(self, content_hash, hrefs, ids):
+        """
+        Save the links parsed from a content
+        :return: None
+        """
+
+        if content_hash is None or self.max_entries <= 0:
+            return
+
+        self.parsed[content_hash] = (hrefs, ids)
+        self.parsed.move_to_end(content_hash)
+        while len(self.parsed) > self.max_entries:
+            self.parsed.popitem(last=False)
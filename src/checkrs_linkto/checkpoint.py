@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import time
+
+from checkrs_linkto.history import HistoryStore
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+DEFAULT_INTERVAL = 60 # seconds
+
+
+class CrawlCheckpoint:
+    """
+    Append-only journal of the crawl's history, so an interrupted crawl can be resumed.
+    Every few seconds the history records that changed since the last checkpoint are appended
+    to the file as one json object per line. Only the visited_from entries added to the history's edge table
+    since the last checkpoint are written, so the cost of a checkpoint grows with the changes,
+    not with the size of the history.
+    """
+
+    def __init__(self, filename, interval=DEFAULT_INTERVAL):
+
+        self.filename = filename
+        self.interval = interval
+
+        # urls whose history record changed since the last checkpoint, in the order they changed
+        self.dirty = dict()
+
+        # number of edges from the history's edge table already written to the file
+        self.written_edges = 0
+
+        # url -> result of a finished visit that hasn't been written yet
+        self.targets = dict()
+
+        self.last_write = time.monotonic()
+
+    def touch(self, urls):
+        """
+        Mark history records as changed
+        :return: None
+        """
+
+        for url in urls:
+            self.dirty[url] = None
+
+    def save_target(self, url, target):
+        """
+        Remember the result of a finished visit from checkrs_linkto.urls.VisitTargets,
+        links to the same resource found after a resume use it
+        :return: None
+        """
+
+        self.targets[url] = target
+
+    def due(self):
+        return time.monotonic() - self.last_write >= self.interval
+
+    def reset(self, history=None):
+        """
+        Start a new checkpoint file with the records already in the history, like the start url,
+        so a crawl that is stopped before its first interval can still be resumed
+        :return: self
+        """
+
+        with open(self.filename, "w"):
+            pass
+
+        self.written_edges = 0
+        if history is not None:
+            self.write(history)
+
+        return self
+
+    def write(self, history):
+        """
+        Append the changed history records and finished visits to the checkpoint file
+        :return: self
+        """
+
+        # group the new edges by url
+        new_edges = dict()
+        for url, visited_from in history.edges(self.written_edges):
+            if url not in new_edges:
+                new_edges[url] = list()
+            new_edges[url].append(visited_from)
+            # urls only get new edges when they are touched, this is just in case
+            self.dirty[url] = None
+
+        with open(self.filename, "a") as f:
+            for url in self.dirty.keys():
+                line = history.fields(url)
+                line["url"] = url
+                line["visited_from"] = new_edges.get(url, [])
+                f.write(json.dumps(line) + "\n")
+
+            for url, target in self.targets.items():
+                ids = target["ids"]
+                if ids is not None:
+                    ids = sorted(ids)
+                line = dict(
+                    url=url,
+                    target=dict(
+                        response_code=target["response_code"],
+                        error_text=target["error_text"],
+                        ids=ids,
+                        content_hash=target["content_hash"],
+                        duplicate_of=target["duplicate_of"]
+                    )
+                )
+                f.write(json.dumps(line) + "\n")
+
+            # make sure the checkpoint survives the process being killed
+            f.flush()
+            os.fsync(f.fileno())
+
+        logger.debug(f"wrote {len(self.dirty)} changed urls to checkpoint {self.filename}")
+
+        self.written_edges = history.edge_count()
+        self.dirty = dict()
+        self.targets = dict()
+        self.last_write = time.monotonic()
+
+        return self
+
+    def load(self):
+        """
+        Replay the checkpoint file
+        :return: tuple with the HistoryStore and a dictionary of url -> result of finished visits
+        """
+
+        history = HistoryStore()
+        targets = dict()
+
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    line = json.loads(line)
+                except ValueError:
+                    # the last line might be cut short if we were killed while writing it
+                    logger.debug(f"ignoring incomplete line in checkpoint {self.filename}")
+                    continue
+
+                url = line.pop("url")
+
+                if "target" in line:
+                    targets[url] = line["target"]
+                    if targets[url]["ids"] is not None:
+                        targets[url]["ids"] = set(targets[url]["ids"])
+                    continue
+
+                visited_from = line.pop("visited_from")
+                if url not in history:
+                    history.add(url, **line)
+                else:
+                    for key, value in line.items():
+                        history[url][key] = value
+                for source in visited_from:
+                    history.add_edge(url, source)
+
+        self.written_edges = history.edge_count()
+
+        logger.info(f"loaded {len(history)} urls from checkpoint {self.filename}")
+
+        return history, targets
+
+    def remove(self):
+        """
+        Delete the checkpoint file after the crawl finished
+        :return: None
+        """
+
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
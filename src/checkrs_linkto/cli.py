@@ -0,0 +1,739 @@
+"""
+The linkto command, with the bot, report and merge subcommands of the linkto_bot, linkto_report
+and linkto_merge scripts, and check, which crawls and reports in one process without reading the history back.
+The modules a subcommand needs are imported when it runs, so the command starts quickly.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from checkrs_linkto.history import HISTORY_FORMATS
+
+
+def add_bot_arguments(command_parser):
+    """
+    Add the options of the bot subcommand, they override the bot section of the configuration file
+    :return: None
+    """
+
+    command_parser.add_argument(
+        "--url",
+        help="url to start checking from",
+        action="store",
+        dest="url",
+        type=str)
+
+    command_parser.add_argument(
+        "--history",
+        help="name of the output json file",
+        action="store",
+        dest="history",
+        type=str)
+
+    command_parser.add_argument(
+        "--history-format",
+        help="format of the output file, 'json' for one json document or 'ndjson' for one line per url",
+        action="store",
+        dest="history_format",
+        choices=HISTORY_FORMATS,
+        type=str)
+
+    command_parser.add_argument(
+        "--depth",
+        help="restrict bot by the number of clicks away from the original page",
+        action="store",
+        dest="depth",
+        type=int)
+
+    command_parser.add_argument(
+        "--debug",
+        help="turn on debugging messages in the log",
+        action="store_true",
+        dest="debug")
+
+    command_parser.add_argument(
+        "--stream-log",
+        help="print log messages to the console",
+        action="store_true",
+        dest="stream_log")
+
+    command_parser.add_argument(
+        "--exclude-external-urls",
+        help="skip making requests to urls that don't match the start url's netloc",
+        action="store_true",
+        dest="exclude_external_urls")
+
+    command_parser.add_argument(
+        "--workers",
+        help="number of urls to visit at the same time",
+        action="store",
+        dest="workers",
+        type=int)
+
+    command_parser.add_argument(
+        "--parse-workers",
+        help="number of processes that parse pages for links, 0 parses them in the main process",
+        action="store",
+        dest="parse_workers",
+        type=int)
+
+    command_parser.add_argument(
+        "--fetch-mode",
+        help="'head' to check urls with a HEAD request, 'get' to make a single streamed GET request per url",
+        action="store",
+        dest="fetch_mode",
+        choices=["head", "get"],
+        type=str)
+
+    command_parser.add_argument(
+        "--validator-cache",
+        help="reuse links from pages that haven't changed since the last run, cached next to the history file",
+        action="store_true",
+        dest="validator_cache")
+
+    command_parser.add_argument(
+        "--previous-history",
+        help="history file from a previous run, unchanged pages aren't parsed again "
+             "and pages whose sitemap lastmod is older than that run aren't requested again",
+        action="store",
+        dest="previous_history",
+        type=str)
+
+    command_parser.add_argument(
+        "--max-pages",
+        help="stop the crawl after visiting this many urls",
+        action="store",
+        dest="max_pages",
+        type=int)
+
+    command_parser.add_argument(
+        "--max-seconds",
+        help="stop the crawl after running this many seconds",
+        action="store",
+        dest="max_seconds",
+        type=float)
+
+    command_parser.add_argument(
+        "--max-bytes",
+        help="stop the crawl after downloading this many bytes",
+        action="store",
+        dest="max_bytes",
+        type=int)
+
+    command_parser.add_argument(
+        "--fail-fast",
+        help="stop the crawl after finding this many errors that the report doesn't ignore",
+        action="store",
+        dest="fail_fast",
+        type=int)
+
+    command_parser.add_argument(
+        "--sitemaps",
+        help="add the urls in the sitemaps listed in the start url's robots.txt to the crawl",
+        action="store_true",
+        dest="sitemaps")
+
+    command_parser.add_argument(
+        "--checkpoint",
+        help="periodically save the crawl's progress next to the history file",
+        action="store_true",
+        dest="checkpoint")
+
+    command_parser.add_argument(
+        "--resume",
+        help="continue the crawl from the last checkpoint",
+        action="store_true",
+        dest="resume")
+
+    command_parser.add_argument(
+        "--shard",
+        help="number of the shard this bot crawls, from 0 to shards - 1",
+        action="store",
+        dest="shard",
+        type=int)
+
+    command_parser.add_argument(
+        "--shards",
+        help="number of shards the crawl is split into",
+        action="store",
+        dest="shards",
+        type=int)
+
+    command_parser.add_argument(
+        "--shard-spool",
+        help="name of the SQLite file the shards use to hand off urls to each other",
+        action="store",
+        dest="shard_spool",
+        type=str)
+
+    command_parser.add_argument(
+        "--metrics",
+        help="name of the file the crawl's timings and counters are written to",
+        action="store",
+        dest="metrics",
+        type=str)
+
+    command_parser.add_argument(
+        "--logfile",
+        help="name of the logfile",
+        action="store",
+        dest="logfile",
+        type=str)
+
+
+def add_report_arguments(command_parser, check=False):
+    """
+    Add the options of the report subcommand, they override the report section of the configuration file.
+    check leaves out the options the check subcommand takes from the bot's options
+    :return: list of the dest names of the options
+    """
+
+    actions = list()
+
+    actions.append(command_parser.add_argument(
+        "--golden-file",
+        help="file from previous run that we will compare against",
+        action="store",
+        dest="history_golden",
+        type=str))
+
+    if check is False:
+        actions.append(command_parser.add_argument(
+            "--new-file",
+            help="file from the current run",
+            action="store",
+            dest="history_new",
+            type=str))
+
+    actions.append(command_parser.add_argument(
+        "--report",
+        help="name of the output report",
+        action="store",
+        dest="report",
+        type=str))
+
+    actions.append(command_parser.add_argument(
+        "--report-jsonl",
+        help="name of the report written as json lines, one record per line",
+        action="store",
+        dest="report_jsonl",
+        type=str))
+
+    actions.append(command_parser.add_argument(
+        "--report-junit",
+        help="name of the report written as JUnit XML",
+        action="store",
+        dest="report_junit",
+        type=str))
+
+    if check is False:
+        actions.append(command_parser.add_argument(
+            "--metrics",
+            help="json metrics file linkto_bot wrote for the new file, to list its slowest pages",
+            action="store",
+            dest="metrics",
+            type=str))
+
+    actions.append(command_parser.add_argument(
+        "--summary",
+        help="name of the report summary",
+        action="store",
+        dest="summary",
+        type=str))
+
+    if check is False:
+        actions.append(command_parser.add_argument(
+            "--debug",
+            help="turn on debugging messages in the log",
+            action="store_true",
+            dest="debug"))
+
+        actions.append(command_parser.add_argument(
+            "--stream-log",
+            help="print log messages to the console",
+            action="store_true",
+            dest="stream_log"))
+
+        actions.append(command_parser.add_argument(
+            "--logfile",
+            help="name of the logfile",
+            action="store",
+            dest="logfile",
+            type=str))
+
+    return [action.dest for action in actions]
+
+
+def add_merge_arguments(command_parser):
+    """
+    Add the options of the merge subcommand, it doesn't read the configuration file
+    :return: None
+    """
+
+    command_parser.add_argument(
+        "histories",
+        help="history files written by the shards",
+        nargs="+",
+        type=str)
+
+    command_parser.add_argument(
+        "--output",
+        help="name of the combined history file",
+        action="store",
+        dest="output",
+        required=True,
+        type=str)
+
+    command_parser.add_argument(
+        "--history-format",
+        help="format of the combined history file",
+        action="store",
+        dest="history_format",
+        choices=HISTORY_FORMATS,
+        default="json",
+        type=str)
+
+    command_parser.add_argument(
+        "--debug",
+        help="turn on debugging messages in the log",
+        action="store_true",
+        dest="debug")
+
+
+def add_config_argument(command_parser):
+    command_parser.add_argument(
+        "--config",
+        help="name of the configuration file",
+        action="store",
+        dest="config",
+        default="config_default.yml",
+        type=str)
+
+
+def read_config(filename):
+    """
+    Read the configuration file
+    :return: dictionary with the bot and report sections
+    """
+
+    import yaml
+
+    with open(filename) as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
+
+
+def setup_logging(logger_names, options, stream=None):
+    """
+    Send the messages of the loggers to the logfile and, with stream_log, to the console.
+    stream overrides stream_log, and without a logfile only the console is used
+    :return: None
+    """
+
+    if options.get('debug', False) is True:
+        loglevel = logging.DEBUG
+    else:
+        loglevel = logging.INFO
+
+    # create logging formatter
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = list()
+
+    # set up a log file
+    # create file handler which logs even debug messages
+    if options.get('logfile') is not None:
+        handlers.append(logging.FileHandler(options['logfile']))
+
+    # set up a log streamer
+    if stream is None:
+        stream = options.get('stream_log', False)
+    if stream is True:
+        handlers.append(logging.StreamHandler())
+
+    for handler in handlers:
+        handler.setLevel(logging.NOTSET)
+        handler.setFormatter(formatter)
+
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        logger.setLevel(loglevel)
+        for handler in handlers:
+            logger.addHandler(handler)
+
+
+def run_bot(options, report_options={}):
+    """
+    Crawl the site of the bot options and write the history file,
+    fail_fast errors are the ones the ignore rules of the report options don't match
+    :return: the history, a HistoryStore
+    """
+
+    import time
+
+    from checkrs_linkto.bot import bot
+    from checkrs_linkto.cache import DuplicatePages, ValidatorCache
+    from checkrs_linkto.checkpoint import CrawlCheckpoint
+    from checkrs_linkto.history import HistoryWriter, PreviousHistory, write_history
+    from checkrs_linkto.hosts import HostHealth, RobotsCache
+    from checkrs_linkto.metrics import CrawlMetrics
+    from checkrs_linkto.report import FailFast
+    from checkrs_linkto.scheduler import CrawlBudget, RetryPolicy
+    from checkrs_linkto.shards import ShardPartition, ShardSpool
+
+    logger = logging.getLogger('linkto_bot')
+
+    # load the validator cache that sits next to the history file
+    cache = None
+    if options.get('validator_cache', False) is True:
+        cache_fn = os.path.splitext(options['history'])[0] + '.cache.json'
+        cache = ValidatorCache(cache_fn, options.get('validator_cache_max_entries', 50000)).load()
+
+    # robots.txt results, optionally saved next to the history file for the next run
+    robots_fn = None
+    if options.get('robots_cache', False) is True:
+        robots_fn = os.path.splitext(options['history'])[0] + '.robots.json'
+    robots = RobotsCache(robots_fn, options.get('robots_ttl', 3600)).load()
+
+    # give up on hosts that keep failing
+    hosts = HostHealth(
+        options.get('host_failure_threshold'),
+        options.get('slow_request_seconds'),
+        window=options.get('host_failure_window', 300)
+    )
+
+    # retry connection errors and overloaded servers later in the crawl instead of waiting for them
+    retries = RetryPolicy(
+        options.get('max_retries', 2),
+        options.get('retry_backoff', 1),
+        options.get('max_retry_after', 300),
+        options.get('host_retry_budget', 20)
+    )
+
+    # limits on the size of the crawl
+    budget = CrawlBudget(options.get('max_pages'), options.get('max_seconds'), options.get('max_bytes'))
+
+    # stop the crawl once it found enough errors to fail the report
+    fail_fast = None
+    if options.get('fail_fast') is not None:
+        fail_fast = FailFast(
+            options['fail_fast'],
+            report_options.get('ignored_connection_error_patterns') or [],
+            report_options.get('ignored_status_error_patterns') or []
+        )
+
+    # parse pages served under several urls once
+    duplicates = DuplicatePages(
+        options.get('duplicate_pages_max_entries', 1000),
+        options.get('duplicate_no_follow_patterns', [])
+    )
+
+    # load the history from a previous run for an incremental crawl
+    previous = None
+    if options.get('previous_history') is not None:
+        previous = PreviousHistory.load(options['previous_history'])
+
+    # setup checkpoints of the crawl's progress next to the history file
+    checkpoint = None
+    resume = options.get('resume', False)
+    if options.get('checkpoint', False) is True or resume is True:
+        checkpoint_fn = os.path.splitext(options['history'])[0] + '.checkpoint.jsonl'
+        checkpoint = CrawlCheckpoint(checkpoint_fn, options.get('checkpoint_interval', 60))
+
+        if resume is True and not os.path.isfile(checkpoint_fn):
+            logger.error(f"no checkpoint found at {checkpoint_fn}, starting a new crawl")
+            resume = False
+
+    # split the crawl between bots, each one visits the urls of its shard
+    shard = None
+    if options.get('shards', 1) > 1:
+        partition = ShardPartition(
+            options['shards'],
+            options.get('shard_mode', 'hash'),
+            options.get('shard_prefixes'),
+            options.get('strip_query_params', [])
+        )
+        shard = ShardSpool(
+            options['shard_spool'],
+            options.get('shard', 0),
+            partition,
+            options.get('shard_poll_interval', 1)
+        )
+
+    # phase timings of every request and counters of the crawl
+    metrics = CrawlMetrics(options.get('metrics_slowest_pages', 100))
+
+    # pages are skipped by their sitemap lastmod if they haven't changed since the crawl started,
+    # a resumed crawl started before the checkpoint so its start time isn't known
+    crawl_started = None
+    if resume is False:
+        crawl_started = time.time()
+
+    # the ndjson history is written while the crawl runs, the json history once it is done
+    history_format = options.get('history_format', 'json')
+    history_writer = None
+    if history_format == 'ndjson':
+        history_writer = HistoryWriter(
+            options['history'], options['url'], crawl_started, options.get('history_flush_interval', 10)
+        )
+
+    history = bot(
+        options['url'],
+        options['depth'],
+        options['crawl_delay'],
+        options['exclude_external_urls'],
+        options['exclude_url_patterns'],
+        options['request_timeout'],
+        workers=options.get('workers', 1),
+        parse_workers=options.get('parse_workers', 0),
+        fetch_mode=options.get('fetch_mode', 'head'),
+        cache=cache,
+        previous=previous,
+        strip_query_params=options.get('strip_query_params', []),
+        checkpoint=checkpoint,
+        resume=resume,
+        robots=robots,
+        hosts=hosts,
+        retries=retries,
+        shard=shard,
+        metrics=metrics,
+        sitemaps=options.get('sitemaps', False),
+        sitemap_urls=options.get('sitemap_urls', []),
+        budget=budget,
+        duplicates=duplicates,
+        fail_fast=fail_fast,
+        history_writer=history_writer
+    )
+
+    if options.get('metrics') is not None:
+        metrics.write(options['metrics'], options.get('metrics_format', 'json'))
+
+    if shard is not None:
+        shard.close()
+
+    if cache is not None:
+        cache.save()
+
+    robots.save()
+
+    # saving the history into a file, this is where the dictionary shaped records are built
+    if history_writer is not None:
+        history_writer.close(history)
+    else:
+        write_history(options['history'], options['url'], history, history_format, crawl_started)
+
+    # the crawl is complete, we don't need the checkpoint anymore
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    return history
+
+
+def check_readable(filename):
+    """
+    Check that a history file exists before reporting on it
+    :return: True if the file can be read
+    """
+
+    if not (os.path.isfile(filename) and os.access(filename, os.R_OK)):
+        logging.getLogger('linkto_report').error(f"File {filename} doesn't exist or isn't readable")
+        return False
+    return True
+
+
+def run_report(options, history=None, start_url=None):
+    """
+    Compare the new history with the golden history and write the report and its summary.
+    The new history is the history_new file, or history, the bot's history of start_url, when it is given
+    :return: exit status, 0 if no errors were found, 1 if they were and 2 if a history file is missing
+    """
+
+    from checkrs_linkto.report import LinkToReport
+    from checkrs_linkto.sinks import JsonLinesReportSink, JUnitReportSink, TextReportSink
+
+    logger = logging.getLogger('linkto_report')
+
+    # check if the golden file exists
+    if not check_readable(options['history_golden']):
+        return 2
+
+    # check if the new file exists
+    if history is None:
+        if not check_readable(options['history_new']):
+            return 2
+        history = options['history_new']
+
+    # the report is written to the files as it is generated
+    report_files = list()
+    sinks = list()
+    for key, sink_class in [
+        ('report', TextReportSink),
+        ('report_jsonl', JsonLinesReportSink),
+        ('report_junit', JUnitReportSink),
+    ]:
+        if options.get(key) is not None:
+            f = open(options[key], "w")
+            report_files.append(f)
+            sinks.append(sink_class(f))
+
+    lcr = LinkToReport(options['history_golden'], history, sinks=sinks, new_start_url=start_url)
+    lcr.report_connection_errors(options.get('ignored_connection_error_patterns') or [])
+    lcr.report_status_errors(options.get('ignored_status_error_patterns') or [])
+    lcr.report_url_visit_differences()
+    lcr.report_link_differences()
+    if options.get('metrics') is not None:
+        lcr.report_slowest_pages(options['metrics'], options.get('slowest_pages', 20))
+    if options.get('duplicate_pages', False) is True:
+        lcr.report_duplicate_pages()
+    lcr.close()
+
+    # let the user know about ignore rules that can be pruned
+    for rule in lcr.unused_ignore_rules():
+        logger.warning(f"ignore rule did not match any errors: {rule}")
+
+    for f in report_files:
+        f.close()
+
+    # write the report to a file
+    with open(options['summary'], "w") as f:
+        f.write(lcr.summary())
+
+    if lcr.error_flag is True:
+        report_path = os.path.join(os.getcwd(), options['report'])
+        msg = (f"Errors detected while processing link_checker output."
+               f" See {report_path} for more details. In Jenkins, check for the file in Build Artifacts")
+
+        logger.info(msg)
+        print(msg)
+
+        return 1
+
+    return 0
+
+
+def run_merge(options):
+    """
+    Combine the history files written by the shards of a crawl
+    :return: exit status
+    """
+
+    from checkrs_linkto.history import merge_histories, write_history
+
+    logger = logging.getLogger('linkto_bot')
+
+    start_url, history = merge_histories(options['histories'])
+
+    logger.info(f"merged {len(options['histories'])} history files with {len(history)} urls into {options['output']}")
+
+    write_history(options['output'], start_url, history, options['history_format'])
+
+    return 0
+
+
+def parse_options(argv=None):
+    """
+    Parse the command line, the options of the bot, report and check subcommands
+    are combined with the sections of the configuration file
+    :return: tuple with the subcommand name and a dictionary with the bot and report options
+    """
+
+    command_parser = argparse.ArgumentParser(
+        prog="linkto", description="crawl a website, record its structure and compare it with a previous crawl")
+    subparsers = command_parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    bot_parser = subparsers.add_parser(
+        "bot", argument_default=argparse.SUPPRESS, help="crawl a website and write its history file")
+    add_bot_arguments(bot_parser)
+    add_config_argument(bot_parser)
+
+    report_parser = subparsers.add_parser(
+        "report", argument_default=argparse.SUPPRESS, help="compare a history file with a golden history file")
+    add_report_arguments(report_parser)
+    add_config_argument(report_parser)
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="combine the history files written by the shards of a crawl into one history file")
+    add_merge_arguments(merge_parser)
+
+    check_parser = subparsers.add_parser(
+        "check", argument_default=argparse.SUPPRESS,
+        help="crawl a website and compare it with a golden history file in one process")
+    add_bot_arguments(check_parser)
+    report_dests = add_report_arguments(check_parser, check=True)
+    add_config_argument(check_parser)
+
+    # parse command line options
+    options = vars(command_parser.parse_args(argv))
+    command = options.pop("command")
+
+    if command == "merge":
+        return command, {'merge': options}
+
+    # read the configuration file
+    combined_opts = read_config(options.pop("config"))
+
+    # override the configuration file with values from the command line
+    for key, value in options.items():
+        if command == "report" or (command == "check" and key in report_dests):
+            combined_opts['report'][key] = value
+        else:
+            combined_opts['bot'][key] = value
+
+    if command in ["report", "check"]:
+        # the configuration file names the history files golden_file and new_file
+        report_opts = combined_opts['report']
+        for key, config_key in [('history_golden', 'golden_file'), ('history_new', 'new_file')]:
+            if report_opts.get(key) is None:
+                report_opts[key] = report_opts.get(config_key)
+
+        subparser = report_parser if command == "report" else check_parser
+        if report_opts['history_golden'] is None:
+            subparser.error("a golden history file is required, use --golden-file or golden_file in the config's report section")
+        if command == "report" and report_opts['history_new'] is None:
+            subparser.error("a new history file is required, use --new-file or new_file in the config's report section")
+
+    if command == "check":
+        # the report logs where the bot does and lists the slowest pages from the bot's json metrics
+        for key in ['debug', 'stream_log', 'logfile']:
+            combined_opts['report'][key] = combined_opts['bot'].get(key)
+        combined_opts['report']['metrics'] = None
+        if combined_opts['bot'].get('metrics_format', 'json') == 'json':
+            combined_opts['report']['metrics'] = combined_opts['bot'].get('metrics')
+
+    return command, combined_opts
+
+
+def main(argv=None):
+    """
+    Run a linkto subcommand
+    :return: exit status
+    """
+
+    command, options = parse_options(argv)
+
+    if command == "bot":
+        setup_logging(['linkto_bot'], options['bot'])
+        run_bot(options['bot'], options['report'])
+        return 0
+
+    if command == "report":
+        setup_logging(['linkto_report'], options['report'])
+        return run_report(options['report'])
+
+    if command == "merge":
+        setup_logging(['linkto_bot'], options['merge'], stream=True)
+        return run_merge(options['merge'])
+
+    # check: crawl, then report on the history the bot returned
+    setup_logging(['linkto_bot', 'linkto_report'], options['bot'])
+    if not check_readable(options['report']['history_golden']):
+        return 2
+
+    history = run_bot(options['bot'], options['report'])
+    return run_report(options['report'], history, options['bot']['url'])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import logging
+import time
+
+from lxml import etree
+from requests.compat import chardet
+from urllib.parse import urljoin
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+
+class LinkCollector:
+    """
+    lxml parser target that collects the hrefs of anchor tags
+    and the ids of all elements in a single pass over the html,
+    without building a document tree.
+    https://lxml.de/parsing.html#the-target-parser-interface
+    """
+
+    def __init__(self):
+        self.hrefs = list()
+        self.ids = set()
+
+    def start(self, tag, attrib):
+
+        # remember every element id, we use these to check links to url fragments
+        element_id = attrib.get('id')
+        if element_id is not None:
+            self.ids.add(element_id)
+
+        if tag != 'a':
+            return
+
+        href = attrib.get('href')
+
+        # filter out anchor tags without an href attribute
+        if href is None:
+            return
+
+        # remove leading and trailing spaces from the href
+        # https://www.w3.org/TR/2014/REC-html5-20141028/infrastructure.html#valid-non-empty-url-potentially-surrounded-by-spaces
+        href = href.strip()
+
+        # filter out repeating url with # and email
+        if href.startswith("mailto:"):
+            return
+
+        self.hrefs.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.hrefs, self.ids
+
+
+def extract_links(html):
+    """
+    Parse the html content of a page
+    :return: tuple with the list of hrefs from the page's anchor tags and the set of element ids on the page
+    """
+
+    collector = LinkCollector()
+
+    # lxml refuses to parse an empty document
+    if len(html.strip()) == 0:
+        return collector.close()
+
+    parser = etree.HTMLParser(target=collector, recover=True, huge_tree=True)
+    try:
+        parser.feed(html)
+        parser.close()
+    except etree.LxmlError as err:
+        # keep whatever we found before the parser gave up
+        logger.error(f"while parsing html: {err}")
+
+    return collector.close()
+
+
+def decode_html(content, encoding=None):
+    """
+    Decode the body of a page the way requests' Response.text does,
+    guessing the encoding from the content when the response didn't declare one
+    :return: html string
+    """
+
+    if encoding is None:
+        encoding = "utf-8"
+        if chardet is not None:
+            encoding = chardet.detect(content)["encoding"]
+
+    try:
+        return str(content, encoding, errors="replace")
+    except (LookupError, TypeError):
+        # unknown or missing encoding
+        return str(content, errors="replace")
+
+
+def parse_page(content, encoding, page_url):
+    """
+    Decode and parse the body of a page and resolve its links against the page's final url.
+    This runs in the parse process pool, so it takes and returns plain picklable values.
+    :return: tuple with the list of hrefs, the set of element ids and the list of resolved hrefs
+    """
+
+    hrefs, ids = extract_links(decode_html(content, encoding))
+    return hrefs, ids, [urljoin(page_url, href) for href in hrefs]
+
+
+def timed_parse_page(content, encoding, page_url):
+    """
+    parse_page() that also measures how long it took
+    :return: tuple with the result of parse_page() and seconds
+    """
+
+    start = time.perf_counter()
+    links = parse_page(content, encoding, page_url)
+    return links, time.perf_counter() - start
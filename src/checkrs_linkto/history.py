@@ -0,0 +1,876 @@
+import json
+import logging
+import time
+
+from array import array
+from bisect import bisect_right
+
+from urllib.parse import urldefrag
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+HISTORY_FORMATS = ["json", "ndjson"]
+
+# seconds between writes of the ndjson history during the crawl
+DEFAULT_FLUSH_INTERVAL = 10
+
+# error_text of the urls merge_histories() finds without a result in any of the shard histories
+NOT_VISITED_BY_ANY_SHARD = "Skipped, not visited by any shard"
+
+# marker of the ndjson lines that add to a record written earlier, see HistoryWriter
+CONTINUED = '"continued": true'
+
+# id used for the missing source of the start url and for urls without a response code
+NO_URL = -1
+NO_RESPONSE_CODE = -2**31
+
+# run number used for the end of the list of runs with the same source
+NO_RUN = -1
+
+# depth of the urls without a click depth, like the ones only a sitemap lists, they are saved with depth None
+NO_DEPTH = -1
+
+
+class VisitedFrom(list):
+    """
+    visited_from list of a HistoryStore record.
+    It is rebuilt from the edge table every time it is read, so changing it wouldn't change the history,
+    links are added with HistoryStore.add_edge() instead.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("the visited_from list of a HistoryStore record is read-only, use HistoryStore.add_edge()")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+
+class HistoryRecord:
+    """
+    View of one url in a HistoryStore that reads and writes like the history dictionary's records,
+    so history[url]["response_code"] = 200 works on both.
+    visited_from is rebuilt from the edge table when it is read, use HistoryStore.add_edge() to add to it.
+    """
+
+    __slots__ = ("store", "id")
+
+    def __init__(self, store, url_id):
+        self.store = store
+        self.id = url_id
+
+    def __getitem__(self, key):
+        return self.store._get_field(self.id, key)
+
+    def __setitem__(self, key, value):
+        self.store._set_field(self.id, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = ["response_code", "visited_from", "error_text", "depth"]
+        if self.id in self.store.content_hashes:
+            keys.append("content_hash")
+        if self.id in self.store.duplicates:
+            keys.append("duplicate_of")
+        if self.id in self.store.sitemaps:
+            keys.append("sitemap")
+        if self.id in self.store.page_ids:
+            keys.append("ids")
+        return keys
+
+
+class HistoryStore:
+    """
+    Compact in-memory history of a crawl.
+    Urls are interned to integer ids, the fields of the records are kept in arrays indexed by id
+    and the links between urls are kept in a packed edge table of url ids.
+    The links found on a page are added one after the other, so the visited_from ids of the edge table
+    are stored as runs of edges with the same source.
+    A link takes 4 bytes, half of what a visited_from list entry takes in a dictionary of dictionaries
+    when all the links from a page share the page's url string, and a fraction of it when they don't,
+    like in a history read back from a file. The dictionary shaped records are only built by items().
+    """
+
+    def __init__(self):
+
+        # url <-> id, every url we have seen, as a record or as the source of a link
+        self.url_ids = dict()
+        self.urls = list()
+
+        # ids of the urls that have a record, in the order they were added
+        self.records = array('i')
+        self.is_record = bytearray()
+
+        # record fields indexed by url id
+        self.response_codes = array('i')
+        self.depths = array('i')
+        self.error_texts = list()
+        self.content_hashes = dict()
+
+        # url id -> url of the page with the same content that was visited first
+        self.duplicates = dict()
+
+        # url id -> url of the sitemap that listed the url, kept apart from the links in the edge table
+        self.sitemaps = dict()
+
+        # url id -> sorted tuple of the element ids on the page, for the parsed pages,
+        # so the next incremental crawl can check links to fragments without parsing unchanged pages again
+        self.page_ids = dict()
+
+        # edge table, the url of edge_urls[i] was linked to from the source of the run i is in,
+        # a run starts at edge run_starts[j] and its source is run_sources[j]
+        self.edge_urls = array('i')
+        self.run_starts = array('i')
+        self.run_sources = array('i')
+
+        # the runs of each source, for following the links on a page, as a linked list:
+        # the first and last run of a url id and the next run with the same source of a run
+        self.first_runs = array('i')
+        self.last_runs = array('i')
+        self.next_runs = array('i')
+
+        # source url of the last run, so the links of a page are added without looking up the page,
+        # a new object before the first run
+        self._run_source = object()
+
+        # the edge table grouped by url, see _sources_by_url(), and the number of urls and edges it was built at
+        self._reverse = None
+        self._reverse_size = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, url):
+        url_id = self.url_ids.get(url)
+        return url_id is not None and self.is_record[url_id] == 1
+
+    def __getitem__(self, url):
+        url_id = self.url_ids.get(url)
+        if url_id is None or self.is_record[url_id] == 0:
+            raise KeyError(url)
+        return HistoryRecord(self, url_id)
+
+    def __iter__(self):
+        for url_id in self.records:
+            yield self.urls[url_id]
+
+    def keys(self):
+        return iter(self)
+
+    def intern(self, url):
+        """
+        Look up the id of a url, assigning a new id to urls we haven't seen
+        :return: url id
+        """
+
+        if url is None:
+            return NO_URL
+
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            url_id = len(self.urls)
+            self.url_ids[url] = url_id
+            self.urls.append(url)
+            self.is_record.append(0)
+            self.response_codes.append(NO_RESPONSE_CODE)
+            self.depths.append(0)
+            self.error_texts.append(None)
+            self.first_runs.append(NO_RUN)
+            self.last_runs.append(NO_RUN)
+
+        return url_id
+
+    def add(self, url, response_code=None, error_text=None, depth=0, visited_from=(), content_hash=None,
+            duplicate_of=None, sitemap=None, ids=None):
+        """
+        Add a record for a url that is not in the history yet
+        :return: None
+        """
+
+        url_id = self.intern(url)
+        if self.is_record[url_id] == 1:
+            raise KeyError(f"url is already in the history: {url}")
+
+        self.is_record[url_id] = 1
+        self.records.append(url_id)
+        self._set_field(url_id, "response_code", response_code)
+        self._set_field(url_id, "error_text", error_text)
+        self._set_field(url_id, "depth", depth)
+        self._set_field(url_id, "content_hash", content_hash)
+        self._set_field(url_id, "duplicate_of", duplicate_of)
+        self._set_field(url_id, "sitemap", sitemap)
+        self._set_field(url_id, "ids", ids)
+
+        for source in visited_from:
+            self.add_edge(url, source)
+
+    def add_edge(self, url, source):
+        """
+        Record that url was linked to from source, source is None for the start url
+        :return: None
+        """
+
+        if source != self._run_source:
+            self._start_run(source)
+        self.edge_urls.append(self.url_ids[url])
+
+    def add_edges(self, urls, source):
+        """
+        Record that all of urls were linked to from source, the urls have to be in the history
+        :return: None
+        """
+
+        if source != self._run_source:
+            self._start_run(source)
+        self.edge_urls.extend(map(self.url_ids.__getitem__, urls))
+
+    def _start_run(self, source):
+        source_id = self.intern(source)
+        run = len(self.run_sources)
+        self.run_starts.append(len(self.edge_urls))
+        self.run_sources.append(source_id)
+        self.next_runs.append(NO_RUN)
+        if source_id != NO_URL:
+            if self.first_runs[source_id] == NO_RUN:
+                self.first_runs[source_id] = run
+            else:
+                self.next_runs[self.last_runs[source_id]] = run
+            self.last_runs[source_id] = run
+        self._run_source = source
+
+    def edge_count(self):
+        return len(self.edge_urls)
+
+    def links_from(self, source):
+        """
+        Iterate over the urls linked to from source
+        :return: iterator of urls
+        """
+
+        source_id = self.url_ids.get(source)
+        if source_id is None:
+            return
+
+        n = len(self.edge_urls)
+        runs = len(self.run_starts)
+        run = self.first_runs[source_id]
+        while run != NO_RUN:
+            end = self.run_starts[run + 1] if run + 1 < runs else n
+            for url_id in self.edge_urls[self.run_starts[run]:end]:
+                yield self.urls[url_id]
+            run = self.next_runs[run]
+
+    def edges(self, start=0):
+        """
+        Iterate over the edge table, starting at the start-th edge
+        :return: iterator of (url, visited_from) tuples
+        """
+
+        urls = self.urls
+        for url_id, source in self._edge_ids(start):
+            yield urls[url_id], urls[source] if source != NO_URL else None
+
+    def _edge_ids(self, start=0):
+        """
+        Unpack the runs of the edge table
+        :return: iterator of (url id, visited_from id) tuples
+        """
+
+        n = len(self.edge_urls)
+        runs = len(self.run_starts)
+        if start >= n:
+            return
+
+        # find the run the start-th edge is in
+        run = bisect_right(self.run_starts, start) - 1
+        while run < runs:
+            end = self.run_starts[run + 1] if run + 1 < runs else n
+            source = self.run_sources[run]
+            for url_id in self.edge_urls[max(start, self.run_starts[run]):end]:
+                yield url_id, source
+            run += 1
+
+    def fields(self, url):
+        """
+        The fields of a url's record, without visited_from
+        :return: dictionary
+        """
+
+        url_id = self.url_ids[url]
+        fields = dict(
+            response_code=self._get_field(url_id, "response_code"),
+            error_text=self.error_texts[url_id],
+            depth=self._get_field(url_id, "depth")
+        )
+        if url_id in self.content_hashes:
+            fields["content_hash"] = self.content_hashes[url_id]
+        if url_id in self.duplicates:
+            fields["duplicate_of"] = self.duplicates[url_id]
+        if url_id in self.sitemaps:
+            fields["sitemap"] = self.sitemaps[url_id]
+        if url_id in self.page_ids:
+            fields["ids"] = list(self.page_ids[url_id])
+        return fields
+
+    def items(self):
+        """
+        Build the dictionary shaped records of the history one url at a time,
+        dict(store.items()) gives the history dictionary written by linkto_bot
+        :return: iterator of (url, record) tuples
+        """
+
+        offsets, sources = self._sources_by_url()
+
+        urls = self.urls
+        for url_id in self.records:
+            visited_from = [
+                urls[source] if source != NO_URL else None
+                for source in sources[offsets[url_id]:offsets[url_id + 1]]
+            ]
+            yield urls[url_id], self._record(url_id, visited_from)
+
+    def _sources_by_url(self):
+        """
+        Group the edge table by url with a counting sort,
+        which keeps the edges of each url in the order they were added.
+        The result is kept until urls or edges are added to the history.
+        :return: tuple with the offsets and the sources arrays,
+            the visited_from ids of a url are sources[offsets[url_id]:offsets[url_id + 1]]
+        """
+
+        size = (len(self.urls), len(self.edge_urls))
+        if self._reverse_size == size:
+            return self._reverse
+
+        n = len(self.urls)
+        offsets = array('i', bytes(4 * (n + 1)))
+        for url_id in self.edge_urls:
+            offsets[url_id + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+
+        position = offsets[:-1]
+        sources = array('i', bytes(4 * len(self.edge_urls)))
+        for url_id, source in self._edge_ids():
+            sources[position[url_id]] = source
+            position[url_id] += 1
+        del position
+
+        self._reverse = (offsets, sources)
+        self._reverse_size = size
+        return self._reverse
+
+    def _record(self, url_id, visited_from):
+        record = dict(
+            response_code=self._get_field(url_id, "response_code"),
+            visited_from=visited_from,
+            error_text=self.error_texts[url_id],
+            depth=self._get_field(url_id, "depth")
+        )
+        if url_id in self.content_hashes:
+            record["content_hash"] = self.content_hashes[url_id]
+        if url_id in self.duplicates:
+            record["duplicate_of"] = self.duplicates[url_id]
+        if url_id in self.sitemaps:
+            record["sitemap"] = self.sitemaps[url_id]
+        if url_id in self.page_ids:
+            record["ids"] = list(self.page_ids[url_id])
+        return record
+
+    def _get_field(self, url_id, key):
+        if key == "response_code":
+            response_code = self.response_codes[url_id]
+            return None if response_code == NO_RESPONSE_CODE else response_code
+        if key == "error_text":
+            return self.error_texts[url_id]
+        if key == "depth":
+            depth = self.depths[url_id]
+            return None if depth == NO_DEPTH else depth
+        if key == "content_hash":
+            return self.content_hashes[url_id]
+        if key == "duplicate_of":
+            return self.duplicates[url_id]
+        if key == "sitemap":
+            return self.sitemaps[url_id]
+        if key == "ids":
+            return list(self.page_ids[url_id])
+        if key == "visited_from":
+            urls = self.urls
+            offsets, sources = self._sources_by_url()
+            return VisitedFrom(
+                urls[source] if source != NO_URL else None
+                for source in sources[offsets[url_id]:offsets[url_id + 1]]
+            )
+        raise KeyError(key)
+
+    def _set_field(self, url_id, key, value):
+        if key == "response_code":
+            self.response_codes[url_id] = NO_RESPONSE_CODE if value is None else value
+        elif key == "error_text":
+            self.error_texts[url_id] = value
+        elif key == "depth":
+            self.depths[url_id] = NO_DEPTH if value is None else value
+        elif key == "content_hash":
+            if value is None:
+                self.content_hashes.pop(url_id, None)
+            else:
+                self.content_hashes[url_id] = value
+        elif key == "duplicate_of":
+            if value is None:
+                self.duplicates.pop(url_id, None)
+            else:
+                self.duplicates[url_id] = value
+        elif key == "sitemap":
+            if value is None:
+                self.sitemaps.pop(url_id, None)
+            else:
+                self.sitemaps[url_id] = value
+        elif key == "ids":
+            if value is None:
+                self.page_ids.pop(url_id, None)
+            else:
+                self.page_ids[url_id] = tuple(sorted(value))
+        else:
+            raise KeyError(f"can't set history field '{key}'")
+
+
+def write_history(filename, start_url, history, history_format="json", crawl_started=None):
+    """
+    Write a history dictionary or HistoryStore to a file.
+    The json format is a single indented json document with start_url and history keys.
+    The ndjson format has a header line with the start_url followed by one line per url,
+    see HistoryWriter for writing it while the crawl runs.
+    The records are written one at a time, the history isn't copied into a dictionary first.
+    crawl_started, the time.time() the crawl started, is saved next to the start_url when it is given.
+    :return: None
+    """
+
+    if history_format not in HISTORY_FORMATS:
+        raise ValueError(f"unknown history format '{history_format}', expected one of {HISTORY_FORMATS}")
+
+    # a dictionary or a HistoryStore
+    records = history.items()
+
+    header = {"start_url": start_url}
+    if crawl_started is not None:
+        header["crawl_started"] = crawl_started
+
+    with open(filename, "w") as f:
+        if history_format == "json":
+            # the same pretty printed document json.dump(..., indent=2) writes, one record at a time
+            f.write("{\n")
+            for key, value in header.items():
+                f.write(f"  {json.dumps(key)}: {json.dumps(value)},\n")
+            f.write('  "history": {')
+            separator = "\n"
+            for url, record in records:
+                record = json.dumps(record, indent=2).replace("\n", "\n    ")
+                f.write(f"{separator}    {json.dumps(url)}: {record}")
+                separator = ",\n"
+            f.write("\n  }\n}" if separator == ",\n" else "}\n}")
+            return
+
+        f.write(json.dumps(header) + "\n")
+        for url, record in records:
+            line = dict(url=url)
+            line.update(record)
+            f.write(json.dumps(line) + "\n")
+
+
+class HistoryWriter:
+    """
+    Write an ndjson history file while the crawl runs, so the history on disk keeps up with the crawl.
+    Every few seconds the records of the urls that were finished since the last write are appended to the file.
+    Links found later to urls that were already written, and changes to their depth or error_text,
+    are appended as continuation lines, {"url": ..., "continued": true, ...} with the fields of the record
+    and only the new visited_from entries, iter_history() adds them to the url's record.
+    Urls that were never finished, like the ones another shard visits, are written by close().
+    """
+
+    def __init__(self, filename, start_url, crawl_started=None, interval=DEFAULT_FLUSH_INTERVAL):
+
+        self.filename = filename
+        self.interval = interval
+
+        # urls whose history record changed since the last write, in the order they changed
+        self.dirty = dict()
+
+        # urls whose record is in the file
+        self.written = set()
+
+        # number of edges from the history's edge table already written to the file
+        self.written_edges = 0
+
+        header = {"start_url": start_url}
+        if crawl_started is not None:
+            header["crawl_started"] = crawl_started
+
+        self.f = open(filename, "w")
+        self.f.write(json.dumps(header) + "\n")
+
+        self.last_write = time.monotonic()
+
+    def touch(self, urls):
+        """
+        Mark history records as changed
+        :return: None
+        """
+
+        for url in urls:
+            self.dirty[url] = None
+
+    def due(self):
+        return time.monotonic() - self.last_write >= self.interval
+
+    def write(self, history, final=False):
+        """
+        Append the finished records and the changes to the records already in the file.
+        Records without a response_code yet wait for their visit to finish, unless final is True.
+        :return: self
+        """
+
+        # new edges of the urls already in the file, the other urls are written with all their edges
+        new_edges = dict()
+        for url, visited_from in history.edges(self.written_edges):
+            if url in self.written:
+                new_edges.setdefault(url, list()).append(visited_from)
+                self.dirty[url] = None
+
+        urls = self.dirty.keys()
+        if final is True:
+            urls = list(urls) + [url for url in history if url not in self.written and url not in self.dirty]
+
+        waiting = dict()
+        count = 0
+        for url in urls:
+            line = dict(url=url)
+            if url in self.written:
+                line["continued"] = True
+                line.update(history.fields(url))
+                line["visited_from"] = new_edges.get(url, [])
+            elif history[url]["response_code"] is None and final is False:
+                waiting[url] = None
+                continue
+            else:
+                line.update(history.fields(url))
+                line["visited_from"] = history[url]["visited_from"]
+                self.written.add(url)
+            self.f.write(json.dumps(line) + "\n")
+            count += 1
+
+        self.f.flush()
+
+        logger.debug(f"wrote {count} changed urls to history {self.filename}")
+
+        self.written_edges = history.edge_count()
+        self.dirty = waiting
+        self.last_write = time.monotonic()
+
+        return self
+
+    def close(self, history):
+        """
+        Write the rest of the history once the crawl is done and close the file
+        :return: None
+        """
+
+        self.write(history, final=True)
+        self.f.close()
+
+
+def iter_history(filename):
+    """
+    Read a history file written in either format
+    :return: tuple with the start_url and an iterator of (url, record) tuples
+    """
+
+    header, records = iter_history_with_header(filename)
+    return header["start_url"], records
+
+
+def iter_history_with_header(filename):
+    """
+    Read a history file written in either format.
+    ndjson files are read one line at a time, json files are a single document that is read as a whole.
+    :return: tuple with the header dictionary, with the start_url and crawl_started if it was saved,
+        and an iterator of (url, record) tuples
+    """
+
+    header, records = _open_history(filename)
+    if isinstance(records, dict):
+        return header, iter(records.items())
+    return header, _iter_ndjson_records(filename, records)
+
+
+def _open_history(filename):
+    """
+    Read the header of a history file
+    :return: tuple with the header dictionary and the offset of the first record of an ndjson file,
+        or the history dictionary of a json file
+    """
+
+    with open(filename) as f:
+        # ndjson files start with a header line that only has the start_url,
+        # json files start with an opening brace or the whole document on one line
+        first_line = f.readline()
+        try:
+            header = json.loads(first_line)
+        except ValueError:
+            header = None
+
+        if isinstance(header, dict) and "start_url" in header and "history" not in header:
+            return header, f.tell()
+
+        f.seek(0)
+        data = json.load(f)
+
+    history = data.pop("history")
+    return data, history
+
+
+def _iter_ndjson_records(filename, offset):
+    """
+    Read the records of an ndjson history file, starting at offset.
+    The continuation lines HistoryWriter appends are collected in a first pass over the file
+    and added to the records of their urls in the second pass.
+    :return: iterator of (url, record) tuples
+    """
+
+    # the continuation lines, url -> tuple with the changed fields and the new visited_from entries,
+    # a quote can't appear unescaped in a json string so the marker only matches the key
+    continued = dict()
+    with open(filename) as f:
+        f.seek(offset)
+        for line in f:
+            if CONTINUED not in line:
+                continue
+            record = json.loads(line)
+            url = record.pop("url")
+            del record["continued"]
+            fields, visited_from = continued.setdefault(url, (dict(), list()))
+            visited_from.extend(record.pop("visited_from"))
+            fields.update(record)
+
+    with open(filename) as f:
+        f.seek(offset)
+        for line in f:
+            if line.strip() == "" or CONTINUED in line:
+                continue
+            record = json.loads(line)
+            url = record.pop("url")
+            if url in continued:
+                fields, visited_from = continued.pop(url)
+                record.update(fields)
+                record["visited_from"].extend(visited_from)
+            yield url, record
+
+
+class HistoryReader:
+    """
+    History file whose records are read again every time they are iterated,
+    so the records of an ndjson file don't have to fit in memory.
+    A json file is a single document, its history dictionary is read once and kept.
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.header, self.records = _open_history(filename)
+        self.start_url = self.header["start_url"]
+
+    def items(self):
+        if isinstance(self.records, dict):
+            return iter(self.records.items())
+        return _iter_ndjson_records(self.filename, self.records)
+
+    def keys(self):
+        for url, _ in self.items():
+            yield url
+
+
+def read_history(filename):
+    """
+    Read a history file written in either format
+    :return: tuple with the start_url and the history dictionary
+    """
+
+    start_url, records = iter_history(filename)
+    return start_url, dict(records)
+
+
+def merge_histories(filenames):
+    """
+    Combine the history files written by the shards of a crawl.
+    A url's status comes from the first file that has a result for it, usually the shard that visited it,
+    its visited_from lists are concatenated, every shard recorded the links on its own pages,
+    and its depth is the minimum depth of all the files, None if no file has a click depth for it.
+    Urls no file has a result for are recorded as skipped, with response_code -1.
+    :return: tuple with the start_url and a HistoryStore
+    """
+
+    start_url = None
+    history = HistoryStore()
+
+    for filename in filenames:
+        shard_start_url, records = iter_history(filename)
+        if start_url is None:
+            start_url = shard_start_url
+        elif shard_start_url != start_url:
+            raise ValueError(f"{filename} starts at {shard_start_url}, not at {start_url}")
+
+        for url, record in records:
+            if url not in history:
+                history.add(
+                    url,
+                    response_code=record["response_code"],
+                    error_text=record["error_text"],
+                    depth=record["depth"],
+                    visited_from=record["visited_from"],
+                    content_hash=record.get("content_hash"),
+                    duplicate_of=record.get("duplicate_of"),
+                    sitemap=record.get("sitemap"),
+                    ids=record.get("ids")
+                )
+                continue
+
+            merged = history[url]
+            if merged["response_code"] is None and record["response_code"] is not None:
+                merged["response_code"] = record["response_code"]
+                merged["error_text"] = record["error_text"]
+                merged["content_hash"] = record.get("content_hash")
+                merged["duplicate_of"] = record.get("duplicate_of")
+                merged["ids"] = record.get("ids")
+
+            if merged.get("sitemap") is None and record.get("sitemap") is not None:
+                merged["sitemap"] = record["sitemap"]
+
+            if record["depth"] is not None and (merged["depth"] is None or record["depth"] < merged["depth"]):
+                merged["depth"] = record["depth"]
+
+            for source in record["visited_from"]:
+                history.add_edge(url, source)
+
+        logger.debug(f"merged {filename}, {len(history)} urls so far")
+
+    # a url that was handed off to a shard that never picked it up, like one whose history file is missing
+    not_visited = [url for url in history if history[url]["response_code"] is None]
+    for url in not_visited:
+        history[url]["response_code"] = -1
+        history[url]["error_text"] = NOT_VISITED_BY_ANY_SHARD
+    if len(not_visited) > 0:
+        logger.warning(
+            f"{len(not_visited)} urls were not visited by any shard, like {', '.join(not_visited[:5])}"
+        )
+
+    return start_url, history
+
+
+class PreviousHistory:
+    """
+    History recorded by an earlier run of the bot.
+    Used by incremental crawls to skip the pages that haven't changed since then,
+    every other url, including links to files and other sites, is checked again.
+    crawled is the time.time() the earlier crawl started, if we know it.
+    """
+
+    def __init__(self, history, crawled=None):
+
+        self.history = history
+        self.crawled = crawled
+
+        # the links on each page, rebuilt from the visited_from lists:
+        # page url -> list of urls linked to from the page
+        self.outlinks = dict()
+        for url, record in history.items():
+            for visited_from in record["visited_from"]:
+                if visited_from is None:
+                    continue
+                if visited_from not in self.outlinks:
+                    self.outlinks[visited_from] = list()
+                self.outlinks[visited_from].append(url)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a history file written by linkto_bot.
+        Files without the time the crawl started, like ones from resumed crawls, can't be used to skip pages by lastmod.
+        :return: PreviousHistory
+        """
+
+        header, records = iter_history_with_header(filename)
+        history = dict(records)
+
+        crawled = header.get("crawl_started")
+
+        logger.debug(f"loaded {len(history)} urls from previous history {filename}")
+
+        return cls(history, crawled)
+
+    def get(self, url):
+        return self.history.get(url)
+
+    def is_page(self, url):
+        """
+        Check if the bot looked for links on a url in the previous run
+        :return: True if the url was parsed as a page
+        """
+
+        record = self.history.get(url)
+        if record is None:
+            return False
+
+        return record.get("content_hash") is not None or urldefrag(url).url in self.outlinks
+
+    def unchanged_page(self, url, lastmod):
+        """
+        Find the result of a page that hasn't changed since the previous run,
+        going by the lastmod time its sitemap gives for it.
+        Only pages that were parsed and reachable in the previous run qualify.
+        :return: the previous record, or None if the page should be visited again
+        """
+
+        if lastmod is None or self.crawled is None or lastmod >= self.crawled:
+            return None
+
+        record = self.history.get(url)
+        if record is None or not self.is_page(url):
+            return None
+
+        response_code = record["response_code"]
+        if response_code is None or not (200 <= response_code < 400) or record["error_text"] is not None:
+            return None
+
+        return record
+
+    def links(self, url, content_hash):
+        """
+        Find the links and ids recorded for a page in the previous run, if its content is the same as then.
+        The links are the full urls the page linked to, rebuilt from the visited_from lists,
+        except for links to the page's own fragments, which are turned back into #fragment hrefs.
+        :return: tuple with the list of hrefs and the set of ids on the page, or None if the page must be parsed
+        """
+
+        if content_hash is None:
+            return None
+
+        page = urldefrag(url).url
+        record = self.history.get(page)
+        if record is None or record.get("content_hash") != content_hash or record.get("ids") is None:
+            return None
+
+        hrefs = list()
+        for link in self.outlinks.get(page, []):
+            link_url, fragment = urldefrag(link)
+            if link_url == page and fragment != '':
+                link = "#" + fragment
+            hrefs.append(link)
+
+        return hrefs, set(record["ids"])
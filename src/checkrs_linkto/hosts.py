@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from urllib.parse import urlparse, urlunparse
+from urllib.robotparser import RobotFileParser
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+DEFAULT_ROBOTS_TTL = 3600 # seconds
+DEFAULT_FAILURE_WINDOW = 300 # seconds
+
+
+class RobotsCache:
+    """
+    robots.txt results by netloc, including failures to retrieve them,
+    so a dead host costs one failed request instead of one for every url on it.
+    Results are kept for ttl seconds and can be saved to a file for the next run.
+    """
+
+    def __init__(self, filename=None, ttl=DEFAULT_ROBOTS_TTL):
+
+        self.filename = filename
+        self.ttl = ttl
+
+        # netloc -> dict(lines, error_text, fetched), lines is None when the request failed
+        self.entries = dict()
+
+        # netloc -> RobotFileParser for the entry's lines
+        self.parsers = dict()
+
+        # only one worker fetches the robots.txt for a netloc
+        self.locks = dict()
+        self.locks_lock = threading.Lock()
+
+    def load(self):
+        """
+        Read the results saved by an earlier run, expired results are dropped
+        :return: self
+        """
+
+        if self.filename is None or not os.path.isfile(self.filename):
+            return self
+
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+            for netloc, entry in data["entries"].items():
+                if not self._expired(entry):
+                    self.entries[netloc] = entry
+        except (OSError, ValueError, KeyError) as err:
+            logger.error(f"while loading robots.txt cache {self.filename}: {err}")
+            self.entries = dict()
+
+        logger.debug(f"loaded {len(self.entries)} robots.txt results from {self.filename}")
+
+        return self
+
+    def save(self):
+        """
+        Write the results that haven't expired to the cache file
+        :return: self
+        """
+
+        if self.filename is None:
+            return self
+
+        entries = {netloc: entry for netloc, entry in self.entries.items() if not self._expired(entry)}
+
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(dict(entries=entries), f)
+        os.replace(tmp_filename, self.filename)
+
+        return self
+
+    def get(self, netloc):
+        """
+        Look up the robots.txt result for a netloc
+        :return: dictionary with the RobotFileParser, or None if the request failed, and the error_text,
+            or None if we don't have a result that hasn't expired
+        """
+
+        entry = self.entries.get(netloc)
+        if entry is None or self._expired(entry):
+            return None
+
+        if entry["lines"] is None:
+            return dict(parser=None, error_text=entry["error_text"])
+
+        parser = self.parsers.get(netloc)
+        if parser is None:
+            parser = RobotFileParser()
+            parser.parse(entry["lines"])
+            self.parsers[netloc] = parser
+        return dict(parser=parser, error_text=None)
+
+    def fetch(self, s, url):
+        """
+        Retrieve and parse the robots.txt for a url's netloc, unless we already have the result.
+        This runs on worker threads, other workers wait for the one retrieving a netloc's robots.txt.
+        :return: dictionary like get()
+        """
+
+        url_p = urlparse(url)
+
+        with self.locks_lock:
+            lock = self.locks.setdefault(url_p.netloc, threading.Lock())
+
+        with lock:
+            result = self.get(url_p.netloc)
+            if result is not None:
+                return result
+
+            robots_txt_url = urlunparse((url_p.scheme, url_p.netloc, "robots.txt", None, None, None))
+            try:
+                r = s.get(robots_txt_url)
+                entry = dict(lines=r.text.splitlines(), error_text=None, fetched=time.time())
+            except Exception as err:
+                # site probably doesnt exist
+                # remember the failure so other urls on the netloc don't try again
+                logger.error(f"while connecting: {err}")
+                entry = dict(lines=None, error_text=str(err), fetched=time.time())
+
+            self.parsers.pop(url_p.netloc, None)
+            self.entries[url_p.netloc] = entry
+
+            return self.get(url_p.netloc)
+
+    def _expired(self, entry):
+        return time.time() - entry["fetched"] > self.ttl
+
+
+class HostHealth:
+    """
+    Circuit breaker for hosts that are down or too slow.
+    When failure_threshold different urls of a host fail with a connection error, or take longer
+    than slow_request_seconds, within window seconds and without a good request in between,
+    the host's urls are skipped for window seconds, then the host is tried again.
+    Retries of the same url count once, and the netlocs in exempt, like the start url's, are never skipped.
+    """
+
+    def __init__(self, failure_threshold=None, slow_request_seconds=None, exempt=(), window=DEFAULT_FAILURE_WINDOW):
+
+        self.failure_threshold = failure_threshold
+        self.slow_request_seconds = slow_request_seconds
+        self.exempt = set(exempt)
+        self.window = window
+
+        # netloc -> dict(url -> time of its last failed or slow request)
+        self.failures = dict()
+        self.slow = dict()
+
+        # netloc -> (error_text recorded for urls on a host we gave up on, time we gave up)
+        self.down = dict()
+
+    def is_down(self, netloc):
+        if netloc not in self.down:
+            return False
+        if time.monotonic() - self.down[netloc][1] > self.window:
+            # try the host again, it takes failure_threshold new failures to give up on it
+            del self.down[netloc]
+            logger.info(f"trying host again: {netloc}")
+            return False
+        return True
+
+    def message(self, netloc):
+        return self.down[netloc][0]
+
+    def record(self, netloc, url, response_code, error_text, elapsed):
+        """
+        Update a host's health with the result of visiting one of its urls
+        :return: None
+        """
+
+        if self.failure_threshold is None or self.failure_threshold <= 0:
+            return
+        if netloc in self.exempt or netloc in self.down:
+            return
+
+        if response_code == 0:
+            count = self._count(self.failures, netloc, url)
+            if count >= self.failure_threshold:
+                self._give_up(netloc, (
+                    f"Skipped, host {netloc} failed for {count} urls in a row,"
+                    f" last error: {error_text}"
+                ))
+                logger.error(f"giving up on unreachable host: {netloc}")
+            return
+
+        self.failures.pop(netloc, None)
+
+        if self.slow_request_seconds is not None and elapsed > self.slow_request_seconds:
+            count = self._count(self.slow, netloc, url)
+            if count >= self.failure_threshold:
+                self._give_up(netloc, (
+                    f"Skipped, host {netloc} took more than {self.slow_request_seconds} seconds"
+                    f" to answer for {count} urls in a row"
+                ))
+                logger.error(f"giving up on slow host: {netloc}")
+        else:
+            self.slow.pop(netloc, None)
+
+    def _count(self, failures, netloc, url):
+        """
+        Add a failure of url and drop the failures older than window
+        :return: number of different urls of netloc that failed within window
+        """
+
+        now = time.monotonic()
+        urls = failures.setdefault(netloc, dict())
+        urls[url] = now
+        for old_url in [u for u, t in urls.items() if now - t > self.window]:
+            del urls[old_url]
+        return len(urls)
+
+    def _give_up(self, netloc, error_text):
+        self.down[netloc] = (error_text, time.monotonic())
+        self.failures.pop(netloc, None)
+        self.slow.pop(netloc, None)
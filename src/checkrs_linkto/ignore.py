@@ -0,0 +1,157 @@
+import logging
+import re
+
+# create logger
+logger = logging.getLogger('linkto_report')
+
+# patterns we can't put in a combined regular expression:
+# global flags like (?i) have to be at the start of the regular expression
+# and backreferences would point at the wrong group
+GLOBAL_FLAGS = re.compile(r'^\(\?[aiLmsux]+\)')
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def combine(patterns):
+    """
+    Compile patterns into one regular expression that matches where any of them match
+    :return: compiled regular expression or None if the patterns can't be combined
+    """
+
+    if len(patterns) == 0:
+        return None
+
+    if any(GLOBAL_FLAGS.search(p) or BACKREFERENCE.search(p) for p in patterns):
+        logger.debug("can't combine the ignore patterns, checking them one at a time")
+        return None
+
+    try:
+        return re.compile("|".join(f"(?:{p})" for p in patterns))
+    except re.error as err:
+        # like two patterns with the same group name
+        logger.debug(f"can't combine the ignore patterns, checking them one at a time: {err}")
+        return None
+
+
+class FirstMatch:
+    """
+    Find the first of a list of regular expressions that re.search() matches in a string.
+    The patterns are also compiled into a single alternation, so strings that don't match any pattern,
+    usually most of them, are ruled out with one search.
+    """
+
+    def __init__(self, patterns, cache=False):
+
+        self.patterns = list(patterns)
+        self.compiled = [re.compile(p) for p in self.patterns]
+        self.combined = combine(self.patterns)
+
+        # string -> index of the first matching pattern, for strings that repeat, like error messages
+        self.cache = dict() if cache is True else None
+
+    def search(self, text):
+        """
+        Look for the patterns in text
+        :return: index of the first pattern that matches or None
+        """
+
+        if self.cache is not None and text in self.cache:
+            return self.cache[text]
+
+        index = None
+        if self.combined is None or self.combined.search(text) is not None:
+            for i, c in enumerate(self.compiled):
+                if c.search(text) is not None:
+                    index = i
+                    break
+
+        if self.cache is not None:
+            self.cache[text] = index
+        return index
+
+
+class IgnoreRules:
+    """
+    The ignored_connection_error_patterns and ignored_status_error_patterns of the report configuration,
+    compiled once. Counts how often each rule ignored an error, so rules that never match can be pruned.
+    """
+
+    def __init__(self, connection_error_patterns=[], status_error_patterns=[]):
+
+        self.connection_errors = FirstMatch(connection_error_patterns, cache=True)
+        self.connection_error_hits = [0] * len(self.connection_errors.patterns)
+
+        # list of (FirstMatch of the site patterns, list of the status codes of each site pattern)
+        self.status_errors = list()
+        self.status_error_hits = list()
+
+        # status code -> site patterns that list the status code
+        patterns_by_status_code = dict()
+
+        for ignore_grouping in status_error_patterns:
+            site_patterns = list(ignore_grouping.keys())
+            status_codes = [ignore_grouping[p] for p in site_patterns]
+            self.status_errors.append((FirstMatch(site_patterns), status_codes))
+            self.status_error_hits.append([0] * len(site_patterns))
+
+            for site_pattern, codes in zip(site_patterns, status_codes):
+                for code in codes:
+                    patterns_by_status_code.setdefault(code, list()).append(site_pattern)
+
+        # status code -> one alternation of the site patterns that could ignore it,
+        # a url that doesn't match it can't be ignored for that status code
+        self.status_code_matchers = {
+            code: combine(patterns) for code, patterns in patterns_by_status_code.items()
+        }
+
+    def connection_error(self, error_text):
+        """
+        Check if a connection error should be ignored
+        :return: the matching pattern or None
+        """
+
+        index = self.connection_errors.search(error_text)
+        if index is None:
+            return None
+
+        self.connection_error_hits[index] += 1
+        return self.connection_errors.patterns[index]
+
+    def status_error(self, url, response_code):
+        """
+        Check if a status error should be ignored.
+        In each grouping the first site pattern matching the url decides.
+        :return: the matching site pattern or None
+        """
+
+        if response_code not in self.status_code_matchers:
+            return None
+
+        matcher = self.status_code_matchers[response_code]
+        if matcher is not None and matcher.search(url) is None:
+            return None
+
+        for i, (site_patterns, status_codes) in enumerate(self.status_errors):
+            index = site_patterns.search(url)
+            if index is not None and response_code in status_codes[index]:
+                self.status_error_hits[i][index] += 1
+                return site_patterns.patterns[index]
+
+        return None
+
+    def unused(self):
+        """
+        Find the rules that didn't ignore any errors
+        :return: list of strings describing the rules
+        """
+
+        unused = list()
+        for pattern, hits in zip(self.connection_errors.patterns, self.connection_error_hits):
+            if hits == 0:
+                unused.append(f"ignored_connection_error_patterns: '{pattern}'")
+
+        for (site_patterns, status_codes), hits in zip(self.status_errors, self.status_error_hits):
+            for pattern, codes, count in zip(site_patterns.patterns, status_codes, hits):
+                if count == 0:
+                    unused.append(f"ignored_status_error_patterns: '{pattern}': {codes}")
+
+        return unused
@@ -0,0 +1,291 @@
+import heapq
+import json
+import logging
+import threading
+import time
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+METRICS_FORMATS = ["json", "prometheus"]
+
+# phases of visiting a url, in seconds:
+# connect - opening connections, DNS, TCP and TLS, 0 when a pooled connection was reused
+# ttfb - waiting for the response headers after the connection was open
+# download - reading response bodies
+# parse - looking for links in the page
+PHASES = ["connect", "ttfb", "download", "parse"]
+
+# upper bounds of the histogram buckets of the phase timings, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+DEFAULT_SLOWEST_PAGES = 100
+
+# the RequestTimer of the url each worker thread is visiting
+_local = threading.local()
+
+
+class RequestTimer:
+    """
+    Phase timings and size of the requests made for one url.
+    Created on the worker thread visiting the url, connections opened on that thread
+    until stop() is called add to its connect time.
+    """
+
+    def __init__(self):
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.download = 0.0
+        self.bytes = None
+        _local.timer = self
+
+    def request(self, func, *args, **kwargs):
+        """
+        Make a request with func, like s.get, and time it until the response headers arrive
+        :return: the response
+        """
+
+        start = time.perf_counter()
+        connect = self.connect
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.ttfb += time.perf_counter() - start - (self.connect - connect)
+
+    def content(self, response):
+        """
+        Read the body of a streamed response
+        :return: the body as bytes
+        """
+
+        start = time.perf_counter()
+        try:
+            content = response.content
+        finally:
+            self.download += time.perf_counter() - start
+        self.bytes = len(content)
+        return content
+
+    def stop(self):
+        """
+        Stop adding connections opened on this thread
+        :return: dictionary with the connect, ttfb and download times and the size of the body
+        """
+
+        if getattr(_local, "timer", None) is self:
+            _local.timer = None
+        return dict(connect=self.connect, ttfb=self.ttfb, download=self.download, bytes=self.bytes)
+
+
+def time_connect(connect):
+    """
+    Open a connection with connect, adding the time it takes to the RequestTimer of this thread
+    :return: None
+    """
+
+    start = time.perf_counter()
+    try:
+        connect()
+    finally:
+        timer = getattr(_local, "timer", None)
+        if timer is not None:
+            timer.connect += time.perf_counter() - start
+
+
+class PhaseStats:
+    """
+    Count, sum, maximum and cumulative histogram of the timings of one phase
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            max=self.max,
+            buckets={str(bound): count for bound, count in zip(BUCKETS, self.buckets)}
+        )
+
+
+class CrawlMetrics:
+    """
+    Timings and counters of a crawl.
+    Every visited url adds its phase timings to a histogram per phase,
+    only the slowest_pages slowest urls are kept with their own timings.
+    """
+
+    def __init__(self, slowest_pages=DEFAULT_SLOWEST_PAGES):
+
+        self.slowest_pages = slowest_pages
+
+        self.started = time.time()
+        self.start_time = time.monotonic()
+        self.elapsed = None
+
+        self.counters = dict(
+            urls_visited=0,
+            urls_skipped=0,
+            retries=0,
+            status_errors=0,
+            connection_errors=0,
+            robots_excluded=0,
+            not_modified=0,
+            bytes_downloaded=0,
+        )
+
+        # seconds the crawl had nothing to do but wait for a netloc's crawl delay
+        self.crawl_delay_wait = 0.0
+
+        # largest number of urls waiting to be visited
+        self.max_frontier = 0
+
+        self.phases = {phase: PhaseStats() for phase in PHASES + ["total"]}
+
+        # heap of (total seconds, sequence number, page dictionary) of the slowest pages
+        self.slowest = list()
+        self.sequence = 0
+
+    def frontier(self, size):
+        self.max_frontier = max(self.max_frontier, size)
+
+    def skipped(self):
+        self.counters["urls_skipped"] += 1
+
+    def retried(self):
+        self.counters["retries"] += 1
+
+    def waited(self, seconds):
+        self.crawl_delay_wait += seconds
+
+    def visited(self, url, response_code, timings, not_modified=False):
+        """
+        Add the result of visiting a url, timings has the seconds spent in each phase and the size of the body
+        :return: None
+        """
+
+        self.counters["urls_visited"] += 1
+        if response_code == 0:
+            self.counters["connection_errors"] += 1
+        elif response_code == -1:
+            self.counters["robots_excluded"] += 1
+        elif response_code is not None and response_code >= 400:
+            self.counters["status_errors"] += 1
+        if not_modified is True:
+            self.counters["not_modified"] += 1
+
+        # urls we didn't make requests for, like the ones robots.txt excludes, have no timings
+        if timings is None:
+            return
+
+        if timings.get("bytes") is not None:
+            self.counters["bytes_downloaded"] += timings["bytes"]
+
+        total = 0.0
+        for phase in PHASES:
+            seconds = timings.get(phase)
+            if seconds is None:
+                continue
+            self.phases[phase].add(seconds)
+            total += seconds
+        self.phases["total"].add(total)
+
+        if self.slowest_pages is None or self.slowest_pages > 0:
+            page = dict(url=url, response_code=response_code, total=total, bytes=timings.get("bytes"))
+            page.update((phase, timings.get(phase)) for phase in PHASES)
+
+            self.sequence += 1
+            entry = (total, self.sequence, page)
+            if self.slowest_pages is None or len(self.slowest) < self.slowest_pages:
+                heapq.heappush(self.slowest, entry)
+            elif total > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.start_time
+        return self
+
+    def to_dict(self):
+        """
+        The metrics as a json serializable dictionary
+        :return: dictionary
+        """
+
+        elapsed = self.elapsed if self.elapsed is not None else time.monotonic() - self.start_time
+        visited = self.counters["urls_visited"]
+        errors = self.counters["status_errors"] + self.counters["connection_errors"]
+
+        return dict(
+            started=self.started,
+            elapsed_seconds=elapsed,
+            pages_per_second=visited / max(elapsed, 1e-9),
+            error_rate=errors / visited if visited > 0 else 0.0,
+            crawl_delay_wait_seconds=self.crawl_delay_wait,
+            max_frontier=self.max_frontier,
+            counters=dict(self.counters),
+            phases={phase: stats.to_dict() for phase, stats in self.phases.items()},
+            slowest_pages=[page for _, _, page in sorted(self.slowest, key=lambda e: (-e[0], e[1]))]
+        )
+
+    def write(self, filename, metrics_format="json"):
+        """
+        Write the metrics to a file, as json or in the Prometheus text format
+        :return: None
+        """
+
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"unknown metrics format '{metrics_format}', expected one of {METRICS_FORMATS}")
+
+        metrics = self.to_dict()
+
+        with open(filename, "w") as f:
+            if metrics_format == "json":
+                json.dump(metrics, f, indent=2)
+                return
+
+            gauges = [
+                ("elapsed_seconds", "seconds the crawl took"),
+                ("pages_per_second", "urls visited per second"),
+                ("error_rate", "fraction of the visited urls with a connection or status error"),
+                ("crawl_delay_wait_seconds", "seconds spent waiting for crawl delays with nothing else to do"),
+                ("max_frontier", "largest number of urls waiting to be visited"),
+            ]
+            for name, help_text in gauges:
+                f.write(f"# HELP linkto_{name} {help_text}\n")
+                f.write(f"# TYPE linkto_{name} gauge\n")
+                f.write(f"linkto_{name} {metrics[name]}\n")
+
+            for name, value in metrics["counters"].items():
+                f.write(f"# TYPE linkto_{name}_total counter\n")
+                f.write(f"linkto_{name}_total {value}\n")
+
+            f.write("# HELP linkto_phase_seconds seconds spent in each phase of visiting a url\n")
+            f.write("# TYPE linkto_phase_seconds histogram\n")
+            for phase, stats in metrics["phases"].items():
+                for bound, count in stats["buckets"].items():
+                    f.write(f'linkto_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}\n')
+                f.write(f'linkto_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {stats["count"]}\n')
+                f.write(f'linkto_phase_seconds_sum{{phase="{phase}"}} {stats["sum"]}\n')
+                f.write(f'linkto_phase_seconds_count{{phase="{phase}"}} {stats["count"]}\n')
+
+
+def read_slowest_pages(filename):
+    """
+    Read the slowest pages from a json metrics file written by CrawlMetrics
+    :return: list of page dictionaries, slowest first
+    """
+
+    with open(filename) as f:
+        return json.load(f)["slowest_pages"]
@@ -1,21 +1,35 @@
-import json
-import copy
+import io
 import logging
 import re
+
+from collections import Counter
 from urllib.parse import urljoin, urlparse, urlunparse
 
+from checkrs_linkto.history import HistoryReader, iter_history
+from checkrs_linkto.ignore import IgnoreRules
+from checkrs_linkto.metrics import read_slowest_pages
+from checkrs_linkto.sinks import TextReportSink
+
 # create logger
 logger = logging.getLogger('linkto_report')
 
 
 def list_diff(l1, l2):
-    # using deepcopy to avoid modifying the original list
-    l1 = copy.deepcopy(l1)
+    """
+    Multiset difference of two lists,
+    for every item of l2 the first matching item of l1 is left out
+    :return: list with the rest of l1 in its original order
+    """
 
-    for i in l2:
-        if i in l1:
-            l1.remove(i)
-    return l1
+    remove = Counter(l2)
+
+    diff = list()
+    for i in l1:
+        if remove.get(i, 0) > 0:
+            remove[i] -= 1
+        else:
+            diff.append(i)
+    return diff
 
 
 def normalize_url(params):
@@ -32,39 +46,194 @@ def normalize_url(params):
 
     # if the start_url shows up inside of url,
     # then we remove start_url from the url
-    url = re.sub(start_url, "", url)
+    url = re.sub(re.escape(start_url), "", url)
 
     return url
 
 
-class LinkToReport:
+class NormalizedHistory:
+    """
+    Urls of a history with the start_url removed, see normalize_url().
+    Every distinct url is normalized once with a precompiled pattern,
+    so the reports don't repeat the work for urls that show up in many visited_from lists.
+    """
 
-    def __init__(self, history_golden, history_new):
+    def __init__(self, start_url):
 
-        # These are incoming file names
-        self.history_golden_fn = history_golden
-        self.history_new_fn = history_new
+        self.pattern = re.compile(re.escape(start_url))
+
+        # url -> normalized url
+        self.normalized = dict()
+
+    @classmethod
+    def for_netloc(cls, start_url):
+        """
+        Normalize urls by removing the scheme and netloc of the start_url
+        :return: NormalizedHistory
+        """
 
-        # read a json file
-        with open(self.history_golden_fn) as f:
-            data = json.load(f)
-            self.history_golden_start_url = data["start_url"]
-            self.history_golden = data["history"]
+        o = urlparse(start_url)
+        return cls(urlunparse([o.scheme, o.netloc, '', '', '', '']))
 
-        with open(self.history_new_fn) as f:
-            data = json.load(f)
-            self.history_new_start_url = data["start_url"]
-            self.history_new = data["history"]
+    def normalize(self, url):
+
+        if url is None:
+            return url
+
+        normalized = self.normalized.get(url)
+        if normalized is None:
+            normalized = self.pattern.sub("", url)
+            self.normalized[url] = normalized
+        return normalized
+
+    def keys(self, urls):
+        return set(map(self.normalize, urls))
+
+    def visited_from(self, visited_from):
+        return list(map(self.normalize, visited_from))
+
+
+def linked_from(record):
+    """
+    The page a url was first found on, or the sitemap that listed it when no page links to it
+    :return: url
+    """
+
+    if len(record["visited_from"]) > 0:
+        return record["visited_from"][0]
+    return record.get("sitemap")
+
+
+class FailFast:
+    """
+    Count the errors a crawl finds that the report would fail on, connection errors and status errors
+    the report's ignore rules don't match, so the crawl can be stopped once max_errors of them are found.
+    Errors are counted once the bot is done with a url, not while it is still retrying it.
+    """
+
+    def __init__(self, max_errors, ignored_connection_error_patterns=[], ignored_status_error_patterns=[]):
+
+        self.max_errors = max_errors
+        self.ignore_rules = IgnoreRules(ignored_connection_error_patterns, ignored_status_error_patterns)
+        self.errors = 0
+
+    def check(self, url, response_code, error_text):
+        """
+        Count the result of a url
+        :return: message for the urls that won't be visited once max_errors errors were found, otherwise None
+        """
+
+        if response_code == 0:
+            if self.ignore_rules.connection_error(error_text or "") is not None:
+                return None
+        elif response_code is None or response_code < 400:
+            return None
+        elif self.ignore_rules.status_error(url, response_code) is not None:
+            return None
+
+        self.errors += 1
+        logger.debug(f"fail fast, error {self.errors} of {self.max_errors}: {url} {response_code}")
+
+        if self.errors < self.max_errors:
+            return None
+        return f"Skipped, the crawl stopped after {self.errors} errors"
+
+
+class LinkToReport:
+    """
+    Compare the history of the current run with the history of a previous run.
+    The history of the current run is a file name, or the history dictionary or HistoryStore
+    the bot returned together with its new_start_url, so a crawl can be reported without reading it back.
+    The records of the current run are read again by every report_* stage instead of being kept in memory,
+    of the golden history only the visited_from lists are kept, to look up the links of a url.
+    The report_* stages send their records to sinks, see checkrs_linkto.sinks,
+    when no sinks are given the text report is collected in the report attribute.
+    """
+
+    def __init__(self, history_golden, history_new, sinks=None, new_start_url=None):
+
+        # These are incoming file names, history_new_fn is None for a history from memory
+        self.history_golden_fn = history_golden
+        self.history_new_fn = None
+
+        # the history files are either json or ndjson,
+        # the golden history is kept as url -> visited_from and the new one is read by each stage
+        self.history_golden_start_url, records = iter_history(self.history_golden_fn)
+        self.history_golden = {url: record["visited_from"] for url, record in records}
+        if isinstance(history_new, str):
+            self.history_new_fn = history_new
+            self.history_new = HistoryReader(self.history_new_fn)
+            self.history_new_start_url = self.history_new.start_url
+        else:
+            if new_start_url is None:
+                raise ValueError("new_start_url is required for a history that isn't read from a file")
+            self.history_new_start_url = new_start_url
+            self.history_new = history_new
 
         # variable used to determine if we have error to report back
         self.error_flag = False
 
-        # this is the text of the report
-        self.report = ""
+        # where the report is written
+        self._buffer = None
+        if sinks is None:
+            self._buffer = io.StringIO()
+            sinks = [TextReportSink(self._buffer)]
+        self.sinks = sinks
 
         # report counts
         self.counts = {}
 
+        # compiled ignore rules of the report_*_errors stages
+        self.ignore_rules = list()
+
+        # histories with normalized url's, built when a report needs them
+        self._normalized_golden = None
+        self._normalized_new = None
+
+    @property
+    def report(self):
+        """
+        The text of the report, when the report is not written to sinks
+        :return: string
+        """
+
+        if self._buffer is None:
+            return ""
+        return self._buffer.getvalue()
+
+    def begin_section(self, section):
+        for sink in self.sinks:
+            sink.begin_section(section)
+
+    def record(self, section, **record):
+        for sink in self.sinks:
+            sink.record(section, record)
+
+    def end_section(self, section):
+        for sink in self.sinks:
+            sink.end_section(section)
+
+    def close(self):
+        """
+        Tell the sinks that the report is finished
+        :return: self
+        """
+
+        for sink in self.sinks:
+            sink.close(self.counts)
+
+        return self
+
+    def normalized_golden(self):
+        if self._normalized_golden is None:
+            self._normalized_golden = NormalizedHistory.for_netloc(self.history_golden_start_url)
+        return self._normalized_golden
+
+    def normalized_new(self):
+        if self._normalized_new is None:
+            self._normalized_new = NormalizedHistory.for_netloc(self.history_new_start_url)
+        return self._normalized_new
+
     def report_connection_errors(self, ignored_connection_error_patterns=[]):
         """
         Look for URL's that we could not connect to that would have a response code of 0
@@ -72,34 +241,29 @@ class LinkToReport:
         :return: self
         """
 
-        self.report += "CONNECTION ERRORS:\n\n"
+        self.begin_section("connection_errors")
         self.counts['connection_errors'] = 0
 
+        ignore_rules = IgnoreRules(connection_error_patterns=ignored_connection_error_patterns)
+        self.ignore_rules.append(ignore_rules)
+
         for k, v in self.history_new.items():
             if v["response_code"] == 0:
                 logger.debug(f"processing connection error for: {k}")
 
                 # check if this record has an error that we should be ignoring
-                skip_record = False
-                for pattern in ignored_connection_error_patterns:
-                    match = re.search(pattern, v['error_text'])
-                    if match is not None:
-                        # found an error we want to ignore, skip the record
-                        logger.debug(f"ignoring connection error matching '{pattern}': {k} -> '{v['error_text']}'")
-                        skip_record = True
-                        break
-                if skip_record is True:
+                pattern = ignore_rules.connection_error(v['error_text'])
+                if pattern is not None:
+                    # found an error we want to ignore, skip the record
+                    logger.debug(f"ignoring connection error matching '{pattern}': {k} -> '{v['error_text']}'")
                     continue
 
                 self.error_flag = True
-                self.report += f"\turl: {k}\n"
-                self.report += f"\terror: {v['error_text']}\n"
-                self.report += f"\tlinked to from: {v['visited_from'][0]}\n"
-                self.report += f"\n"
+                self.record("connection_errors", url=k, error=v['error_text'], linked_to_from=linked_from(v))
 
                 self.counts['connection_errors'] += 1
 
-        self.report += '\n\n'
+        self.end_section("connection_errors")
 
         return self
 
@@ -109,39 +273,29 @@ class LinkToReport:
         :return: self
         """
 
-        self.report += "STATUS ERRORS:\n\n"
+        self.begin_section("status_errors")
         self.counts['status_errors'] = 0
 
-        for k, v in self.history_new.items():
-            # check if this record has a status code that we should be ignoring
-            skip_record = False
-            for ignore_grouping in ignored_status_error_patterns:
-                for site_pattern,status_codes in ignore_grouping.items():
-                    # check if we have a matching site
-                    match = re.search(site_pattern, k)
-                    if match is not None:
-                        # check if there is a matching status code
-                        if v["response_code"] in status_codes:
-                            # found an error we want to ignore, skip the record
-                            logger.debug(f"ignoring status error: '{k}', {v['response_code']}  matched  '{site_pattern}', {v['response_code']}")
-                            skip_record = True
-                        break
-                if skip_record is True:
-                    break
-            if skip_record is True:
-                continue
+        ignore_rules = IgnoreRules(status_error_patterns=ignored_status_error_patterns)
+        self.ignore_rules.append(ignore_rules)
 
+        for k, v in self.history_new.items():
             if v["response_code"] >= 400:
+
+                # check if this record has a status code that we should be ignoring
+                site_pattern = ignore_rules.status_error(k, v["response_code"])
+                if site_pattern is not None:
+                    # found an error we want to ignore, skip the record
+                    logger.debug(f"ignoring status error: '{k}', {v['response_code']}  matched  '{site_pattern}', {v['response_code']}")
+                    continue
+
                 logger.debug(f"processing status error for: {k} status code: {v['response_code']}")
                 self.error_flag = True
-                self.report += f"\turl: {k}\n"
-                self.report += f"\tstatus_code: {v['response_code']}\n"
-                self.report += f"\tlinked to from: {v['visited_from'][0]}\n"
-                self.report += "\n"
+                self.record("status_errors", url=k, status_code=v['response_code'], linked_to_from=linked_from(v))
 
                 self.counts['status_errors'] += 1
 
-        self.report += '\n\n'
+        self.end_section("status_errors")
 
         return self
 
@@ -154,42 +308,28 @@ class LinkToReport:
 
         logger.debug(f"processing report_url_visit_differences")
 
-        # parse the url for scheme and netloc
-        # generate the list of url's from golden file
-        # and normalize url's that match golden file start_url
-        o = urlparse(self.history_golden_start_url)
-        s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
-        t = [(s, x) for x in self.history_golden.keys()]
-        history_golden_keys = set(map(normalize_url, t))
-
-        # parse the url for scheme and netloc
-        # generate the list of url's from history_new file
-        # and normalize url's that match history_new file start_url
-        o = urlparse(self.history_new_start_url)
-        s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
-        t = [(s, x) for x in self.history_new.keys()]
-        history_new_keys = set(map(normalize_url, t))
+        # generate the list of url's from both files
+        # and normalize url's that match the scheme and netloc of the file's start_url
+        history_golden_keys = self.normalized_golden().keys(self.history_golden.keys())
+        history_new_keys = self.normalized_new().keys(self.history_new.keys())
 
         new_urls_visited = history_new_keys.difference(history_golden_keys)
         urls_not_visited = history_golden_keys.difference(history_new_keys)
 
-        self.report += "URL VISIT DIFFERENCES:\n\n"
+        self.begin_section("url_visit_differences")
         self.counts['url_visit_differences_old'] = len(urls_not_visited)
         self.counts['url_visit_differences_new'] = len(new_urls_visited)
 
-        if len(new_urls_visited) == 0 and len(urls_not_visited) == 0:
-            self.report += '\n\n'
-            return self
+        if len(new_urls_visited) != 0 or len(urls_not_visited) != 0:
+            self.error_flag = True
 
-        self.error_flag = True
+        for url in sorted(urls_not_visited):
+            self.record("url_visit_differences", url=url, change="not_visited")
 
-        self.report += "These are url's in the golden file that were not visited:\n"
-        self.report += '\n'.join('{}: {}'.format(*k) for k in enumerate(sorted(urls_not_visited)))
-        self.report += '\n\n'
+        for url in sorted(new_urls_visited):
+            self.record("url_visit_differences", url=url, change="new")
 
-        self.report += "These are new url's that were visited:\n"
-        self.report += '\n'.join('{}: {}'.format(*k) for k in enumerate(sorted(new_urls_visited)))
-        self.report += '\n\n'
+        self.end_section("url_visit_differences")
 
         return self
 
@@ -202,13 +342,21 @@ class LinkToReport:
 
         logger.debug(f"processing report_link_differences")
 
-        self.report += "LINK DIFFERENCES:\n\n"
+        self.begin_section("link_differences")
         self.counts['link_differences_not_in_old'] = 0
         self.counts['link_differences_not_in_new'] = 0
 
-        for k, v_new in self.history_new.items():
+        # normalize the url's that match the scheme and netloc of each file's start_url
+        golden = self.normalized_golden()
+        new = self.normalized_new()
 
-            norm_k = normalize_url((self.history_new_start_url, k))
+        # keys of history_new are looked up in history_golden with the full start_url removed
+        new_keys = NormalizedHistory(self.history_new_start_url)
+
+        for new_key, record in self.history_new.items():
+
+            k = new_key
+            norm_k = new_keys.normalize(k)
             if norm_k != k:
 
                 # convert to full link
@@ -220,23 +368,12 @@ class LinkToReport:
                 logger.debug(f"Skipping url since it was not found in history_golden: {k}")
                 continue
 
-            v_golden = self.history_golden[k]
-
-            # parse the url for scheme and netloc
-            # generate the list of url's from golden file
-            # and normalize url's that match golden file start_url
-            o = urlparse(self.history_golden_start_url)
-            s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
-            t = [(s, x) for x in v_golden["visited_from"]]
-            history_golden_visited_from = list(map(normalize_url, t))
+            history_golden_visited_from = golden.visited_from(self.history_golden[k])
+            history_new_visited_from = new.visited_from(record["visited_from"])
 
-            # parse the url for scheme and netloc
-            # generate the list of url's from history_new file
-            # and normalize url's that match history_new file start_url
-            o = urlparse(self.history_new_start_url)
-            s = urlunparse([o.scheme, o.netloc, '', '', '', ''])
-            t = [(s, x) for x in v_new["visited_from"]]
-            history_new_visited_from = list(map(normalize_url, t))
+            # most pages have the same links in both files
+            if Counter(history_golden_visited_from) == Counter(history_new_visited_from):
+                continue
 
             links_not_in_new = list_diff(history_golden_visited_from, history_new_visited_from)
             links_not_in_golden = list_diff(history_new_visited_from, history_golden_visited_from)
@@ -245,22 +382,80 @@ class LinkToReport:
                 continue
 
             self.error_flag = True
-            self.report += f"page: {k}\n"
-
-            self.report += f"\n\tlinks that are not in new:\n\t"
-            self.report += '\n\t'.join('{}: {}'.format(*k) for k in enumerate(links_not_in_new))
-            self.report += '\n'
-            self.report += f"\n\tlinks that are not in golden:\n\t"
-            self.report += '\n\t'.join('{}: {}'.format(*k) for k in enumerate(links_not_in_golden))
-            self.report += '\n'
+            self.record(
+                "link_differences",
+                page=k,
+                links_not_in_new=links_not_in_new,
+                links_not_in_golden=links_not_in_golden
+            )
 
             self.counts['link_differences_not_in_old'] += len(links_not_in_golden)
             self.counts['link_differences_not_in_new'] += len(links_not_in_new)
 
-        self.report += '\n\n'
+        self.end_section("link_differences")
 
         return self
 
+    def report_slowest_pages(self, metrics_filename, count=20):
+        """
+        List the pages that took the longest to visit in the current run,
+        from the json metrics file linkto_bot wrote along with the new history.
+        Slow pages are not errors, they don't set the error flag.
+        :return: self
+        """
+
+        logger.debug(f"processing report_slowest_pages")
+
+        self.begin_section("slowest_pages")
+
+        for page in read_slowest_pages(metrics_filename)[:count]:
+            self.record(
+                "slowest_pages",
+                url=page["url"],
+                response_code=page["response_code"],
+                total=page["total"],
+                connect=page["connect"],
+                ttfb=page["ttfb"],
+                download=page["download"],
+                parse=page["parse"],
+                bytes=page["bytes"]
+            )
+
+        self.end_section("slowest_pages")
+
+        return self
+
+    def report_duplicate_pages(self):
+        """
+        List the pages of the new history that had the same content as a page visited before them,
+        linkto_bot records that page as duplicate_of.
+        Duplicates are not errors, they don't set the error flag.
+        :return: self
+        """
+
+        logger.debug(f"processing report_duplicate_pages")
+
+        self.begin_section("duplicate_pages")
+
+        for k, v in self.history_new.items():
+            if v.get("duplicate_of") is not None:
+                self.record("duplicate_pages", url=k, duplicate_of=v["duplicate_of"])
+
+        self.end_section("duplicate_pages")
+
+        return self
+
+    def unused_ignore_rules(self):
+        """
+        Find the ignore rules that didn't match any errors in the report_*_errors stages that ran
+        :return: list of strings describing the rules
+        """
+
+        unused = list()
+        for ignore_rules in self.ignore_rules:
+            unused.extend(ignore_rules.unused())
+        return unused
+
     def summary(self):
         """
         Summarize error and link counts
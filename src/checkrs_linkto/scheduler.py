@@ -0,0 +1,390 @@
+import heapq
+import itertools
+import logging
+import time
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+# status codes of responses worth asking for again later
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# urls without a click depth, like the ones only a sitemap lists, are handed out with the urls at this depth
+NO_DEPTH_PRIORITY = 1
+
+
+class HostScheduler:
+    """
+    Queue of urls waiting to be visited, grouped by netloc.
+    Requests to the same netloc are spaced out by that netloc's crawl delay,
+    requests to different netlocs are handed out without waiting on each other.
+    Urls with the smallest click depth are handed out first, the oldest first for the same depth,
+    and a waiting url moves up when a shorter path to it is found.
+    """
+
+    def __init__(self, crawl_delay=1):
+
+        # default number of seconds between requests to the same netloc
+        self.crawl_delay = crawl_delay
+
+        # netloc -> heap of (depth, sequence number, url) waiting to be visited,
+        # entries with a depth that isn't the url's current one are left behind by update_depth()
+        self.queues = dict()
+
+        # url -> (depth, sequence number) of the urls waiting to be visited
+        self.waiting = dict()
+
+        # netloc -> time.monotonic() value when the next request may be made
+        self.next_request = dict()
+
+        # netloc -> crawl delay for netlocs that asked for a longer delay in robots.txt
+        self.crawl_delays = dict()
+
+        # netlocs that should not hand out urls until they are released
+        self.held = set()
+
+        # heap of (time.monotonic() value, sequence number, url) for urls that can't be visited before then
+        self.delayed = list()
+        self.delayed_urls = set()
+
+        # sequence numbers keep the oldest url first across netlocs
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __contains__(self, url):
+        return url in self.waiting
+
+    def append(self, url, not_before=None, depth=0):
+        """
+        Add a url to its netloc's queue, behind the waiting urls with the same or a smaller depth.
+        With not_before, a time.monotonic() value, the url joins the queue at that time.
+        :return: None
+        """
+
+        if depth is None:
+            depth = NO_DEPTH_PRIORITY
+
+        sequence = next(self.counter)
+        self.waiting[url] = (depth, sequence)
+
+        if not_before is not None:
+            heapq.heappush(self.delayed, (not_before, sequence, url))
+            self.delayed_urls.add(url)
+            return
+
+        self._enqueue(url)
+
+    def update_depth(self, url, depth):
+        """
+        Move a waiting url up its netloc's queue when a shorter path to it was found
+        :return: None
+        """
+
+        entry = self.waiting.get(url)
+        if entry is None or entry[0] <= depth:
+            return
+
+        # it keeps its place among the urls with the same depth
+        self.waiting[url] = (depth, entry[1])
+
+        # delayed urls join the queue with their new depth when their time comes
+        if url not in self.delayed_urls:
+            self._enqueue(url)
+
+    def _enqueue(self, url):
+        depth, sequence = self.waiting[url]
+        netloc = urlparse(url).netloc
+        if netloc not in self.queues:
+            self.queues[netloc] = list()
+        heapq.heappush(self.queues[netloc], (depth, sequence, url))
+
+    def _is_current(self, entry):
+        return self.waiting.get(entry[2]) == entry[:2]
+
+    def _head(self, netloc):
+        """
+        Drop the entries update_depth() left behind from the front of a netloc's queue
+        :return: the first entry, or None if the queue is empty and was removed
+        """
+
+        queue = self.queues[netloc]
+        while len(queue) > 0 and not self._is_current(queue[0]):
+            heapq.heappop(queue)
+        if len(queue) == 0:
+            del self.queues[netloc]
+            return None
+        return queue[0]
+
+    def drain(self):
+        """
+        Remove every waiting url, delayed ones included
+        :return: list of urls in the order they would have been handed out
+        """
+
+        urls = sorted(self.waiting, key=lambda url: self.waiting[url])
+        self.queues = dict()
+        self.delayed = list()
+        self.delayed_urls = set()
+        self.waiting = dict()
+        return urls
+
+    def delay(self, netloc, until):
+        """
+        Don't make requests to a netloc before until, a time.monotonic() value,
+        like when the server asked us to come back later
+        :return: None
+        """
+
+        self.next_request[netloc] = max(self.next_request.get(netloc, 0), until)
+
+    def set_crawl_delay(self, netloc, crawl_delay):
+        """
+        Use a different crawl delay for a netloc, usually from a robots.txt Crawl-delay rule.
+        We never go faster than the default crawl delay.
+        :return: None
+        """
+
+        crawl_delay = max(self.crawl_delay, crawl_delay)
+        if self.crawl_delays.get(netloc) != crawl_delay:
+            logger.debug(f"using crawl delay of {crawl_delay} seconds for {netloc}")
+        self.crawl_delays[netloc] = crawl_delay
+
+    def hold(self, netloc):
+        """
+        Stop handing out urls for a netloc until release() is called
+        :return: None
+        """
+
+        self.held.add(netloc)
+
+    def release(self, netloc):
+        """
+        Start handing out urls for a netloc that was held
+        :return: None
+        """
+
+        self.held.discard(netloc)
+
+    def is_held(self, netloc):
+        return netloc in self.held
+
+    def reserve(self, netloc, now=None):
+        """
+        Record that a request is being made to a netloc,
+        the next request to the netloc has to wait for the crawl delay
+        :return: None
+        """
+
+        if now is None:
+            now = time.monotonic()
+        self.next_request[netloc] = now + self.crawl_delays.get(netloc, self.crawl_delay)
+
+    def _ready_netlocs(self, now):
+        for netloc, queue in self.queues.items():
+            if netloc in self.held:
+                continue
+            if self.next_request.get(netloc, 0) > now:
+                continue
+            yield netloc, queue
+
+    def pop_ready(self, now=None):
+        """
+        Remove and return the oldest url whose netloc can be requested right now
+        :return: url or None if no netloc is ready
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        # delayed urls whose time has come join their netloc's queue
+        while len(self.delayed) > 0 and self.delayed[0][0] <= now:
+            _, _, url = heapq.heappop(self.delayed)
+            self.delayed_urls.discard(url)
+            self._enqueue(url)
+
+        first = None
+        for netloc, _ in list(self._ready_netlocs(now)):
+            head = self._head(netloc)
+            if head is not None and (first is None or head < first):
+                first = head
+
+        if first is None:
+            return None
+
+        _, _, url = heapq.heappop(self.queues[urlparse(first[2]).netloc])
+        del self.waiting[url]
+
+        return url
+
+    def next_ready_in(self, now=None):
+        """
+        Number of seconds until a netloc with waiting urls can be requested
+        :return: seconds, or None if no urls are waiting on a netloc that isn't held
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        wait_times = [
+            max(0, self.next_request.get(netloc, 0) - now)
+            for netloc in self.queues.keys()
+            if netloc not in self.held
+        ]
+
+        if len(self.delayed) > 0:
+            wait_times.append(max(0, self.delayed[0][0] - now))
+
+        if len(wait_times) == 0:
+            return None
+
+        return min(wait_times)
+
+
+class RetryPolicy:
+    """
+    Decide if and when a url that failed with a connection error or a status code like 429 or 503
+    is visited again. The wait comes from the response's Retry-After header or grows exponentially
+    with each retry. The crawl goes on with other urls in the meantime.
+    Each host has a budget of retries, so one flaky server can't use up the run's time.
+    """
+
+    def __init__(self, max_retries=2, backoff_factor=1, max_retry_after=300, host_retry_budget=20):
+
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_after = max_retry_after
+        self.host_retry_budget = host_retry_budget
+
+        # url -> number of retries so far
+        self.retries = dict()
+
+        # netloc -> number of retries so far
+        self.host_retries = dict()
+
+    def retry_in(self, url, response_code, retry_after=None):
+        """
+        Check if a visit should be retried
+        :return: number of seconds to wait before visiting the url again, or None to keep the result
+        """
+
+        if response_code != 0 and response_code not in RETRY_STATUS_CODES:
+            return None
+
+        retries = self.retries.get(url, 0)
+        if retries >= self.max_retries:
+            return None
+
+        netloc = urlparse(url).netloc
+        if self.host_retries.get(netloc, 0) >= self.host_retry_budget:
+            if self.host_retries[netloc] == self.host_retry_budget:
+                logger.info(f"no retries left for host: {netloc}")
+                # only log it once
+                self.host_retries[netloc] += 1
+            return None
+
+        wait_time = parse_retry_after(retry_after)
+        if wait_time is None:
+            wait_time = self.backoff_factor * (2 ** retries)
+        elif wait_time > self.max_retry_after:
+            logger.debug(f"Retry-After of {wait_time} seconds is too long, not retrying: {url}")
+            return None
+
+        self.retries[url] = retries + 1
+        self.host_retries[netloc] = self.host_retries.get(netloc, 0) + 1
+
+        return wait_time
+
+
+class CrawlBudget:
+    """
+    Limits on the number of urls a crawl visits, the seconds it runs and the bytes it downloads,
+    None means no limit.
+    Once a budget is used up no new visits are started, the visits in progress are finished.
+    """
+
+    def __init__(self, max_pages=None, max_seconds=None, max_bytes=None):
+
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+
+        self.pages = 0
+        self.bytes = 0
+        self.start_time = time.monotonic()
+
+        # the message for the budget that ran out, once one has
+        self.exhausted = None
+
+    def visit(self):
+        """
+        Count a visit that is about to start
+        :return: None
+        """
+
+        self.pages += 1
+
+    def stop(self, message):
+        """
+        End the crawl early, the way a budget that ran out does
+        :return: None
+        """
+
+        if self.exhausted is None:
+            self.exhausted = message
+            logger.info(f"stopping the crawl: {message}")
+
+    def downloaded(self, size):
+        if size is not None:
+            self.bytes += size
+
+    def check(self, now=None):
+        """
+        Check if one of the budgets ran out, once one has it stays that way
+        :return: message for the urls that won't be visited, or None if there is budget left
+        """
+
+        if self.exhausted is not None:
+            return self.exhausted
+
+        if now is None:
+            now = time.monotonic()
+
+        if self.max_pages is not None and self.pages >= self.max_pages:
+            self.exhausted = f"Skipped, the crawl's budget of {self.max_pages} pages ran out"
+        elif self.max_seconds is not None and now - self.start_time >= self.max_seconds:
+            self.exhausted = f"Skipped, the crawl's budget of {self.max_seconds} seconds ran out"
+        elif self.max_bytes is not None and self.bytes >= self.max_bytes:
+            self.exhausted = f"Skipped, the crawl's budget of {self.max_bytes} bytes ran out"
+
+        if self.exhausted is not None:
+            logger.info(f"stopping the crawl: {self.exhausted}")
+
+        return self.exhausted
+
+
+def parse_retry_after(value):
+    """
+    Read a Retry-After header, which is either a number of seconds or an HTTP date
+    :return: seconds or None if the header is missing or invalid
+    """
+
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+
+    return max(0, retry_at.timestamp() - time.time())
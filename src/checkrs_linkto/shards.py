@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import sqlite3
+import time
+
+from urllib.parse import urlsplit
+
+from checkrs_linkto.urls import canonicalize
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+SHARD_MODES = ["hash", "prefix"]
+
+DEFAULT_POLL_INTERVAL = 1 # seconds
+
+
+class ShardPartition:
+    """
+    Deterministic split of the urls of a crawl between shards, every shard computes the same owner for a url.
+    In hash mode a url belongs to the shard picked by a hash of its canonical url.
+    In prefix mode prefixes has a list of path prefixes for every shard, the longest prefix matching
+    the url's path decides, urls that don't match any prefix are split by hash.
+    """
+
+    def __init__(self, shards, mode="hash", prefixes=None, strip_query_params=[]):
+
+        if mode not in SHARD_MODES:
+            raise ValueError(f"unknown shard mode '{mode}', expected one of {SHARD_MODES}")
+
+        if mode == "prefix" and (prefixes is None or len(prefixes) != shards):
+            raise ValueError(f"shard mode 'prefix' needs a list of path prefixes for each of the {shards} shards")
+
+        self.shards = shards
+        self.mode = mode
+        self.strip_query_params = strip_query_params
+
+        # list of (prefix, shard), longest prefix first
+        self.prefixes = list()
+        if mode == "prefix":
+            for shard, shard_prefixes in enumerate(prefixes):
+                self.prefixes.extend((prefix, shard) for prefix in shard_prefixes)
+            self.prefixes.sort(key=lambda p: len(p[0]), reverse=True)
+
+    def owner(self, url):
+        """
+        Find the shard a url belongs to,
+        urls that point to the same resource belong to the same shard
+        :return: shard number
+        """
+
+        c = canonicalize(url, self.strip_query_params)
+
+        if len(self.prefixes) > 0:
+            path = urlsplit(c).path
+            for prefix, shard in self.prefixes:
+                if path.startswith(prefix):
+                    return shard
+
+        # the builtin hash() of a string changes between processes
+        digest = hashlib.sha1(c.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.shards
+
+
+class ShardSpool:
+    """
+    SQLite file shared by the shards of a crawl.
+    Shards hand off the urls they find that belong to another shard, and pick up the urls handed off to them.
+    Each shard also records whether it is idle, the crawl is done when every shard is idle
+    and no handed off url is waiting to be picked up.
+    The file has to be removed before starting a new sharded crawl.
+    """
+
+    def __init__(self, filename, shard, partition, poll_interval=DEFAULT_POLL_INTERVAL):
+
+        if shard < 0 or shard >= partition.shards:
+            raise ValueError(f"shard {shard} is not one of the {partition.shards} shards")
+
+        self.filename = filename
+        self.shard = shard
+        self.partition = partition
+        self.poll_interval = poll_interval
+
+        # urls found for other shards since the last poll, as (shard, url, depth)
+        self.outbox = list()
+
+        self.last_poll = None
+        self.done = False
+
+        # transactions are started explicitly, so every poll is a single transaction
+        self.db = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS handoffs ("
+            "shard INTEGER, url TEXT, depth INTEGER, claimed INTEGER DEFAULT 0, PRIMARY KEY (shard, url))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, idle INTEGER)")
+
+    def start(self, resume=False):
+        """
+        Register the shard as busy.
+        When resuming, the urls the shard already picked up are handed to it again,
+        the ones that made it into the checkpoint are ignored by the bot.
+        :return: None
+        """
+
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.execute("INSERT OR REPLACE INTO shards (shard, idle) VALUES (?, 0)", (self.shard,))
+        if resume is True:
+            self.db.execute("UPDATE handoffs SET claimed = 0 WHERE shard = ?", (self.shard,))
+        self.db.execute("COMMIT")
+
+    def owns(self, url):
+        return self.partition.owner(url) == self.shard
+
+    def hand_off(self, url, depth):
+        """
+        Queue a url for the shard it belongs to, it is written to the spool by the next poll()
+        :return: None
+        """
+
+        self.outbox.append((self.partition.owner(url), url, depth))
+
+    def poll(self, idle):
+        """
+        Write the queued urls for other shards and pick up the urls handed off to this shard.
+        While the shard is busy this only touches the spool every poll_interval seconds.
+        When the shard is idle and there is nothing to pick up, check if the crawl is done.
+        :return: list of (url, depth) tuples for this shard
+        """
+
+        now = time.monotonic()
+        if idle is False and self.last_poll is not None and now - self.last_poll < self.poll_interval:
+            return []
+        self.last_poll = now
+
+        self.db.execute("BEGIN IMMEDIATE")
+
+        self.db.executemany("INSERT OR IGNORE INTO handoffs (shard, url, depth) VALUES (?, ?, ?)", self.outbox)
+        self.outbox = list()
+
+        received = self.db.execute(
+            "SELECT url, depth FROM handoffs WHERE shard = ? AND claimed = 0 ORDER BY rowid", (self.shard,)
+        ).fetchall()
+        if len(received) > 0:
+            self.db.execute("UPDATE handoffs SET claimed = 1 WHERE shard = ? AND claimed = 0", (self.shard,))
+
+        idle = idle is True and len(received) == 0
+        self.db.execute("UPDATE shards SET idle = ? WHERE shard = ?", (int(idle), self.shard))
+
+        if idle is True:
+            # once every shard is idle with nothing left to pick up, none of them can find more urls
+            (idle_shards,) = self.db.execute("SELECT COUNT(*) FROM shards WHERE idle = 1").fetchone()
+            (waiting,) = self.db.execute("SELECT COUNT(*) FROM handoffs WHERE claimed = 0").fetchone()
+            self.done = idle_shards == self.partition.shards and waiting == 0
+
+        self.db.execute("COMMIT")
+
+        if len(received) > 0:
+            logger.debug(f"picked up {len(received)} urls from other shards")
+
+        return received
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,228 @@
+import json
+
+from xml.sax.saxutils import escape, quoteattr
+
+SECTION_TITLES = {
+    "connection_errors": "CONNECTION ERRORS",
+    "status_errors": "STATUS ERRORS",
+    "url_visit_differences": "URL VISIT DIFFERENCES",
+    "link_differences": "LINK DIFFERENCES",
+    "slowest_pages": "SLOWEST PAGES",
+    "duplicate_pages": "DUPLICATE PAGES",
+}
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    return f"{seconds:.3f}s"
+
+
+class ReportSink:
+    """
+    Receives the records of a LinkToReport as each report_* stage finds them.
+    A stage calls begin_section(), record() for every problem it found, in order, and end_section().
+    close() is called once after the last stage with the report counts.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def begin_section(self, section):
+        pass
+
+    def record(self, section, record):
+        pass
+
+    def end_section(self, section):
+        pass
+
+    def close(self, counts):
+        pass
+
+
+class TextReportSink(ReportSink):
+    """
+    The plain text report linkto_report has always written
+    """
+
+    # url visit differences are written as two numbered lists
+    URL_VISIT_LISTS = [
+        ("not_visited", "These are url's in the golden file that were not visited:\n"),
+        ("new", "These are new url's that were visited:\n"),
+    ]
+
+    def __init__(self, f):
+        super().__init__(f)
+
+        # number of records written in the current section
+        self.count = 0
+
+        # position in URL_VISIT_LISTS and in the current list
+        self.list_index = -1
+        self.list_count = 0
+
+    def begin_section(self, section):
+        self.f.write(f"{SECTION_TITLES[section]}:\n\n")
+        self.count = 0
+        self.list_index = -1
+        self.list_count = 0
+
+    def record(self, section, record):
+
+        self.count += 1
+
+        if section == "connection_errors":
+            self.f.write(f"\turl: {record['url']}\n")
+            self.f.write(f"\terror: {record['error']}\n")
+            self.f.write(f"\tlinked to from: {record['linked_to_from']}\n")
+            self.f.write("\n")
+
+        elif section == "status_errors":
+            self.f.write(f"\turl: {record['url']}\n")
+            self.f.write(f"\tstatus_code: {record['status_code']}\n")
+            self.f.write(f"\tlinked to from: {record['linked_to_from']}\n")
+            self.f.write("\n")
+
+        elif section == "url_visit_differences":
+            # start the list this record belongs to, and any empty list before it
+            changes = [change for change, _ in self.URL_VISIT_LISTS]
+            while self.list_index < changes.index(record["change"]):
+                self._next_url_visit_list()
+            if self.list_count > 0:
+                self.f.write('\n')
+            self.f.write(f"{self.list_count}: {record['url']}")
+            self.list_count += 1
+
+        elif section == "link_differences":
+            self.f.write(f"page: {record['page']}\n")
+            self.f.write(f"\n\tlinks that are not in new:\n\t")
+            self.f.write('\n\t'.join('{}: {}'.format(*k) for k in enumerate(record['links_not_in_new'])))
+            self.f.write('\n')
+            self.f.write(f"\n\tlinks that are not in golden:\n\t")
+            self.f.write('\n\t'.join('{}: {}'.format(*k) for k in enumerate(record['links_not_in_golden'])))
+            self.f.write('\n')
+
+        elif section == "slowest_pages":
+            self.f.write(f"\turl: {record['url']}\n")
+            self.f.write(
+                f"\ttotal: {format_seconds(record['total'])}"
+                f" (connect {format_seconds(record['connect'])},"
+                f" time to first byte {format_seconds(record['ttfb'])},"
+                f" download {format_seconds(record['download'])},"
+                f" parse {format_seconds(record['parse'])})\n"
+            )
+            self.f.write(f"\tstatus_code: {record['response_code']}\n")
+            if record['bytes'] is not None:
+                self.f.write(f"\tsize: {record['bytes']} bytes\n")
+            self.f.write("\n")
+
+        elif section == "duplicate_pages":
+            self.f.write(f"\turl: {record['url']}\n")
+            self.f.write(f"\tsame content as: {record['duplicate_of']}\n")
+            self.f.write("\n")
+
+    def end_section(self, section):
+        if section == "url_visit_differences" and self.count > 0:
+            # finish the last list, and write any empty list after it
+            while self.list_index < len(self.URL_VISIT_LISTS) - 1:
+                self._next_url_visit_list()
+            self.f.write('\n\n')
+            return
+
+        self.f.write('\n\n')
+
+    def _next_url_visit_list(self):
+        if self.list_index >= 0:
+            self.f.write('\n\n')
+        self.list_index += 1
+        self.list_count = 0
+        self.f.write(self.URL_VISIT_LISTS[self.list_index][1])
+
+
+class JsonLinesReportSink(ReportSink):
+    """
+    One json object per line for every record, with the name of its section,
+    followed by a summary line with the report counts
+    """
+
+    def record(self, section, record):
+        line = dict(section=section)
+        line.update(record)
+        self.f.write(json.dumps(line) + "\n")
+
+    def close(self, counts):
+        self.f.write(json.dumps(dict(section="summary", counts=counts)) + "\n")
+
+
+class JUnitReportSink(ReportSink):
+    """
+    JUnit XML with a test suite for every section and a failed test case for every record.
+    Sections without records get a single passing test case.
+    Slowest pages are passing test cases with the time it took to visit the page,
+    duplicate pages are passing test cases too.
+    """
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.count = 0
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.f.write('<testsuites name="linkto">\n')
+
+    def begin_section(self, section):
+        self.count = 0
+        self.f.write(f'  <testsuite name={quoteattr(section)}>\n')
+
+    def record(self, section, record):
+
+        self.count += 1
+
+        if section == "slowest_pages":
+            self.f.write(
+                f'    <testcase classname={quoteattr("linkto." + section)} name={quoteattr(record["url"])}'
+                f' time="{record["total"]:.3f}"/>\n'
+            )
+            return
+
+        if section == "duplicate_pages":
+            self.f.write(
+                f'    <testcase classname={quoteattr("linkto." + section)} name={quoteattr(record["url"])}>\n'
+                f'      <system-out>{escape("same content as: " + record["duplicate_of"])}</system-out>\n'
+                f'    </testcase>\n'
+            )
+            return
+
+        if section == "connection_errors":
+            name = record["url"]
+            message = record["error"]
+            details = f"linked to from: {record['linked_to_from']}"
+        elif section == "status_errors":
+            name = record["url"]
+            message = f"status code {record['status_code']}"
+            details = f"linked to from: {record['linked_to_from']}"
+        elif section == "url_visit_differences":
+            name = record["url"]
+            if record["change"] == "not_visited":
+                message = "url in the golden file was not visited"
+            else:
+                message = "new url was visited"
+            details = ""
+        else:
+            name = record["page"]
+            message = "links on the page changed"
+            details = "links that are not in new:\n"
+            details += "".join(f"{link}\n" for link in record["links_not_in_new"])
+            details += "links that are not in golden:\n"
+            details += "".join(f"{link}\n" for link in record["links_not_in_golden"])
+
+        self.f.write(f'    <testcase classname={quoteattr("linkto." + section)} name={quoteattr(str(name))}>\n')
+        self.f.write(f'      <failure message={quoteattr(str(message))}>{escape(details)}</failure>\n')
+        self.f.write('    </testcase>\n')
+
+    def end_section(self, section):
+        if self.count == 0:
+            self.f.write(f'    <testcase classname={quoteattr("linkto." + section)} name={quoteattr(section)}/>\n')
+        self.f.write('  </testsuite>\n')
+
+    def close(self, counts):
+        self.f.write('</testsuites>\n')
@@ -0,0 +1,194 @@
+import datetime
+import gzip
+import logging
+import queue
+import threading
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+# urls read from sitemaps allowed to wait for the bot before the reader stops reading
+DEFAULT_BACKLOG = 10000
+
+# sitemap index files can point to other index files, stop following them this deep
+MAX_INDEX_DEPTH = 5
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def parse_lastmod(text):
+    """
+    Convert a sitemap lastmod value, in the W3C datetime format, to a timestamp.
+    Dates and times without a timezone are taken as UTC.
+    :return: seconds since the epoch, or None if the value can't be parsed
+    """
+
+    if text is None:
+        return None
+
+    text = text.strip()
+    if text.endswith("Z") or text.endswith("z"):
+        text = text[:-1] + "+00:00"
+
+    try:
+        value = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            # fromisoformat doesn't accept the year-month and year forms before python 3.11
+            value = datetime.datetime.strptime(text, "%Y-%m" if "-" in text else "%Y")
+        except ValueError:
+            return None
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+
+    return value.timestamp()
+
+
+class PrefixedStream:
+    """
+    Read the first size bytes of a stream ahead, to tell what kind of file it is,
+    without a buffered reader that fails on the response bodies urllib3 closes once they are read
+    """
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.prefix = stream.read(size)
+        self.position = 0
+
+    def read(self, size=-1):
+        if self.position < len(self.prefix):
+            if size is None or size < 0:
+                data = self.prefix[self.position:] + self.stream.read()
+                self.position = len(self.prefix)
+                return data
+            data = self.prefix[self.position:self.position + size]
+            self.position += len(data)
+            return data
+        return self.stream.read(size)
+
+
+def iter_sitemap(stream):
+    """
+    Read the entries of a sitemap or sitemap index file as they are parsed,
+    entries are dropped from the tree once they are read, so large sitemaps don't take up memory.
+    Gzip compressed files are uncompressed.
+    :return: iterator of (kind, loc, lastmod) tuples, kind is "url" for pages
+        and "sitemap" for the sitemaps listed in an index file, lastmod is a timestamp or None
+    """
+
+    from lxml import etree
+
+    stream = PrefixedStream(stream, len(GZIP_MAGIC))
+    if stream.prefix == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+
+    entries = etree.iterparse(
+        stream, events=("end",), tag=("{*}url", "{*}sitemap"),
+        resolve_entities=False, no_network=True, huge_tree=True
+    )
+    for _, element in entries:
+        loc = element.findtext("{*}loc")
+        lastmod = element.findtext("{*}lastmod")
+        kind = etree.QName(element).localname
+
+        # drop the entry and the ones before it
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+        if loc is None or loc.strip() == "":
+            continue
+
+        yield kind, loc.strip(), parse_lastmod(lastmod)
+
+
+class SitemapReader:
+    """
+    Read the urls in a site's sitemaps on a background thread, for seeding the crawl.
+    The sitemaps are sitemap_urls and, when a RobotsCache is given, the ones listed in the start url's robots.txt,
+    sitemap index files are followed to the sitemaps they list.
+    Sitemaps that can't be retrieved or parsed are logged and skipped.
+    """
+
+    def __init__(self, s, start_url, sitemap_urls=[], robots=None, backlog=DEFAULT_BACKLOG):
+
+        self.s = s
+        self.start_url = start_url
+        self.sitemap_urls = list(sitemap_urls)
+        self.robots = robots
+
+        # (url, lastmod, sitemap url) tuples waiting for the bot
+        self.urls = queue.Queue(maxsize=backlog)
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def done(self):
+        return not self.thread.is_alive() and self.urls.empty()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def poll(self):
+        """
+        Take the urls read since the last poll
+        :return: list of (url, lastmod, sitemap url) tuples, lastmod is a timestamp or None
+        """
+
+        received = list()
+        while True:
+            try:
+                received.append(self.urls.get_nowait())
+            except queue.Empty:
+                return received
+
+    def _put(self, item):
+        # wait for the bot to catch up, unless it stopped
+        while not self.stopped.is_set():
+            try:
+                self.urls.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+
+        if self.robots is not None:
+            robots_txt = self.robots.fetch(self.s, self.start_url)
+            if robots_txt["parser"] is not None:
+                self.sitemap_urls.extend(robots_txt["parser"].site_maps() or [])
+
+        seen = set()
+        pending = [(url, 0) for url in self.sitemap_urls]
+        count = 0
+        while len(pending) > 0 and not self.stopped.is_set():
+            sitemap_url, index_depth = pending.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+
+            logger.debug(f"reading sitemap: {sitemap_url}")
+            try:
+                with self.s.get(sitemap_url, stream=True) as r:
+                    r.raise_for_status()
+                    r.raw.decode_content = True
+                    for kind, loc, lastmod in iter_sitemap(r.raw):
+                        if kind == "sitemap":
+                            if index_depth < MAX_INDEX_DEPTH:
+                                pending.append((loc, index_depth + 1))
+                            continue
+                        if self._put((loc, lastmod, sitemap_url)) is False:
+                            return
+                        count += 1
+            except Exception as err:
+                # the body is read straight from the connection, so urllib3 and lxml errors end up here too
+                logger.error(f"while reading sitemap {sitemap_url}: {err}")
+
+        logger.info(f"read {count} urls from {len(seen)} sitemaps")
@@ -0,0 +1,224 @@
+import fnmatch
+import logging
+
+from urllib.parse import urldefrag, urlparse, urlsplit, urlunsplit
+
+from checkrs_linkto.ignore import FirstMatch
+
+# create logger
+logger = logging.getLogger('linkto_bot')
+
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443
+}
+
+
+def canonicalize(url, strip_query_params=[]):
+    """
+    Normalize a url so different spellings of the same resource compare equal.
+    The scheme and host are lower cased, default ports and the fragment are removed,
+    an empty path becomes '/' and query parameters with names matching
+    one of the strip_query_params wildcard patterns (like 'utm_*') are removed.
+    :return: canonical url
+    """
+
+    p = urlsplit(url)
+    scheme = p.scheme.lower()
+
+    try:
+        port = p.port
+    except ValueError:
+        # invalid port, leave the url alone apart from the fragment
+        return urldefrag(url).url
+
+    # rebuild the netloc with a lower case host and without the default port
+    netloc = p.hostname or ''
+    if ':' in netloc:
+        # ipv6 address
+        netloc = f"[{netloc}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    userinfo, _, _ = p.netloc.rpartition('@')
+    if userinfo != '':
+        netloc = f"{userinfo}@{netloc}"
+
+    path = p.path
+    if path == '' and netloc != '':
+        path = '/'
+
+    # remove query parameters that don't change the resource,
+    # the rest of the query string is kept as it was written
+    query = p.query
+    if len(strip_query_params) > 0 and query != '':
+        query = '&'.join(
+            param for param in query.split('&')
+            if not any(fnmatch.fnmatchcase(param.split('=', 1)[0], pattern) for pattern in strip_query_params)
+        )
+
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class UrlFilter:
+    """
+    Decide which urls the bot won't visit, as soon as they are found on a page,
+    so they never take up space in the list of urls to be visited.
+    The exclude_url_patterns are compiled once into a single matcher.
+    """
+
+    EXTERNAL_NETLOC = "Matched URL exclude external netloc"
+
+    def __init__(self, start_url, exclude_external_urls=True, exclude_url_patterns=[]):
+
+        self.netloc = urlparse(start_url).netloc
+        self.exclude_external_urls = exclude_external_urls
+        self.patterns = FirstMatch(exclude_url_patterns)
+
+        # every url skipped by a rule shares the rule's message
+        self.messages = [f"Matched URL exclude pattern '{p}'" for p in self.patterns.patterns]
+
+    def skip(self, url):
+        """
+        Check if a url should be skipped
+        :return: tuple with the response_code and error_text to record for the url, or None to visit the url
+        """
+
+        # check if this url has an external netloc
+        if self.exclude_external_urls is True and urlparse(url).netloc != self.netloc:
+            logger.debug(self.EXTERNAL_NETLOC)
+            return (-1, self.EXTERNAL_NETLOC)
+
+        # check if the user asked to skip visiting this url
+        index = self.patterns.search(url)
+        if index is not None:
+            logger.debug(self.messages[index])
+            return (-1, self.messages[index])
+
+        return None
+
+
+class VisitTargets:
+    """
+    Group the urls in the history by the resource they point to, so each resource is visited once.
+    The first url seen for a resource is visited, other urls for the same resource
+    (fragments, different host case, default ports, stripped query parameters)
+    are recorded in the history with the result of that visit.
+    Links to fragments are checked against the element ids of the visited page.
+    """
+
+    def __init__(self, strip_query_params=[]):
+
+        self.strip_query_params = strip_query_params
+
+        # canonical url -> dictionary describing the visit of the resource
+        self.targets = dict()
+
+    def canonical(self, url):
+        return canonicalize(url, self.strip_query_params)
+
+    def add(self, url):
+        """
+        Register a url from the history
+        :return: True if the url is the first one seen for its resource and should be visited
+        """
+
+        c = self.canonical(url)
+        if c in self.targets:
+            return False
+
+        self.targets[c] = dict(
+            url=url,
+            done=False,
+            response_code=None,
+            error_text=None,
+            ids=None,
+            content_hash=None,
+            duplicate_of=None,
+            dependents=list()
+        )
+        return True
+
+    def get(self, url):
+        return self.targets[self.canonical(url)]
+
+    def find(self, url):
+        """
+        Look up the visit of a url's resource, without requiring the url to be registered
+        :return: dictionary describing the visit, or None
+        """
+
+        return self.targets.get(self.canonical(url))
+
+    def restore(self, url, response_code, error_text, ids=None, content_hash=None, duplicate_of=None):
+        """
+        Mark the visit of a url as finished without touching the history,
+        used when resuming a crawl whose history already has the results
+        :return: None
+        """
+
+        target = self.get(url)
+        target["done"] = True
+        target["response_code"] = response_code
+        target["error_text"] = error_text
+        target["ids"] = ids
+        target["content_hash"] = content_hash
+        target["duplicate_of"] = duplicate_of
+
+    def attach(self, history, url):
+        """
+        Fill in the history for a url whose resource is visited through another url.
+        If that visit is not finished yet, the url is filled in when finish() is called.
+        :return: None
+        """
+
+        target = self.get(url)
+        if target["done"] is True:
+            self._resolve(history, url, target)
+        else:
+            target["dependents"].append(url)
+
+    def finish(self, history, url, ids=None, content_hash=None, duplicate_of=None):
+        """
+        Record the result of visiting a url for every url that points to the same resource.
+        ids is the set of element ids on the page, or None if the page wasn't parsed.
+        The content_hash and ids of the page, and the page it is a duplicate_of, go on the urls without a fragment,
+        so they don't depend on which url of the resource was visited.
+        :return: list of the urls whose history was updated
+        """
+
+        target = self.get(url)
+        target["done"] = True
+        target["response_code"] = history[url]["response_code"]
+        target["error_text"] = history[url]["error_text"]
+        target["ids"] = ids
+        target["content_hash"] = content_hash
+        target["duplicate_of"] = duplicate_of
+
+        resolved = [url] + target["dependents"]
+        for u in resolved:
+            self._resolve(history, u, target)
+        target["dependents"] = list()
+
+        return resolved
+
+    def _resolve(self, history, url, target):
+
+        if url != target["url"]:
+            history[url]["response_code"] = target["response_code"]
+            history[url]["error_text"] = target["error_text"]
+
+        # check links to fragments against the ids on the page we visited
+        fragment = urldefrag(url).fragment
+        if fragment == '':
+            if target["content_hash"] is not None:
+                history[url]["content_hash"] = target["content_hash"]
+            if target["duplicate_of"] is not None:
+                history[url]["duplicate_of"] = target["duplicate_of"]
+            if target["ids"] is not None:
+                history[url]["ids"] = target["ids"]
+        if fragment == '' or target["ids"] is None or target["error_text"] is not None:
+            return
+
+        if fragment not in target["ids"]:
+            logger.debug(f"URL fragment does not exist: {url}")
+            history[url]["error_text"] = f"Element with id '{fragment}' not found in HTML DOM"
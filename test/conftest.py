@@ -0,0 +1,155 @@
+import collections
+import http.server
+import threading
+import time
+
+import pytest
+
+ROBOTS_TXT = "User-agent: *\nAllow: /\n"
+
+
+class LocalSite:
+    """
+    Local HTTP server for the tests.
+    pages maps the path of a request, with its query string, to the html of a page,
+    to a tuple of (status code, headers, body) or to a callable that is given the request method and returns one.
+    Paths that are not in pages answer 404, /robots.txt allows everything unless it is in pages.
+    The requests for every path, their methods and the time.monotonic() values they were made at are recorded,
+    along with the headers of the last request for every path.
+    """
+
+    def __init__(self):
+
+        self.pages = dict()
+        self.requests = collections.Counter()
+        self.methods = collections.Counter()
+        self.last_headers = dict()
+        self.request_times = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(body=False)
+
+            def do_GET(self):
+                self.respond(body=True)
+
+            def respond(self, body):
+                status, headers, content = site.handle(self.command, self.path, dict(self.headers))
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                if body is True:
+                    self.wfile.write(content)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path="/"):
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def handle(self, method, path, headers=None):
+        """
+        Answer a request
+        :return: tuple with the status code, headers and body
+        """
+
+        with self.lock:
+            self.requests[path] += 1
+            self.methods[method, path] += 1
+            self.last_headers[path] = headers or dict()
+            self.request_times[path].append(time.monotonic())
+
+        page = self.pages.get(path)
+        if page is None and path == "/robots.txt":
+            page = (200, {"Content-Type": "text/plain"}, ROBOTS_TXT)
+        if callable(page):
+            page = page(method)
+        if page is None:
+            page = (404, {"Content-Type": "text/plain"}, "not found")
+        if isinstance(page, str):
+            page = (200, {"Content-Type": "text/html; charset=utf-8"}, page)
+
+        status, headers, content = page
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return status, headers, content
+
+    def add_linked_pages(self, count=20):
+        """
+        Add count pages that link to each other, to sections of each other, to a page that doesn't exist
+        and to a pdf, starting from /index.html
+        :return: None
+        """
+
+        self.pages["/doc.pdf"] = (200, {"Content-Type": "application/pdf"}, b"%PDF-1.4")
+        for i in range(count):
+            links = [f"/page{(i * 7 + j) % count}.html" for j in range(1, 4)]
+            links += [f"/page{(i + 1) % count}.html#sec1", f"#sec{i % 3}", "#missing", "/doc.pdf"]
+            if i % 5 == 0:
+                links.append(f"/gone{i}.html")
+            anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+            sections = "".join(f'<h2 id="sec{s}">section {s}</h2>' for s in range(3))
+            page = f"<html><body>{anchors}{sections}</body></html>"
+            self.pages[f"/page{i}.html"] = page
+            if i == 0:
+                self.pages["/index.html"] = page
+
+    def add_restricted_pages(self):
+        """
+        Add /index.html with links the bot must not visit: pages excluded by robots.txt,
+        pages matching an exclude pattern and pages on a host that is down
+        :return: None
+        """
+
+        self.pages["/robots.txt"] = (200, {"Content-Type": "text/plain"}, "User-agent: *\nDisallow: /private/\n")
+        links = [
+            "/public.html", "/private/a.html", "/private/b.html", "/old/a.xyz",
+            "http://127.0.0.1:1/down.html", "http://127.0.0.1:1/down2.html"
+        ]
+        anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+        self.pages["/index.html"] = f"<html><body>{anchors}</body></html>"
+        self.pages["/public.html"] = "<html><body><p>public</p></body></html>"
+        self.pages["/private/a.html"] = "<html><body><p>private</p></body></html>"
+        self.pages["/private/b.html"] = "<html><body><p>private</p></body></html>"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def site():
+    local_site = LocalSite().start()
+    yield local_site
+    local_site.stop()
+
+
+def canonical(history):
+    """
+    The records of a history with their visited_from lists sorted,
+    the order links are found in depends on which worker finishes first
+    :return: dictionary
+    """
+
+    records = dict()
+    for url, record in history.items():
+        record = dict(record)
+        record["visited_from"] = sorted(record["visited_from"], key=str)
+        records[url] = record
+    return records
@@ -0,0 +1,179 @@
+import time
+
+from checkrs_linkto.bot import bot
+from checkrs_linkto.cache import DuplicatePages
+from checkrs_linkto.history import PreviousHistory, write_history
+
+from conftest import canonical
+
+
+def test_concurrent_crawl_matches_serial_crawl(site):
+    site.add_linked_pages(30)
+
+    serial = bot(site.url("/index.html"), crawl_delay=0, workers=1)
+    concurrent = bot(site.url("/index.html"), crawl_delay=0, workers=4)
+
+    assert len(serial) > 30
+    assert canonical(concurrent) == canonical(serial)
+
+
+def test_concurrent_crawl_records_errors(site):
+    site.add_linked_pages(10)
+
+    history = dict(bot(site.url("/index.html"), crawl_delay=0, workers=4).items())
+
+    assert history[site.url("/page1.html")]["response_code"] == 200
+    assert history[site.url("/gone0.html")]["response_code"] == 404
+    assert history[site.url("/doc.pdf")]["response_code"] == 200
+    assert history[site.url("/page1.html#sec1")]["error_text"] is None
+    assert history[site.url("/page1.html#missing")]["error_text"] == "Element with id 'missing' not found in HTML DOM"
+
+
+def test_get_fetch_mode_makes_one_request_per_url(site):
+    site.add_linked_pages(10)
+
+    head = bot(site.url("/index.html"), crawl_delay=0)
+    site.methods.clear()
+    get = bot(site.url("/index.html"), crawl_delay=0, fetch_mode="get")
+
+    assert canonical(get) == canonical(head)
+    assert not any(method == "HEAD" for method, path in site.methods)
+    assert site.methods["GET", "/page1.html"] == 1
+    assert site.methods["GET", "/doc.pdf"] == 1
+    assert site.methods["GET", "/gone0.html"] == 1
+
+
+def test_head_fetch_mode_falls_back_to_get(site):
+    page = '<html><body><a href="/other.html">other</a></body></html>'
+
+    def no_head(method):
+        if method == "HEAD":
+            return 405, {"Content-Type": "text/plain"}, ""
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, page
+
+    site.pages["/index.html"] = no_head
+    site.pages["/other.html"] = "<html><body><p>other</p></body></html>"
+
+    history = bot(site.url("/index.html"), crawl_delay=0)
+
+    assert history[site.url("/index.html")]["response_code"] == 200
+    assert history[site.url("/other.html")]["response_code"] == 200
+    assert site.methods["HEAD", "/index.html"] == 1
+    assert site.methods["GET", "/index.html"] == 1
+
+
+def test_incremental_crawl_checks_links_again(site, tmp_path):
+    site.pages["/index.html"] = '<html><body><a href="/file.pdf">file</a></body></html>'
+    site.pages["/file.pdf"] = (200, {"Content-Type": "application/pdf"}, b"%PDF-1.4")
+
+    previous_fn = str(tmp_path / "previous.json")
+    write_history(previous_fn, site.url("/index.html"), bot(site.url("/index.html"), crawl_delay=0))
+
+    # the link broke since the previous run
+    del site.pages["/file.pdf"]
+    history = bot(site.url("/index.html"), crawl_delay=0, previous=PreviousHistory.load(previous_fn))
+
+    assert history[site.url("/file.pdf")]["response_code"] == 404
+
+
+def test_incremental_crawl_carries_links_of_unchanged_pages_forward(site, tmp_path, monkeypatch):
+    site.add_linked_pages(10)
+
+    previous_fn = str(tmp_path / "previous.json")
+    write_history(previous_fn, site.url("/index.html"), bot(site.url("/index.html"), crawl_delay=0))
+
+    # one page changed since the previous run
+    site.pages["/page3.html"] = '<html><body><a href="/page9.html#sec2">link</a><h2 id="new">new</h2></body></html>'
+    fresh = bot(site.url("/index.html"), crawl_delay=0)
+
+    import checkrs_linkto.extract
+
+    parsed = list()
+    parse_page = checkrs_linkto.extract.timed_parse_page
+
+    def counting_parse_page(content, encoding, page_url):
+        parsed.append(page_url)
+        return parse_page(content, encoding, page_url)
+
+    monkeypatch.setattr(checkrs_linkto.extract, "timed_parse_page", counting_parse_page)
+    history = bot(site.url("/index.html"), crawl_delay=0, previous=PreviousHistory.load(previous_fn))
+
+    assert parsed == [site.url("/page3.html")]
+    assert canonical(history) == canonical(fresh)
+    assert history[site.url("/page3.html")]["ids"] == ["new"]
+
+
+def test_crawl_skips_excluded_urls_and_down_hosts(site):
+    site.add_restricted_pages()
+
+    history = bot(
+        site.url("/index.html"), crawl_delay=0, workers=2, exclude_external_urls=False,
+        exclude_url_patterns=[r".+\.xyz$"]
+    )
+
+    assert history[site.url("/public.html")]["response_code"] == 200
+    for path in ["/private/a.html", "/private/b.html"]:
+        assert history[site.url(path)]["response_code"] == -1
+        assert history[site.url(path)]["error_text"] == "Matched robots.txt exclude rule."
+        assert site.requests[path] == 0
+    assert history[site.url("/old/a.xyz")]["response_code"] == -1
+    assert history[site.url("/old/a.xyz")]["error_text"] == "Matched URL exclude pattern '.+\\.xyz$'"
+    for url in ["http://127.0.0.1:1/down.html", "http://127.0.0.1:1/down2.html"]:
+        assert history[url]["response_code"] == 0
+        assert history[url]["error_text"] is not None
+
+
+def test_parse_pool_crawl_matches_inline_crawl(site):
+    site.add_linked_pages(30)
+    # a page in another encoding, decoded in the pool process
+    site.pages["/latin.html"] = (
+        200, {"Content-Type": "text/html; charset=iso-8859-1"},
+        '<html><body><a href="/page2.html#sec2">café</a><h2 id="né">section</h2></body></html>'.encode("latin-1")
+    )
+    site.pages["/index.html"] = site.pages["/page0.html"].replace(
+        "<body>", '<body><a href="/latin.html#né">latin</a><a href="/latin.html#missing">latin</a>'
+    )
+
+    inline = bot(site.url("/index.html"), crawl_delay=0, workers=4)
+    pooled = bot(site.url("/index.html"), crawl_delay=0, workers=4, parse_workers=2)
+
+    assert canonical(pooled) == canonical(inline)
+    assert pooled[site.url("/latin.html#né")]["error_text"] is None
+    assert pooled[site.url("/latin.html#missing")]["error_text"] == "Element with id 'missing' not found in HTML DOM"
+    assert site.url("/latin.html") in pooled[site.url("/page2.html#sec2")]["visited_from"]
+
+
+def test_copies_wait_for_the_parse_of_their_original(site):
+    # a long page, so the copies come in while the parse worker is still busy with /v1/page.html
+    paragraphs = "<p>text</p>" * 50000
+    page = f'<html><body><a href="other.html">other</a><h2 id="sec1">section</h2>{paragraphs}</body></html>'
+
+    def slow_page(method):
+        time.sleep(0.02)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, page
+
+    site.pages["/v1/page.html"] = page
+    site.pages["/v2/page.html"] = slow_page
+    site.pages["/v3/page.html"] = slow_page
+    site.pages["/index.html"] = (
+        '<html><body><a href="/v1/page.html">v1</a><a href="/v2/page.html#sec1">v2</a>'
+        '<a href="/v2/page.html#missing">v2</a><a href="/v3/page.html">v3</a></body></html>'
+    )
+
+    history = bot(
+        site.url("/index.html"), crawl_delay=0, workers=4, parse_workers=1,
+        duplicates=DuplicatePages(no_follow_patterns=["/v2/"])
+    )
+
+    assert history[site.url("/v2/page.html#sec1")]["error_text"] is None
+    assert history[site.url("/v2/page.html#missing")]["error_text"] == "Element with id 'missing' not found in HTML DOM"
+    assert site.url("/v2/other.html") not in history
+    assert history[site.url("/v3/page.html")]["duplicate_of"] == site.url("/v1/page.html")
+    assert history[site.url("/v3/other.html")]["visited_from"] == [site.url("/v3/page.html")]
+
+
+def test_timeout_adapter_is_exported():
+    from checkrs_linkto import TimeoutHTTPAdapter
+    from checkrs_linkto.adapters import TimeoutHTTPAdapter as adapter
+
+    assert TimeoutHTTPAdapter is adapter
@@ -0,0 +1,49 @@
+from checkrs_linkto.bot import bot
+from checkrs_linkto.cache import ValidatorCache
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_fn = str(tmp_path / "cache.json")
+
+    cache = ValidatorCache(cache_fn, max_entries=2)
+    for path in ["/a.html", "/b.html"]:
+        cache.store(f"https://example.com{path}", 200, f"https://example.com{path}", None, None, path, [], set())
+    cache.save()
+
+    # the next run uses /a.html and adds /c.html
+    cache = ValidatorCache(cache_fn, max_entries=2).load()
+    cache.touch("https://example.com/a.html")
+    cache.store("https://example.com/c.html", 200, "https://example.com/c.html", None, None, "c", [], set())
+    cache.save()
+
+    cache = ValidatorCache(cache_fn, max_entries=2).load()
+    assert cache.run == 3
+    assert cache.get("https://example.com/a.html") is not None
+    assert cache.get("https://example.com/b.html") is None
+    assert cache.get("https://example.com/c.html") is not None
+
+
+def test_not_modified_page_reuses_cached_links(site, tmp_path):
+    page = '<html><body><a href="/q.html">q</a><h2 id="sec">section</h2></body></html>'
+    site.pages["/index.html"] = '<html><body><a href="/p.html#sec">p</a></body></html>'
+    site.pages["/p.html"] = (200, {"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"'}, page)
+    site.pages["/q.html"] = "<html><body><p>q</p></body></html>"
+
+    def not_modified(method):
+        if site.last_headers["/p.html"].get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, ""
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, "<html><body></body></html>"
+
+    cache_fn = str(tmp_path / "cache.json")
+    cache = ValidatorCache(cache_fn)
+    bot(site.url("/index.html"), crawl_delay=0, cache=cache.load())
+    cache.save()
+
+    site.pages["/p.html"] = not_modified
+    site.methods.clear()
+    history = bot(site.url("/index.html"), crawl_delay=0, cache=ValidatorCache(cache_fn).load())
+
+    assert site.methods["GET", "/p.html"] == 0
+    assert history[site.url("/p.html#sec")]["response_code"] == 200
+    assert history[site.url("/p.html#sec")]["error_text"] is None
+    assert history[site.url("/q.html")]["visited_from"] == [site.url("/p.html")]
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import time
+
+from checkrs_linkto.bot import bot
+from checkrs_linkto.checkpoint import CrawlCheckpoint
+
+from conftest import canonical
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+CRAWL = """
+import sys
+from checkrs_linkto.bot import bot
+from checkrs_linkto.checkpoint import CrawlCheckpoint
+bot(sys.argv[1], crawl_delay=0, checkpoint=CrawlCheckpoint(sys.argv[2], interval=60))
+"""
+
+
+def test_resume_crawl_killed_before_first_interval(site, tmp_path):
+    site.add_linked_pages(10)
+    complete = bot(site.url("/index.html"), crawl_delay=0)
+
+    # the start page answers slowly so the crawl is still on it when it's killed
+    index = site.pages["/index.html"]
+
+    def slow_index(method):
+        time.sleep(30)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, index
+
+    site.pages["/index.html"] = slow_index
+    site.requests.clear()
+
+    checkpoint_fn = str(tmp_path / "history.checkpoint.jsonl")
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    crawl = subprocess.Popen([sys.executable, "-c", CRAWL, site.url("/index.html"), checkpoint_fn], env=env)
+    try:
+        deadline = time.monotonic() + 20
+        while site.requests["/index.html"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert site.requests["/index.html"] > 0
+    finally:
+        crawl.kill()
+        crawl.wait()
+
+    site.pages["/index.html"] = index
+    assert os.path.getsize(checkpoint_fn) > 0
+
+    history = bot(site.url("/index.html"), crawl_delay=0, checkpoint=CrawlCheckpoint(checkpoint_fn), resume=True)
+
+    assert canonical(history) == canonical(complete)
+
+
+def test_resume_empty_checkpoint_starts_new_crawl(site, tmp_path):
+    site.add_linked_pages(10)
+    complete = bot(site.url("/index.html"), crawl_delay=0)
+
+    checkpoint_fn = str(tmp_path / "history.checkpoint.jsonl")
+    open(checkpoint_fn, "w").close()
+
+    history = bot(site.url("/index.html"), crawl_delay=0, checkpoint=CrawlCheckpoint(checkpoint_fn), resume=True)
+
+    assert canonical(history) == canonical(complete)
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+import yaml
+
+from checkrs_linkto.cli import main
+from checkrs_linkto.history import read_history
+
+from conftest import canonical
+
+CONFIG_DEFAULT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config_default.yml")
+
+
+def write_config(tmp_path, site, **report_options):
+    """
+    Write a copy of the default configuration that crawls the local site and keeps its files in tmp_path
+    :return: name of the configuration file
+    """
+
+    with open(CONFIG_DEFAULT) as f:
+        config = yaml.safe_load(f)
+
+    config["bot"].update(url=site.url("/index.html"), history=str(tmp_path / "history_new.json"), crawl_delay=0, logfile=None)
+    config["report"].update(
+        golden_file=str(tmp_path / "history_golden.json"),
+        new_file=str(tmp_path / "history_new.json"),
+        report=str(tmp_path / "linkto_report.txt"),
+        summary=str(tmp_path / "linkto_summary.txt"),
+        logfile=None
+    )
+    config["report"].update(report_options)
+
+    config_fn = str(tmp_path / "config.yml")
+    with open(config_fn, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_fn
+
+
+def test_check_reads_golden_file_from_config(site, tmp_path):
+    site.add_linked_pages(5)
+    config_fn = write_config(tmp_path, site)
+
+    assert main(["bot", "--config", config_fn, "--history", str(tmp_path / "history_golden.json")]) == 0
+    assert main(["check", "--config", config_fn]) == 1
+    assert os.path.isfile(tmp_path / "history_new.json")
+    assert "gone0.html" in (tmp_path / "linkto_report.txt").read_text()
+
+
+def test_report_reads_history_files_from_config(site, tmp_path):
+    site.add_linked_pages(5)
+    config_fn = write_config(tmp_path, site)
+
+    main(["bot", "--config", config_fn])
+    main(["bot", "--config", config_fn, "--history", str(tmp_path / "history_golden.json")])
+
+    assert main(["report", "--config", config_fn]) == 1
+
+
+def test_ndjson_history_matches_json_history(site, tmp_path):
+    site.add_linked_pages(5)
+    config_fn = write_config(tmp_path, site)
+
+    main(["bot", "--config", config_fn, "--history", str(tmp_path / "history_golden.json")])
+    main(["bot", "--config", config_fn, "--history-format", "ndjson"])
+
+    start_url, history = read_history(str(tmp_path / "history_new.json"))
+    assert start_url == site.url("/index.html")
+    assert canonical(history) == canonical(read_history(str(tmp_path / "history_golden.json"))[1])
+
+    # the gone pages are the only errors, there are no differences between the files
+    assert main(["report", "--config", config_fn]) == 1
+    report = (tmp_path / "linkto_report.txt").read_text()
+    assert "gone0.html" in report
+    assert "were not visited" not in report and "links that are not in" not in report
+
+
+@pytest.mark.parametrize("command", ["check", "report"])
+def test_missing_golden_file_is_a_usage_error(site, tmp_path, command, capsys):
+    config_fn = write_config(tmp_path, site, golden_file=None)
+
+    with pytest.raises(SystemExit) as exit_info:
+        main([command, "--config", config_fn])
+
+    assert exit_info.value.code == 2
+    assert "golden history file is required" in capsys.readouterr().err
@@ -0,0 +1,38 @@
+from checkrs_linkto.extract import decode_html, extract_links, parse_page
+
+
+def test_links_and_ids_are_collected_in_one_pass():
+    html = (
+        '<html><body><h1 id="top">title</h1>'
+        '<a href=" /a.html ">a</a><a name="no-href">anchor</a><a href="mailto:someone@example.com">mail</a>'
+        '<div id="sec1"><p><a href="#sec1" id="self">self</a></p></div>'
+        '<A HREF="/b.html">b</A></body></html>'
+    )
+
+    hrefs, ids = extract_links(html)
+
+    assert hrefs == ["/a.html", "#sec1", "/b.html"]
+    assert ids == {"top", "sec1", "self"}
+
+
+def test_empty_and_broken_documents():
+    assert extract_links("") == ([], set())
+    assert extract_links("  \n") == ([], set())
+
+    hrefs, ids = extract_links('<html><body><div id="open"><a href="/a.html">a<p><a href="/b.html"')
+    assert hrefs[0] == "/a.html"
+    assert "open" in ids
+
+
+def test_parse_page_decodes_and_resolves_links():
+    content = '<html><body><a href="../café.html">café</a><a href="#x">x</a></body></html>'.encode("latin-1")
+
+    hrefs, ids, full_hrefs = parse_page(content, "latin-1", "https://example.com/docs/page.html")
+
+    assert hrefs == ["../café.html", "#x"]
+    assert ids == set()
+    assert full_hrefs == ["https://example.com/café.html", "https://example.com/docs/page.html#x"]
+
+
+def test_decode_html_with_unknown_encoding():
+    assert decode_html(b"<p>text</p>", "no-such-encoding") == "<p>text</p>"
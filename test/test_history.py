@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from checkrs_linkto.history import HistoryStore, HistoryWriter, iter_history_with_header, read_history, write_history
+from checkrs_linkto.report import LinkToReport
+
+
+def test_visited_from_follows_new_edges():
+    history = HistoryStore()
+    history.add("https://example.com/", visited_from=[None])
+    history.add("https://example.com/a", visited_from=["https://example.com/"], depth=1)
+
+    assert history["https://example.com/a"]["visited_from"] == ["https://example.com/"]
+
+    history.add("https://example.com/b", response_code=200, visited_from=["https://example.com/a"], depth=2)
+    history.add_edge("https://example.com/a", "https://example.com/b")
+
+    assert history["https://example.com/"]["visited_from"] == [None]
+    assert history["https://example.com/a"]["visited_from"] == ["https://example.com/", "https://example.com/b"]
+    assert history["https://example.com/b"]["visited_from"] == ["https://example.com/a"]
+
+    # a record without links, added after the edges were grouped
+    history.add("https://example.com/c")
+    assert history["https://example.com/c"]["visited_from"] == []
+    assert dict(history.items())["https://example.com/a"]["visited_from"] == history["https://example.com/a"]["visited_from"]
+
+    # the list is rebuilt on every read, changing it would be lost
+    with pytest.raises(TypeError):
+        history["https://example.com/a"]["visited_from"].append("https://example.com/c")
+    assert history["https://example.com/a"]["visited_from"] == ["https://example.com/", "https://example.com/b"]
+    assert list(history.links_from("https://example.com/")) == ["https://example.com/a"]
+    assert list(history.links_from("https://example.com/a")) == ["https://example.com/b"]
+
+
+def test_links_from_follows_every_run_of_a_source():
+    history = HistoryStore()
+    history.add("https://example.com/", visited_from=[None])
+    history.add("https://example.com/a", depth=1)
+    history.add("https://example.com/b", depth=1)
+    history.add_edges(["https://example.com/a", "https://example.com/b"], "https://example.com/")
+    history.add_edge("https://example.com/", "https://example.com/a")
+    history.add_edge("https://example.com/a", "https://example.com/")
+
+    assert list(history.links_from("https://example.com/")) == [
+        "https://example.com/a", "https://example.com/b", "https://example.com/a"
+    ]
+    assert list(history.links_from("https://example.com/a")) == ["https://example.com/"]
+    assert list(history.links_from("https://example.com/b")) == []
+    assert history["https://example.com/a"]["visited_from"] == ["https://example.com/", "https://example.com/"]
+
+
+def small_history():
+    history = HistoryStore()
+    history.add("https://example.com/", response_code=200, visited_from=[None], content_hash="abc", ids=["top"])
+    history.add("https://example.com/a", response_code=404, visited_from=["https://example.com/"], depth=1)
+    history.add("https://example.com/#top", response_code=200, visited_from=["https://example.com/"], depth=0)
+    return history
+
+
+def test_ndjson_round_trip(tmp_path):
+    history = small_history()
+    for history_format in ["json", "ndjson"]:
+        filename = str(tmp_path / f"history.{history_format}")
+        write_history(filename, "https://example.com/", history, history_format)
+
+        assert read_history(filename) == ("https://example.com/", dict(history.items()))
+
+
+def test_ndjson_header(tmp_path):
+    filename = str(tmp_path / "history.ndjson")
+    write_history(filename, "https://example.com/", small_history(), "ndjson", crawl_started=1700000000.5)
+
+    with open(filename) as f:
+        assert json.loads(f.readline()) == {"start_url": "https://example.com/", "crawl_started": 1700000000.5}
+
+    header, records = iter_history_with_header(filename)
+    assert header == {"start_url": "https://example.com/", "crawl_started": 1700000000.5}
+    assert [url for url, record in records] == ["https://example.com/", "https://example.com/a", "https://example.com/#top"]
+
+
+def test_history_writer_appends_records_as_they_finish(tmp_path):
+    filename = str(tmp_path / "history.ndjson")
+    writer = HistoryWriter(filename, "https://example.com/", interval=0)
+
+    history = HistoryStore()
+    history.add("https://example.com/", visited_from=[None])
+    history.add("https://example.com/a", visited_from=["https://example.com/"], depth=1)
+    history["https://example.com/"]["response_code"] = 200
+    writer.touch(["https://example.com/", "https://example.com/a"])
+    writer.write(history)
+
+    # only the finished record is on disk, the other one waits for its response_code
+    with open(filename) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["url"] for line in lines[1:]] == ["https://example.com/"]
+
+    # links found to a url that was already written are appended as a continuation line
+    history["https://example.com/a"]["response_code"] = 200
+    history.add("https://example.com/b", response_code=200, visited_from=["https://example.com/a"], depth=2)
+    history.add_edge("https://example.com/", "https://example.com/a")
+    writer.touch(["https://example.com/a"])
+    writer.write(history)
+
+    # urls nobody finished are written when the writer is closed
+    writer.close(history)
+
+    with open(filename) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[3] == dict(
+        url="https://example.com/", continued=True, response_code=200, error_text=None, depth=0,
+        visited_from=["https://example.com/a"]
+    )
+    assert lines[4]["url"] == "https://example.com/b"
+
+    assert read_history(filename) == ("https://example.com/", dict(history.items()))
+
+    # the report reads the file again for every stage
+    lcr = LinkToReport(filename, filename)
+    lcr.report_status_errors().report_url_visit_differences().report_link_differences()
+    assert lcr.counts == dict(
+        status_errors=0, url_visit_differences_old=0, url_visit_differences_new=0,
+        link_differences_not_in_old=0, link_differences_not_in_new=0
+    )
@@ -0,0 +1,88 @@
+import time
+
+from checkrs_linkto.hosts import HostHealth
+
+
+def fail(hosts, url, netloc="down.example.com"):
+    hosts.record(netloc, url, 0, "Connection refused", 0.1)
+
+
+def test_host_is_skipped_after_failures_of_different_urls():
+    hosts = HostHealth(3)
+
+    fail(hosts, "https://down.example.com/a")
+    fail(hosts, "https://down.example.com/b")
+    assert not hosts.is_down("down.example.com")
+
+    fail(hosts, "https://down.example.com/c")
+    assert hosts.is_down("down.example.com")
+    assert hosts.message("down.example.com").startswith("Skipped, host down.example.com failed for 3 urls")
+
+
+def test_retries_of_one_url_count_once():
+    hosts = HostHealth(3)
+
+    for _ in range(5):
+        fail(hosts, "https://down.example.com/a")
+
+    assert not hosts.is_down("down.example.com")
+
+
+def test_good_request_resets_the_failures():
+    hosts = HostHealth(3)
+
+    fail(hosts, "https://down.example.com/a")
+    fail(hosts, "https://down.example.com/b")
+    hosts.record("down.example.com", "https://down.example.com/ok", 200, None, 0.1)
+    fail(hosts, "https://down.example.com/c")
+
+    assert not hosts.is_down("down.example.com")
+
+
+def test_failures_older_than_the_window_are_forgotten():
+    hosts = HostHealth(2, window=0.2)
+
+    fail(hosts, "https://down.example.com/a")
+    time.sleep(0.3)
+    fail(hosts, "https://down.example.com/b")
+
+    assert not hosts.is_down("down.example.com")
+
+
+def test_host_is_tried_again_after_the_window():
+    hosts = HostHealth(2, window=0.2)
+
+    fail(hosts, "https://down.example.com/a")
+    fail(hosts, "https://down.example.com/b")
+    assert hosts.is_down("down.example.com")
+
+    time.sleep(0.3)
+    assert not hosts.is_down("down.example.com")
+
+    # it takes as many new failures to give up on it again
+    fail(hosts, "https://down.example.com/c")
+    assert not hosts.is_down("down.example.com")
+    fail(hosts, "https://down.example.com/d")
+    assert hosts.is_down("down.example.com")
+
+
+def test_slow_host_is_skipped():
+    hosts = HostHealth(2, slow_request_seconds=1)
+
+    hosts.record("slow.example.com", "https://slow.example.com/a", 200, None, 2)
+    hosts.record("slow.example.com", "https://slow.example.com/b", 200, None, 2)
+
+    assert hosts.is_down("slow.example.com")
+    assert "took more than 1 seconds" in hosts.message("slow.example.com")
+
+
+def test_exempt_and_disabled_hosts_are_never_skipped():
+    exempt = HostHealth(1, exempt=["start.example.com"])
+    fail(exempt, "https://start.example.com/a", "start.example.com")
+    assert not exempt.is_down("start.example.com")
+
+    disabled = HostHealth()
+    fail(disabled, "https://down.example.com/a")
+    fail(disabled, "https://down.example.com/b")
+    fail(disabled, "https://down.example.com/c")
+    assert not disabled.is_down("down.example.com")
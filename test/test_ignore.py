@@ -0,0 +1,35 @@
+from checkrs_linkto.ignore import FirstMatch, IgnoreRules
+
+
+def test_first_matching_pattern_wins():
+    matcher = FirstMatch([r"timed? ?out", r"SSL", r"out"])
+
+    assert matcher.search("Read timed out") == 0
+    assert matcher.search("SSL: CERTIFICATE_VERIFY_FAILED, connection out") == 1
+    assert matcher.search("Connection refused") is None
+
+
+def test_patterns_that_cant_be_combined_are_checked_one_at_a_time():
+    matcher = FirstMatch([r"(?i)ssl", r"(a)\1", r"(?P<x>b)", r"(?P<x>c)"])
+
+    assert matcher.combined is None
+    assert matcher.search("SSL error") == 0
+    assert matcher.search("aa") == 1
+    assert matcher.search("c") == 3
+
+
+def test_status_error_rules_match_site_and_status_code():
+    rules = IgnoreRules(status_error_patterns=[
+        {r"example\.com/private/": [401, 403], r"example\.com/": [404]},
+        {r"cdn\.example\.net": [503]},
+    ])
+
+    assert rules.status_error("https://example.com/private/a", 403) == r"example\.com/private/"
+    # the first site pattern that matches the url decides
+    assert rules.status_error("https://example.com/private/a", 404) is None
+    assert rules.status_error("https://example.com/a", 404) == r"example\.com/"
+    assert rules.status_error("https://example.com/a", 500) is None
+
+    assert rules.unused() == [
+        r"ignored_status_error_patterns: 'cdn\.example\.net': [503]",
+    ]
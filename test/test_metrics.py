@@ -0,0 +1,77 @@
+import io
+import json
+import time
+
+from checkrs_linkto.bot import bot
+from checkrs_linkto.history import write_history
+from checkrs_linkto.metrics import CrawlMetrics, read_slowest_pages
+from checkrs_linkto.report import LinkToReport
+from checkrs_linkto.sinks import JsonLinesReportSink
+
+
+def timings(connect, ttfb, download, parse=None, size=100):
+    return dict(connect=connect, ttfb=ttfb, download=download, parse=parse, bytes=size)
+
+
+def test_phase_timings_and_slowest_pages():
+    metrics = CrawlMetrics(slowest_pages=2)
+    metrics.visited("https://example.com/a", 200, timings(0.001, 0.02, 0.003, 0.004))
+    metrics.visited("https://example.com/b", 404, timings(0.0, 0.5, 0.0))
+    metrics.visited("https://example.com/c", 200, timings(0.0, 0.2, 0.1, 0.3))
+    metrics.visited("https://example.com/d", 0, None)
+
+    m = metrics.finish().to_dict()
+
+    assert m["counters"]["urls_visited"] == 4
+    assert m["counters"]["status_errors"] == 1
+    assert m["counters"]["connection_errors"] == 1
+    assert m["counters"]["bytes_downloaded"] == 300
+    assert m["error_rate"] == 0.5
+    assert m["phases"]["ttfb"]["count"] == 3
+    assert m["phases"]["parse"]["count"] == 2
+    assert m["phases"]["ttfb"]["buckets"]["0.025"] == 1
+    assert m["phases"]["ttfb"]["buckets"]["0.5"] == 3
+    assert abs(m["phases"]["total"]["max"] - 0.6) < 1e-9
+    assert [page["url"] for page in m["slowest_pages"]] == ["https://example.com/c", "https://example.com/b"]
+    assert m["slowest_pages"][0]["parse"] == 0.3
+
+
+def test_crawl_times_slow_pages_and_the_report_lists_them(site, tmp_path):
+    def slow_page(method):
+        time.sleep(0.2)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, "<html><body><p>slow</p></body></html>"
+
+    site.add_linked_pages(5)
+    site.pages["/page2.html"] = slow_page
+
+    metrics = CrawlMetrics(slowest_pages=3)
+    history = bot(site.url("/index.html"), crawl_delay=0, metrics=metrics)
+    metrics_fn = str(tmp_path / "metrics.json")
+    metrics.finish().write(metrics_fn)
+
+    slowest = read_slowest_pages(metrics_fn)
+    assert len(slowest) == 3
+    assert slowest[0]["url"] == site.url("/page2.html")
+    # the HEAD and the GET request each wait for the page
+    assert slowest[0]["ttfb"] >= 0.4
+    assert slowest[0]["parse"] is not None
+    assert slowest[0]["total"] >= slowest[1]["total"] >= slowest[2]["total"]
+
+    m = metrics.to_dict()
+    assert m["counters"]["urls_visited"] == len({url.split("#")[0] for url in history.keys()})
+    assert m["phases"]["parse"]["count"] == 5
+
+    prometheus_fn = str(tmp_path / "metrics.prom")
+    metrics.write(prometheus_fn, "prometheus")
+    with open(prometheus_fn) as f:
+        prometheus = f.read()
+    assert f'linkto_phase_seconds_count{{phase="total"}} {m["phases"]["total"]["count"]}\n' in prometheus
+
+    golden_fn = str(tmp_path / "history_golden.json")
+    write_history(golden_fn, site.url("/index.html"), history)
+    f = io.StringIO()
+    LinkToReport(golden_fn, golden_fn, sinks=[JsonLinesReportSink(f)]).report_slowest_pages(metrics_fn, 1).close()
+    lines = [json.loads(line) for line in f.getvalue().splitlines()]
+    assert lines[0]["section"] == "slowest_pages"
+    assert lines[0]["url"] == site.url("/page2.html")
+    assert len(lines) == 2
@@ -0,0 +1,153 @@
+import io
+import json
+
+from xml.etree import ElementTree
+
+from checkrs_linkto.history import write_history
+from checkrs_linkto.report import LinkToReport, list_diff
+from checkrs_linkto.sinks import JsonLinesReportSink, JUnitReportSink, TextReportSink
+
+GOLDEN_START_URL = "https://old.example.com/"
+NEW_START_URL = "https://new.example.com/"
+
+
+def record(visited_from, response_code=200, error_text=None):
+    return dict(response_code=response_code, error_text=error_text, visited_from=visited_from)
+
+
+def golden_file(tmp_path, history):
+    """
+    Write a golden history of old.example.com, with urls given by their path
+    :return: name of the history file
+    """
+
+    fn = str(tmp_path / "history_golden.json")
+    history = {
+        GOLDEN_START_URL.rstrip("/") + url: record([v and GOLDEN_START_URL.rstrip("/") + v for v in visited_from])
+        for url, visited_from in history.items()
+    }
+    write_history(fn, GOLDEN_START_URL, history)
+    return fn
+
+
+def new_history(history):
+    """
+    A new history of new.example.com, with urls given by their path
+    :return: history dictionary
+    """
+
+    return {
+        NEW_START_URL.rstrip("/") + url: record([v and NEW_START_URL.rstrip("/") + v for v in visited_from], *result)
+        for url, (visited_from, *result) in history.items()
+    }
+
+
+def json_lines(f):
+    return [json.loads(line) for line in f.getvalue().splitlines()]
+
+
+def test_list_diff_is_a_multiset_difference():
+    assert list_diff(["a", "b", "a", "c", "a"], ["a", "c", "d"]) == ["b", "a", "a"]
+    assert list_diff([], ["a"]) == []
+
+
+def test_link_differences_compare_links_as_multisets(tmp_path):
+    golden = golden_file(tmp_path, {
+        "/": [None],
+        "/a": ["/", "/", "/b"],
+        "/b": ["/"],
+        "/gone": ["/"],
+    })
+    new = new_history({
+        "/": ([None],),
+        "/a": (["/b", "/", "/c"],),
+        "/b": (["/"],),
+        "/c": (["/"],),
+    })
+
+    f = io.StringIO()
+    lcr = LinkToReport(golden, new, sinks=[JsonLinesReportSink(f)], new_start_url=NEW_START_URL)
+    lcr.report_link_differences().close()
+
+    assert json_lines(f) == [
+        dict(section="link_differences", page=GOLDEN_START_URL + "a", links_not_in_new=["/"], links_not_in_golden=["/c"]),
+        dict(section="summary", counts=dict(link_differences_not_in_old=1, link_differences_not_in_new=1)),
+    ]
+    assert lcr.error_flag is True
+
+
+def test_same_links_in_another_order_are_no_difference(tmp_path):
+    golden = golden_file(tmp_path, {"/": [None], "/a": ["/", "/b", "/"], "/b": ["/"]})
+    new = new_history({"/": ([None],), "/a": (["/b", "/", "/"],), "/b": (["/"],)})
+
+    lcr = LinkToReport(golden, new, new_start_url=NEW_START_URL).report_link_differences()
+
+    assert lcr.counts == dict(link_differences_not_in_old=0, link_differences_not_in_new=0)
+    assert lcr.error_flag is False
+
+
+def test_sinks_receive_the_same_records(tmp_path):
+    golden = golden_file(tmp_path, {"/": [None], "/a": ["/"], "/old": ["/"]})
+    new = new_history({
+        "/": ([None],),
+        "/a": (["/"], 404),
+        "/down": (["/"], 0, "Connection refused"),
+    })
+
+    text, jsonl, junit = io.StringIO(), io.StringIO(), io.StringIO()
+    lcr = LinkToReport(
+        golden, new, sinks=[TextReportSink(text), JsonLinesReportSink(jsonl), JUnitReportSink(junit)],
+        new_start_url=NEW_START_URL
+    )
+    lcr.report_connection_errors().report_status_errors().report_url_visit_differences().close()
+
+    assert text.getvalue() == (
+        "CONNECTION ERRORS:\n\n"
+        f"\turl: {NEW_START_URL}down\n\terror: Connection refused\n\tlinked to from: {NEW_START_URL}\n\n\n\n"
+        "STATUS ERRORS:\n\n"
+        f"\turl: {NEW_START_URL}a\n\tstatus_code: 404\n\tlinked to from: {NEW_START_URL}\n\n\n\n"
+        "URL VISIT DIFFERENCES:\n\n"
+        "These are url's in the golden file that were not visited:\n0: /old\n\n"
+        "These are new url's that were visited:\n0: /down\n\n"
+    )
+
+    lines = json_lines(jsonl)
+    assert [line["section"] for line in lines] == [
+        "connection_errors", "status_errors", "url_visit_differences", "url_visit_differences", "summary"
+    ]
+    assert lines[-1]["counts"] == lcr.counts
+
+    suites = ElementTree.fromstring(junit.getvalue())
+    assert [suite.get("name") for suite in suites] == ["connection_errors", "status_errors", "url_visit_differences"]
+    assert len(suites.findall("./testsuite/testcase/failure")) == 4
+    assert suites.find("./testsuite/testcase/failure").get("message") == "Connection refused"
+
+
+def test_report_without_sinks_collects_the_text_report(tmp_path):
+    golden = golden_file(tmp_path, {"/": [None]})
+    new = new_history({"/": ([None],)})
+
+    lcr = LinkToReport(golden, new, new_start_url=NEW_START_URL).report_status_errors().close()
+
+    assert lcr.report == "STATUS ERRORS:\n\n\n\n"
+    assert lcr.error_flag is False
+
+
+def test_unused_ignore_rules_are_reported(tmp_path):
+    golden = golden_file(tmp_path, {"/": [None]})
+    new = new_history({
+        "/": ([None],),
+        "/a": (["/"], 404),
+        "/down": (["/"], 0, "SSL: CERTIFICATE_VERIFY_FAILED"),
+    })
+
+    lcr = LinkToReport(golden, new, new_start_url=NEW_START_URL)
+    lcr.report_connection_errors(["CERTIFICATE_VERIFY_FAILED", "Connection refused"])
+    lcr.report_status_errors([{r"new\.example\.com/a": [404], r"new\.example\.com/b": [410]}])
+
+    assert lcr.counts == dict(connection_errors=0, status_errors=0)
+    assert lcr.error_flag is False
+    assert lcr.unused_ignore_rules() == [
+        "ignored_connection_error_patterns: 'Connection refused'",
+        r"ignored_status_error_patterns: 'new\.example\.com/b': [410]",
+    ]
@@ -0,0 +1,61 @@
+from checkrs_linkto.bot import bot
+from checkrs_linkto.scheduler import RetryPolicy
+
+PDF = (200, {"Content-Type": "application/pdf"}, b"%PDF-1.4")
+
+
+def link_page(paths):
+    anchors = "".join(f'<a href="{path}">link</a>' for path in paths)
+    return f"<html><body>{anchors}</body></html>"
+
+
+def test_retry_after_busy_response(site):
+    site.pages["/index.html"] = link_page(["/busy.pdf"])
+    responses = [(503, {"Retry-After": "1"}, "busy")]
+    site.pages["/busy.pdf"] = lambda method: responses.pop() if responses else PDF
+
+    retries = RetryPolicy()
+    history = bot(site.url("/index.html"), crawl_delay=0, retries=retries)
+
+    assert history[site.url("/busy.pdf")]["response_code"] == 200
+    assert site.requests["/busy.pdf"] == 2
+    assert retries.retries[site.url("/busy.pdf")] == 1
+    first, second = site.request_times["/busy.pdf"]
+    assert second - first >= 1
+
+
+def test_retries_run_out(site):
+    site.pages["/index.html"] = link_page(["/limited.pdf"])
+    site.pages["/limited.pdf"] = (429, {"Retry-After": "0"}, "too many requests")
+
+    history = bot(site.url("/index.html"), crawl_delay=0, retries=RetryPolicy(max_retries=2))
+
+    assert history[site.url("/limited.pdf")]["response_code"] == 429
+    assert site.requests["/limited.pdf"] == 3
+
+
+def test_host_retry_budget_runs_out(site):
+    paths = [f"/down{i}.pdf" for i in range(5)]
+    site.pages["/index.html"] = link_page(paths)
+    for path in paths:
+        site.pages[path] = (503, {}, "unavailable")
+
+    retries = RetryPolicy(max_retries=3, backoff_factor=0, host_retry_budget=4)
+    history = bot(site.url("/index.html"), crawl_delay=0, retries=retries)
+
+    for path in paths:
+        assert history[site.url(path)]["response_code"] == 503
+    # every url is visited once, only 4 of them are visited again
+    assert sum(site.requests[path] for path in paths) == 5 + 4
+    assert sum(retries.retries.values()) == 4
+
+
+def test_urls_are_not_retried_when_robots_txt_failed(site):
+    site.pages["/index.html"] = link_page(["http://127.0.0.1:1/a.html", "http://127.0.0.1:1/b.html"])
+
+    retries = RetryPolicy(backoff_factor=0)
+    history = bot(site.url("/index.html"), crawl_delay=0, exclude_external_urls=False, retries=retries)
+
+    assert history["http://127.0.0.1:1/a.html"]["response_code"] == 0
+    assert history["http://127.0.0.1:1/b.html"]["response_code"] == 0
+    assert retries.retries == dict()
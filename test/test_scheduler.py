@@ -0,0 +1,94 @@
+import time
+
+from checkrs_linkto.bot import bot, lower_depth
+from checkrs_linkto.history import HistoryStore
+from checkrs_linkto.scheduler import CrawlBudget, HostScheduler
+from checkrs_linkto.urls import VisitTargets
+
+
+def pop_all(scheduler):
+    urls = list()
+    while True:
+        url = scheduler.pop_ready()
+        if url is None:
+            return urls
+        urls.append(url)
+
+
+def test_shortest_depth_first_oldest_first():
+    scheduler = HostScheduler(crawl_delay=0)
+    scheduler.append("https://example.com/deep", depth=3)
+    scheduler.append("https://example.com/a", depth=1)
+    scheduler.append("https://other.example.com/b", depth=1)
+    scheduler.append("https://example.com/sitemap-only", depth=None)
+    scheduler.append("https://example.com/", depth=0)
+    scheduler.append("https://example.com/moved-up", depth=2)
+    scheduler.update_depth("https://example.com/moved-up", 1)
+    # a longer path doesn't move a url back
+    scheduler.update_depth("https://example.com/a", 2)
+
+    assert pop_all(scheduler) == [
+        "https://example.com/",
+        "https://example.com/a",
+        "https://other.example.com/b",
+        "https://example.com/sitemap-only",
+        "https://example.com/moved-up",
+        "https://example.com/deep",
+    ]
+    assert len(scheduler) == 0
+
+
+def test_lower_depth_passes_the_shorter_path_on_to_the_links_of_a_page():
+    history = HistoryStore()
+    history.add("https://example.com/a", depth=3)
+    history.add("https://example.com/a#sec", depth=3)
+    history.add("https://example.com/b", depth=4)
+    history.add("https://example.com/c", depth=2)
+    history.add_edges(["https://example.com/a#sec", "https://example.com/b", "https://example.com/c"], "https://example.com/a")
+
+    scheduler = HostScheduler(crawl_delay=0)
+    scheduler.append("https://example.com/b", depth=4)
+    scheduler.append("https://example.com/c", depth=2)
+
+    changed = lower_depth(history, scheduler, VisitTargets(), "https://example.com/a", 1)
+
+    assert sorted(changed) == ["https://example.com/a", "https://example.com/a#sec", "https://example.com/b"]
+    assert history["https://example.com/a#sec"]["depth"] == 1
+    assert history["https://example.com/b"]["depth"] == 2
+    assert history["https://example.com/c"]["depth"] == 2
+    assert lower_depth(history, scheduler, VisitTargets(), "https://example.com/a", None) == []
+    assert pop_all(scheduler) == ["https://example.com/b", "https://example.com/c"]
+
+
+def test_page_budget_records_the_urls_left_as_skipped(site):
+    site.add_linked_pages(20)
+
+    history = bot(site.url("/index.html"), crawl_delay=0, budget=CrawlBudget(max_pages=5))
+
+    skipped = [url for url, record in history.items() if record["response_code"] == -1]
+    assert len(skipped) > 0
+    for url in skipped:
+        assert history[url]["error_text"] == "Skipped, the crawl's budget of 5 pages ran out"
+    visited = {url.split("#")[0] for url, record in history.items() if record["response_code"] != -1}
+    assert len(visited) == 5
+    # the pages closest to the start were visited
+    assert max(history[url]["depth"] for url in visited) <= 1
+
+
+def test_time_budget_records_the_urls_left_as_skipped(site):
+    def slow(page):
+        def slow_page(method):
+            time.sleep(0.1)
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, page
+        return slow_page
+
+    site.add_linked_pages(10)
+    for i in range(10):
+        site.pages[f"/page{i}.html"] = slow(site.pages[f"/page{i}.html"])
+
+    history = bot(site.url("/index.html"), crawl_delay=0, budget=CrawlBudget(max_seconds=0.5))
+
+    skipped = [record for _, record in history.items() if record["response_code"] == -1]
+    assert len(skipped) > 0
+    assert {record["error_text"] for record in skipped} == {"Skipped, the crawl's budget of 0.5 seconds ran out"}
+    assert all(record["response_code"] is not None for _, record in history.items())
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from checkrs_linkto.bot import bot
+from checkrs_linkto.history import HistoryStore, merge_histories, write_history
+from checkrs_linkto.report import LinkToReport
+from checkrs_linkto.shards import ShardPartition, ShardSpool
+
+from conftest import canonical
+
+
+def crawl_shards(start_url, spool_fn, partition, **bot_options):
+    """
+    Run a bot for every shard of the partition at the same time
+    :return: list with the history of every shard
+    """
+
+    histories = [None] * partition.shards
+
+    def crawl(shard):
+        spool = ShardSpool(spool_fn, shard, partition, poll_interval=0.05)
+        histories[shard] = bot(start_url, crawl_delay=0, shard=spool, **bot_options)
+        spool.close()
+
+    threads = [threading.Thread(target=crawl, args=(shard,), daemon=True) for shard in range(partition.shards)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        # a shard waiting for urls nobody picks up would never finish
+        thread.join(30)
+        assert not thread.is_alive()
+
+    return histories
+
+
+def test_partition_gives_urls_of_the_same_resource_to_one_shard():
+    partition = ShardPartition(4, strip_query_params=["utm_*"])
+
+    owner = partition.owner("https://example.com/a.html")
+    for url in ["https://EXAMPLE.com:443/a.html", "https://example.com/a.html#top", "https://example.com/a.html?utm_source=x"]:
+        assert partition.owner(url) == owner
+    assert ShardPartition(4).owner("https://example.com/a.html") == owner
+
+    partition = ShardPartition(2, "prefix", [["/docs/"], ["/docs/api/", "/blog/"]])
+    assert partition.owner("https://example.com/docs/guide.html") == 0
+    assert partition.owner("https://example.com/docs/api/index.html") == 1
+    assert partition.owner("https://example.com/blog/") == 1
+
+    with pytest.raises(ValueError):
+        ShardPartition(2, "prefix", [["/docs/"]])
+
+
+def test_shards_wait_for_their_sitemaps(site, tmp_path):
+    site.pages["/index.html"] = "<html><body></body></html>"
+    site.pages["/x.html"] = '<html><body><a href="/y.html">y</a></body></html>'
+    site.pages["/y.html"] = "<html><body></body></html>"
+
+    # the only way to /y.html is through a page that is listed in a sitemap that takes a while to read
+    def slow_sitemap(method):
+        time.sleep(0.5)
+        return 200, {"Content-Type": "application/xml"}, (
+            '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'<url><loc>{site.url("/x.html")}</loc></url></urlset>'
+        )
+
+    site.pages["/sitemap.xml"] = slow_sitemap
+
+    partition = ShardPartition(2, "prefix", [["/"], ["/y"]])
+    histories = crawl_shards(
+        site.url("/index.html"), str(tmp_path / "spool.sqlite"), partition, sitemap_urls=[site.url("/sitemap.xml")]
+    )
+
+    assert histories[0][site.url("/x.html")]["response_code"] == 200
+    assert histories[1][site.url("/y.html")]["response_code"] == 200
+    # the shard that found the link records it, the shard that owns the url visits it
+    assert histories[0][site.url("/y.html")]["visited_from"] == [site.url("/x.html")]
+    assert histories[0][site.url("/y.html")]["response_code"] is None
+
+
+def test_merged_shard_histories_match_a_single_crawl(site, tmp_path):
+    site.add_linked_pages(20)
+    start_url = site.url("/index.html")
+
+    single = bot(start_url, crawl_delay=0)
+
+    partition = ShardPartition(2)
+    histories = crawl_shards(start_url, str(tmp_path / "spool.sqlite"), partition)
+
+    # every shard visited some of the pages
+    for shard, history in enumerate(histories):
+        assert any(partition.owner(url) == shard and history[url]["response_code"] == 200 for url in history)
+
+    filenames = list()
+    for shard, history in enumerate(histories):
+        filenames.append(str(tmp_path / f"history{shard}.ndjson"))
+        write_history(filenames[-1], start_url, history, "ndjson")
+
+    merged_start_url, merged = merge_histories(filenames)
+
+    # the click depth and the duplicates of a page are only known within each shard,
+    # the results and the links have to be the same
+    def results(history):
+        return {
+            url: (record["response_code"], record["error_text"], record["visited_from"])
+            for url, record in canonical(history).items()
+        }
+
+    assert merged_start_url == start_url
+    assert results(merged) == results(single)
+
+
+def test_merge_records_urls_no_shard_visited(tmp_path):
+    start_url = "https://example.com/"
+    filenames = list()
+    for shard in range(2):
+        history = HistoryStore()
+        history.add(start_url, response_code=200 if shard == 0 else None, visited_from=[None])
+        history.add("https://example.com/lost", visited_from=[start_url], depth=1)
+        filenames.append(str(tmp_path / f"history{shard}.json"))
+        write_history(filenames[-1], start_url, history)
+
+    _, merged = merge_histories(filenames)
+
+    assert merged[start_url]["response_code"] == 200
+    assert merged["https://example.com/lost"]["response_code"] == -1
+    assert merged["https://example.com/lost"]["error_text"] == "Skipped, not visited by any shard"
+
+    # the report doesn't trip over them
+    merged_fn = str(tmp_path / "merged.json")
+    write_history(merged_fn, start_url, merged)
+    lcr = LinkToReport(merged_fn, merged_fn).report_connection_errors().report_status_errors()
+    assert lcr.counts == dict(connection_errors=0, status_errors=0)
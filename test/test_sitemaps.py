@@ -0,0 +1,186 @@
+import time
+
+from checkrs_linkto.bot import bot
+from checkrs_linkto.cache import ValidatorCache
+from checkrs_linkto.history import PreviousHistory, read_history, write_history
+from checkrs_linkto.report import LinkToReport
+
+
+def sitemap(site, paths):
+    urls = "".join(f"<url><loc>{site.url(path)}</loc></url>" for path in paths)
+    body = f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+    return 200, {"Content-Type": "application/xml"}, body
+
+
+def test_sitemap_is_not_recorded_as_a_link(site, tmp_path):
+    site.pages["/index.html"] = '<html><body><a href="/linked.html">linked</a></body></html>'
+    site.pages["/linked.html"] = "<html><body></body></html>"
+    site.pages["/sitemap.xml"] = sitemap(site, ["/linked.html", "/listed.html"])
+
+    history = bot(site.url("/index.html"), crawl_delay=0, sitemap_urls=[site.url("/sitemap.xml")])
+
+    assert history[site.url("/linked.html")]["visited_from"] == [site.url("/index.html")]
+    assert history[site.url("/linked.html")]["sitemap"] == site.url("/sitemap.xml")
+    assert history[site.url("/listed.html")]["visited_from"] == []
+    assert history[site.url("/listed.html")]["sitemap"] == site.url("/sitemap.xml")
+    assert history[site.url("/listed.html")]["response_code"] == 404
+
+    # the report names the sitemap for urls no page links to
+    new_fn = str(tmp_path / "new.json")
+    write_history(new_fn, site.url("/index.html"), history)
+    report = LinkToReport(new_fn, new_fn).report_status_errors()
+    assert f"linked to from: {site.url('/sitemap.xml')}" in report.report
+
+
+def test_sitemap_only_urls_are_not_followed_past_the_depth_limit(site):
+    site.pages["/index.html"] = '<html><body><a href="/a.html">a</a><a href="/e.html">e</a></body></html>'
+    site.pages["/a.html"] = '<html><body><a href="/sub/b.html">b</a></body></html>'
+    site.pages["/sub/b.html"] = '<html><body><a href="/sub/x.html">x</a></body></html>'
+    site.pages["/sub/c.html"] = '<html><body><a href="/sub/d.html">d</a></body></html>'
+    site.pages["/e.html"] = '<html><body><a href="/f.html">f</a></body></html>'
+    site.pages["/f.html"] = "<html><body></body></html>"
+    site.pages["/sitemap.xml"] = sitemap(site, ["/sub/b.html", "/sub/c.html", "/e.html"])
+
+    history = bot(site.url("/index.html"), depth=2, crawl_delay=0, sitemap_urls=[site.url("/sitemap.xml")])
+
+    assert history[site.url("/sub/b.html")]["depth"] == 2
+    assert history[site.url("/sub/c.html")]["depth"] is None
+    assert history[site.url("/sub/c.html")]["response_code"] == 200
+    # the links on pages only a sitemap lists are past the depth limit
+    assert site.url("/sub/d.html") not in history
+    assert site.url("/sub/x.html") not in history
+    # a link to a url from the sitemap gives it a click depth
+    assert history[site.url("/e.html")]["depth"] == 1
+    assert history[site.url("/f.html")]["depth"] == 2
+    assert history[site.url("/f.html")]["response_code"] == 200
+
+
+def crawl_with_unchanged_page(site, cache=None, previous_ids=True):
+    """
+    Crawl a site, then crawl it again after a link to a section of a page changed,
+    the sitemap says the page itself didn't change.
+    previous_ids False drops the ids of the pages from the first crawl's history, like histories of older versions.
+    :return: history of the second crawl
+    """
+
+    site.pages["/index.html"] = '<html><body><a href="/p.html">p</a><a href="/p.html#old">old</a></body></html>'
+    site.pages["/p.html"] = '<html><body><h2 id="old">old</h2><h2 id="new">new</h2></body></html>'
+    site.pages["/sitemap.xml"] = (200, {"Content-Type": "application/xml"}, (
+        '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f'<url><loc>{site.url("/p.html")}</loc><lastmod>2000-01-01</lastmod></url></urlset>'
+    ))
+
+    crawl_started = time.time()
+    history = bot(site.url("/index.html"), crawl_delay=0, cache=cache)
+    if cache is not None:
+        # the second crawl is the cache's next run
+        cache.save().load()
+    records = dict(history.items())
+    if previous_ids is False:
+        for record in records.values():
+            record.pop("ids", None)
+    previous = PreviousHistory(records, crawl_started)
+
+    # the start page answers slowly so the page is read from the sitemap before a link to it is found
+    index = '<html><body><a href="/p.html#new">new</a></body></html>'
+
+    def slow_index(method):
+        time.sleep(0.5)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, index
+
+    site.pages["/index.html"] = slow_index
+    site.requests.clear()
+
+    return bot(
+        site.url("/index.html"), crawl_delay=0, cache=cache, previous=previous, sitemap_urls=[site.url("/sitemap.xml")]
+    )
+
+
+def test_unchanged_page_without_ids_is_visited(site):
+    history = crawl_with_unchanged_page(site, previous_ids=False)
+
+    assert site.requests["/p.html"] > 0
+    assert history[site.url("/p.html#new")]["error_text"] is None
+
+
+def test_unchanged_page_with_previous_ids_is_skipped(site):
+    history = crawl_with_unchanged_page(site)
+
+    assert site.requests["/p.html"] == 0
+    assert history[site.url("/p.html")]["response_code"] == 200
+    assert history[site.url("/p.html#new")]["error_text"] is None
+
+
+def test_unchanged_page_with_cached_ids_is_skipped(site, tmp_path):
+    cache = ValidatorCache(str(tmp_path / "cache.json"))
+    history = crawl_with_unchanged_page(site, cache, previous_ids=False)
+
+    assert site.requests["/p.html"] == 0
+    assert history[site.url("/p.html")]["response_code"] == 200
+    assert history[site.url("/p.html#new")]["error_text"] is None
+
+    # the skipped page's cache entry was used in this run, so it isn't the first to be evicted
+    assert cache.get(site.url("/p.html"))["last_used"] == 2
+
+
+def test_sitemap_only_urls_have_no_click_depth(site, tmp_path):
+    site.pages["/index.html"] = '<html><body><a href="/a.html">a</a></body></html>'
+    site.pages["/a.html"] = '<html><body><a href="/b.html">b</a></body></html>'
+    site.pages["/b.html"] = "<html><body></body></html>"
+    site.pages["/s.html"] = '<html><body><a href="/t.html">t</a></body></html>'
+    site.pages["/t.html"] = "<html><body></body></html>"
+    site.pages["/sitemap.xml"] = sitemap(site, ["/s.html"])
+
+    # the sitemap is read while the page that links to /b.html is being visited
+    a = site.pages["/a.html"]
+
+    def slow_a(method):
+        time.sleep(0.3)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, a
+
+    site.pages["/a.html"] = slow_a
+
+    history = bot(site.url("/index.html"), crawl_delay=0, sitemap_urls=[site.url("/sitemap.xml")])
+
+    assert history[site.url("/s.html")]["depth"] is None
+    assert history[site.url("/t.html")]["depth"] is None
+    assert history[site.url("/t.html")]["response_code"] == 200
+    assert history[site.url("/b.html")]["depth"] == 2
+
+    # urls only a sitemap lists wait with the pages linked from the start page, not behind every linked page
+    assert site.request_times["/s.html"][0] < site.request_times["/b.html"][0]
+
+    history_fn = str(tmp_path / "history.json")
+    write_history(history_fn, site.url("/index.html"), history)
+    assert read_history(history_fn)[1][site.url("/s.html")]["depth"] is None
+
+
+def test_lastmod_of_a_linked_url_waiting_to_be_visited_is_used(site):
+    site.pages["/index.html"] = '<html><body><a href="/slow.html">slow</a><a href="/p.html">p</a></body></html>'
+    site.pages["/slow.html"] = "<html><body></body></html>"
+    site.pages["/p.html"] = '<html><body><h2 id="old">old</h2></body></html>'
+
+    crawl_started = time.time()
+    previous = PreviousHistory(dict(bot(site.url("/index.html"), crawl_delay=0).items()), crawl_started)
+
+    # the link to the page is found before the sitemap is read, and the page waits behind a slow one
+    def slow_page(method):
+        time.sleep(0.5)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, "<html><body></body></html>"
+
+    def slow_sitemap(method):
+        time.sleep(0.1)
+        return 200, {"Content-Type": "application/xml"}, (
+            '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'<url><loc>{site.url("/p.html")}</loc><lastmod>2000-01-01</lastmod></url></urlset>'
+        )
+
+    site.pages["/slow.html"] = slow_page
+    site.pages["/sitemap.xml"] = slow_sitemap
+    site.requests.clear()
+
+    history = bot(site.url("/index.html"), crawl_delay=0, previous=previous, sitemap_urls=[site.url("/sitemap.xml")])
+
+    assert site.requests["/p.html"] == 0
+    assert history[site.url("/p.html")]["response_code"] == 200
+    assert history[site.url("/p.html")]["visited_from"] == [site.url("/index.html")]
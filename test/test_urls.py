@@ -0,0 +1,42 @@
+from checkrs_linkto.bot import bot
+from checkrs_linkto.urls import canonicalize
+
+
+def test_default_ports_and_host_case():
+    assert canonicalize("HTTPS://Example.COM:443/Docs/Page.html#top") == "https://example.com/Docs/Page.html"
+    assert canonicalize("http://example.com:80") == "http://example.com/"
+    assert canonicalize("http://example.com:8080/a") == "http://example.com:8080/a"
+    assert canonicalize("https://example.com:80/a") == "https://example.com:80/a"
+    assert canonicalize("http://User@Example.com:80/a") == "http://User@example.com/a"
+    assert canonicalize("http://[::1]:80/a") == "http://[::1]/a"
+
+
+def test_invalid_port_only_loses_the_fragment():
+    assert canonicalize("http://example.com:port/a#top") == "http://example.com:port/a"
+
+
+def test_strip_query_params_wildcards():
+    url = "https://example.com/a?utm_source=x&id=1&utm_medium=y&ref&page=2#top"
+
+    assert canonicalize(url) == "https://example.com/a?utm_source=x&id=1&utm_medium=y&ref&page=2"
+    assert canonicalize(url, ["utm_*", "ref"]) == "https://example.com/a?id=1&page=2"
+    assert canonicalize(url, ["*"]) == "https://example.com/a"
+    assert canonicalize("https://example.com/a?UTM_SOURCE=x", ["utm_*"]) == "https://example.com/a?UTM_SOURCE=x"
+
+
+def test_variants_of_a_page_are_visited_once(site):
+    site.pages["/index.html"] = (
+        '<html><body><a href="/p.html#sec1">1</a><a href="/p.html#missing">2</a>'
+        '<a href="/p.html?utm_source=news">3</a><a href="/p.html">4</a></body></html>'
+    )
+    site.pages["/p.html"] = '<html><body><h2 id="sec1">section</h2></body></html>'
+    site.pages["/p.html?utm_source=news"] = site.pages["/p.html"]
+
+    history = bot(site.url("/index.html"), crawl_delay=0, strip_query_params=["utm_*"])
+
+    assert site.methods["GET", "/p.html"] == 1
+    assert site.requests["/p.html?utm_source=news"] == 0
+    for url in [site.url("/p.html"), site.url("/p.html#sec1"), site.url("/p.html?utm_source=news")]:
+        assert history[url]["response_code"] == 200
+        assert history[url]["error_text"] is None
+    assert history[site.url("/p.html#missing")]["error_text"] == "Element with id 'missing' not found in HTML DOM"